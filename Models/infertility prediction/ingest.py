@@ -0,0 +1,324 @@
+"""
+Scriptable NHANES ingestion: SAS transport files -> typed Parquet -> merged,
+model-ready tables. Replaces re-running datamerge.ipynb by hand.
+
+    python ingest.py                          # dataset/*_I.xpt (2015-2016)
+    python ingest.py --cycle J --xpt-dir dataset_2017   # another NHANES cycle
+    python ingest.py --publish                # also refresh dashboard/final_cleaned.parquet
+    python ingest.py --force                  # ignore the content hashes
+
+Stages:
+
+1. convert: every XPT file is read in chunks (pyreadstat) and written as
+   row groups of datasets-parquet/<TABLE>.parquet plus the cleaned copy
+   (rows with nothing but SEQN dropped), one process per table, with the
+   dtypes from nhanes_io.py. A table whose XPT content hash is unchanged
+   since the last run is skipped.
+2. merge: the cleaned tables are indexed by SEQN and joined on the index,
+   producing under datasets-parquet/merged/<version>/:
+     final_cleaned.parquet        dashboard/final_cleaned.csv layout
+     infertility.parquet          metals + reproductive health + demographics
+     infertility_cleaned.parquet  training frame of infertility.ipynb
+     hormone_levels.parquet       metals + hormones + demographics
+   <version> is derived from the input hashes and PIPELINE_VERSION, so an
+   unchanged input set maps to an existing directory and is not rebuilt.
+
+State is kept in datasets-parquet/ingest_manifest.json.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from nhanes_io import HERE, PARQUET_DIR, dtypes_for, load_table, parquet_path
+
+# Bump when the conversion or merge logic changes, so existing outputs are rebuilt
+PIPELINE_VERSION = 1
+
+SERIES = ("TST", "PBCD", "RHQ", "DEMO")
+XPT_DIR = HERE / "dataset"
+MERGED_DIR = PARQUET_DIR / "merged"
+MANIFEST_PATH = PARQUET_DIR / "ingest_manifest.json"
+DASHBOARD_PARQUET = HERE.parent.parent / "dashboard" / "final_cleaned.parquet"
+
+CHUNK_ROWS = 2000
+
+# Logistics/meta columns dropped from the demographics before merging (datamerge.ipynb)
+DEMO_DROP_COLS = [
+    "SDDSRVYR", "RIDSTATR", "RIDEXMON", "RIDEXAGM",
+    "SIALANG", "SIAPROXY", "SIAINTRP", "FIALANG", "FIAPROXY", "FIAINTRP",
+    "MIALANG", "MIAPROXY", "MIAINTRP", "AIALANGA",
+    "DMDHRGND", "DMDHRAGE", "DMDHRBR4", "DMDHREDU", "DMDHRMAR", "DMDHSEDU",
+    "WTINT2YR", "WTMEC2YR",
+    "SDMVPSU", "SDMVSTRA",
+]
+
+# NHANES variable -> dashboard column, in dashboard/final_cleaned.csv order
+DASHBOARD_COLUMNS = {
+    "WTSH2YR": "Blood metal weights",
+    "LBXBPB": "lead_µg/dL", "LBDBPBSI": "lead_µmol/L",
+    "LBXBCD": "cadmium_µg/L", "LBDBCDSI": "cadmium_nmol/L",
+    "LBXTHG": "mercury_µg/L", "LBDTHGSI": "mercury_nmol/L",
+    "LBXBSE": "selenium_µg/L", "LBDBSESI": "selenium_µmol/L",
+    "LBXBMN": "manganese_µg/L", "LBDBMNSI": "manganese_nmol/L",
+    "LBXTST": "testosterone", "LBDTSTLC": "testosterone_comment",
+    "LBXEST": "estradiol", "LBDESTLC": "estradiol_comment",
+    "LBXSHBG": "shbg", "LBDSHGLC": "shbg_comment",
+    "RHQ010": "first_period_age", "RHQ031": "regular_periods", "RHD043": "no_period_reason",
+    "RHQ060": "last_period_age", "RHQ074": "infertility_1yr", "RHQ076": "infertility_treated",
+    "RHQ078": "pelvic_infection", "RHQ131": "ever_pregnant", "RHD143": "pregnant_now",
+    "RHQ160": "pregnant_times", "RHQ162": "pregnant_diabaetes", "RHQ163": "pregnant_diabaetes_age",
+    "RHQ166": "vaginal_deliveries", "RHQ169": "cesarean_deliveries", "RHQ172": "baby_weight_high",
+    "RHD173": "baby_weight_high_age", "RHQ171": "live_births", "RHD180": "first_live_birth_age",
+    "RHD190": "last_live_birth_age", "RHD280": "hysterectomy", "RHQ291": "hysterectomy_age",
+    "RHQ305": "ovaries_removed", "RHQ332": "ovaries_removed_age", "RHQ420": "birth_control",
+    "RHQ540": "female_hormones",
+    "RIAGENDR": "gender", "RIDAGEYR": "age_years", "RIDRETH3": "race", "DMDMARTL": "marital_status",
+    "RIDEXPRG": "pregnancy_status", "DMDHHSIZ": "household_size", "DMDFMSIZ": "family_size",
+    "INDFMPIR": "income_poverty_ratio",
+}
+DASHBOARD_FLOAT64_COLS = ["Blood metal weights"]
+
+# Blood metals: (value column, comment code column, LLOD); values below the
+# detection limit are imputed as LLOD / sqrt(2) as in infertility.ipynb
+METAL_LLOD = [
+    ("LBXBPB", "LBDBPBLC", 0.05), ("LBXBCD", "LBDBCDLC", 0.07), ("LBXTHG", "LBDTHGLC", 0.2),
+    ("LBXBSE", "LBDBSELC", 59.35), ("LBXBMN", "LBDBMNLC", 2.21),
+    ("LBDBPBSI", "LBDBPBLC", 0.002), ("LBDBCDSI", "LBDBCDLC", 0.62), ("LBDTHGSI", "LBDTHGLC", 1.0),
+    ("LBDBSESI", "LBDBSELC", 0.75), ("LBDBMNSI", "LBDBMNLC", 40.23),
+]
+
+# Columns of infertility_cleaned.csv (the infertility model's training frame)
+INFERTILITY_TRAINING_COLS = [
+    "WTSH2YR", "LBXBPB", "LBDBPBSI", "LBXBCD", "LBDBCDSI", "LBXTHG", "LBDTHGSI",
+    "LBXBSE", "LBDBSESI", "LBXBMN", "LBDBMNSI",
+    "RHQ031", "RHQ060", "RHQ074", "RHQ078", "RHD280", "RHQ420", "RHQ540",
+    "RIDAGEYR", "RIDRETH3", "DMDBORN4", "DMDMARTL",
+]
+
+
+# ---------------- Manifest and hashing ----------------
+def file_sha256(path, block=1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(block):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_manifest() -> dict:
+    if MANIFEST_PATH.exists():
+        return json.loads(MANIFEST_PATH.read_text())
+    return {"tables": {}, "outputs": {}}
+
+
+def save_manifest(manifest: dict):
+    PARQUET_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, MANIFEST_PATH)
+
+
+# ---------------- Stage 1: XPT -> Parquet ----------------
+def _typed_chunk(chunk: pd.DataFrame, table: str) -> pd.DataFrame:
+    dtypes = dtypes_for(table, chunk.columns)
+    for col, dtype in dtypes.items():
+        if dtype == "category":
+            # float categories in every chunk, so all row groups share one schema
+            chunk[col] = chunk[col].astype("float64").astype("category")
+        elif col != "SEQN":
+            chunk[col] = chunk[col].astype(dtype)
+    chunk["SEQN"] = chunk["SEQN"].astype("int32")
+    return chunk
+
+
+def convert_xpt(table: str, src: str, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Stream one XPT file into the raw and cleaned Parquet files (runs in a worker process)."""
+    import pyreadstat
+
+    raw_dst, cleaned_dst = parquet_path(table), parquet_path(table, cleaned=True)
+    raw_tmp, cleaned_tmp = raw_dst.with_suffix(".tmp"), cleaned_dst.with_suffix(".tmp")
+    writers = {}
+    rows = rows_cleaned = 0
+
+    try:
+        for chunk, _ in pyreadstat.read_file_in_chunks(pyreadstat.read_xport, src, chunksize=chunk_rows):
+            chunk = _typed_chunk(chunk, table)
+            # same rule as datamerge.ipynb: drop rows with no data besides SEQN
+            cleaned = chunk[chunk.drop(columns=["SEQN"]).notna().any(axis=1)]
+            for key, df, dst in (("raw", chunk, raw_tmp), ("cleaned", cleaned, cleaned_tmp)):
+                batch = pa.Table.from_pandas(df, preserve_index=False)
+                if key not in writers:
+                    writers[key] = pq.ParquetWriter(dst, batch.schema, compression="zstd")
+                writers[key].write_table(batch.cast(writers[key].schema))
+            rows += len(chunk)
+            rows_cleaned += len(cleaned)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    os.replace(raw_tmp, raw_dst)
+    os.replace(cleaned_tmp, cleaned_dst)
+    return {"rows": rows, "rows_cleaned": rows_cleaned}
+
+
+def convert_all(tables, xpt_dir: Path, manifest: dict, force=False, workers=None) -> dict:
+    """Convert the tables whose XPT content changed; returns {table: sha256} for all of them."""
+    PARQUET_DIR.mkdir(parents=True, exist_ok=True)
+    hashes, todo = {}, []
+    for table in tables:
+        src = xpt_dir / f"{table}.xpt"
+        if not src.exists():
+            raise FileNotFoundError(f"{src} not found")
+        hashes[table] = file_sha256(src)
+        known = manifest["tables"].get(table, {})
+        up_to_date = (
+            known.get("sha256") == hashes[table]
+            and known.get("pipeline") == PIPELINE_VERSION
+            and parquet_path(table).exists() and parquet_path(table, cleaned=True).exists()
+        )
+        if force or not up_to_date:
+            todo.append((table, src))
+        else:
+            print(f"{table}: unchanged, skipped")
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers or min(len(todo), os.cpu_count() or 1)) as pool:
+            futures = {table: pool.submit(convert_xpt, table, str(src)) for table, src in todo}
+            for table, future in futures.items():
+                stats = future.result()
+                manifest["tables"][table] = {"sha256": hashes[table], "pipeline": PIPELINE_VERSION, **stats}
+                print(f"{table}: {stats['rows']:,} rows ({stats['rows_cleaned']:,} after cleaning)")
+    return hashes
+
+
+# ---------------- Stage 2: merged tables ----------------
+def indexed(table: str, drop=()) -> pd.DataFrame:
+    """Cleaned table indexed by SEQN (sorted, unique), coded answers as numbers."""
+    df = load_table(table, cleaned=True)
+    df = df.drop(columns=[c for c in drop if c in df.columns])
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("float64")
+    df = df.set_index("SEQN").sort_index()
+    if not df.index.is_unique:
+        raise ValueError(f"{table}: duplicate SEQN values")
+    return df
+
+
+def join_all(base: pd.DataFrame, *others, how="left") -> pd.DataFrame:
+    for other in others:
+        base = base.join(other, how=how)
+    return base
+
+
+def dashboard_frame(metals, hormones, repro, demo) -> pd.DataFrame:
+    """Every blood metal respondent with hormones, reproductive health and demographics."""
+    df = join_all(metals, hormones, repro, demo)[list(DASHBOARD_COLUMNS)]
+    df = df.rename(columns=DASHBOARD_COLUMNS).reset_index(drop=True)
+    return df.astype({c: ("float64" if c in DASHBOARD_FLOAT64_COLS else "float32") for c in df.columns})
+
+
+def infertility_training_frame(infertility: pd.DataFrame) -> pd.DataFrame:
+    """The cleaning steps of infertility.ipynb that shape infertility_cleaned.csv."""
+    df = infertility.astype("float64")
+    sqrt2 = np.sqrt(2)
+    for value, comment, llod in METAL_LLOD:
+        below = ((df[comment] == 1) | df[comment].isna()) & df[value].isna()
+        df.loc[below, value] = llod / sqrt2
+
+    # anyone who has been pregnant answered "no" to a year of trying without conceiving
+    pregnant = (df["RHQ131"] == 1) | (df["RHD143"] == 1)
+    df.loc[pregnant & df["RHQ074"].isna(), "RHQ074"] = 2
+    df = df.dropna(subset=["RHQ074"])
+
+    # still menstruating / no infection reported
+    df[["RHQ060", "RHQ078"]] = df[["RHQ060", "RHQ078"]].fillna(0)
+    for col in ["RHD280", "RHQ420", "RHQ540"]:
+        df[col] = df[col].fillna(df[col].median())
+    df["DMDMARTL"] = df["DMDMARTL"].fillna(df["DMDMARTL"].mode()[0])
+    return df[INFERTILITY_TRAINING_COLS].reset_index(drop=True)
+
+
+def build_outputs(tables: dict) -> dict:
+    metals = indexed(tables["PBCD"])
+    hormones = indexed(tables["TST"])
+    repro = indexed(tables["RHQ"])
+    demo = indexed(tables["DEMO"], drop=DEMO_DROP_COLS)
+
+    infertility = join_all(metals.join(repro, how="inner"), demo)
+    hormone_levels = join_all(metals.join(hormones, how="inner"), demo)
+    return {
+        "final_cleaned": dashboard_frame(metals, hormones, repro, demo),
+        "infertility": infertility.reset_index(),
+        "infertility_cleaned": infertility_training_frame(infertility),
+        "hormone_levels": hormone_levels.reset_index(),
+    }
+
+
+def output_version(hashes: dict) -> str:
+    key = json.dumps({"pipeline": PIPELINE_VERSION, "inputs": hashes}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+
+def merge(tables: dict, hashes: dict, manifest: dict, force=False) -> Path:
+    version = output_version(hashes)
+    out_dir = MERGED_DIR / version
+    if not force and (out_dir / "manifest.json").exists():
+        print(f"merged/{version}: inputs unchanged, skipped")
+    else:
+        tmp_dir = MERGED_DIR / f".{version}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        info = {}
+        for name, df in build_outputs(tables).items():
+            df.to_parquet(tmp_dir / f"{name}.parquet", engine="pyarrow", compression="zstd", index=False)
+            info[name] = {"rows": len(df), "columns": df.shape[1]}
+            print(f"merged/{version}/{name}.parquet: {len(df):,} rows x {df.shape[1]}")
+        (tmp_dir / "manifest.json").write_text(json.dumps(
+            {"version": version, "pipeline": PIPELINE_VERSION, "inputs": hashes, "outputs": info}, indent=2))
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp_dir, out_dir)
+        manifest["outputs"][version] = {"inputs": hashes, "outputs": info}
+
+    manifest["latest"] = version
+    return out_dir
+
+
+def publish_dashboard(out_dir: Path, dst: Path = DASHBOARD_PARQUET):
+    """Make the dashboard read this version (its loader prefers a Parquet copy newer than the CSV)."""
+    tmp = dst.with_suffix(".tmp")
+    shutil.copyfile(out_dir / "final_cleaned.parquet", tmp)
+    os.replace(tmp, dst)
+    print(f"Published {out_dir.name} to {dst}")
+
+
+def run(cycle="I", xpt_dir=XPT_DIR, force=False, workers=None, publish=False) -> Path:
+    tables = {s: f"{s}_{cycle}" for s in SERIES}
+    manifest = load_manifest()
+    hashes = convert_all(tables.values(), Path(xpt_dir), manifest, force=force, workers=workers)
+    out_dir = merge(tables, hashes, manifest, force=force)
+    save_manifest(manifest)
+    if publish:
+        publish_dashboard(out_dir)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NHANES XPT -> typed Parquet -> merged tables")
+    parser.add_argument("--cycle", default="I", help="NHANES cycle suffix of the file names (I = 2015-2016)")
+    parser.add_argument("--xpt-dir", default=XPT_DIR, type=Path, help="directory with the .xpt files")
+    parser.add_argument("--workers", type=int, help="conversion processes (default: one per table)")
+    parser.add_argument("--force", action="store_true", help="rebuild even when the inputs are unchanged")
+    parser.add_argument("--publish", action="store_true", help="write dashboard/final_cleaned.parquet")
+    args = parser.parse_args()
+
+    run(args.cycle, args.xpt_dir, force=args.force, workers=args.workers, publish=args.publish)
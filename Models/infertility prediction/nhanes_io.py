@@ -0,0 +1,140 @@
+"""
+Typed columnar storage for the NHANES 2015-2016 tables used here.
+
+The four tables (TST_I, PBCD_I, RHQ_I, DEMO_I) are written as Parquet with
+explicit dtypes instead of being re-parsed from CSV with type inference:
+
+- SEQN            -> int32
+- lab results     -> float32 (survey weights stay float64)
+- coded answers   -> category (yes/no/refused codes, race, marital status, ...)
+- counts and ages -> float32
+
+Usage:
+
+    python nhanes_io.py                     # datasets-csv/*.csv -> datasets-parquet/*.parquet
+    python nhanes_io.py --cleaned           # datasets-csv/cleaned/cleaned_*.csv as well
+
+    from nhanes_io import load_table
+    metals = load_table("PBCD_I", columns=["SEQN", "LBXBPB", "LBXBCD"])
+
+load_table falls back to the CSV (with the same dtypes) when no Parquet copy
+exists yet, so notebooks work before the conversion has been run.
+"""
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+HERE = Path(__file__).parent
+CSV_DIR = HERE / "datasets-csv"
+PARQUET_DIR = HERE / "datasets-parquet"
+
+TABLES = ("TST_I", "PBCD_I", "RHQ_I", "DEMO_I")
+
+# Survey weights: large values where float32 loses precision
+FLOAT64_COLS = {"WTSH2YR", "WTINT2YR", "WTMEC2YR"}
+
+# Continuous values per table series (the same for every cycle, e.g. TST_I / TST_J);
+# every other column except SEQN is a coded answer
+CONTINUOUS_COLS = {
+    "TST": {"LBXTST", "LBXEST", "LBXSHBG"},
+    "PBCD": {
+        "WTSH2YR",
+        "LBXBPB", "LBDBPBSI", "LBXBCD", "LBDBCDSI", "LBXTHG", "LBDTHGSI",
+        "LBXBSE", "LBDBSESI", "LBXBMN", "LBDBMNSI",
+    },
+    "RHQ": {
+        "RHQ010",   # age at first period
+        "RHQ060",   # age at last period
+        "RHQ160",   # times pregnant
+        "RHQ163",   # age at gestational diabetes
+        "RHQ166",   # vaginal deliveries
+        "RHQ169",   # cesarean deliveries
+        "RHD173",   # age at high birth-weight delivery
+        "RHQ171",   # live births
+        "RHD180",   # age at first live birth
+        "RHD190",   # age at last live birth
+        "RHQ197",   # months since last birth
+        "RHQ291",   # age at hysterectomy
+        "RHQ332",   # age ovaries removed
+        "RHQ560Q", "RHQ576Q", "RHQ586Q", "RHQ602Q",  # hormone use durations
+    },
+    "DEMO": {
+        "RIDAGEYR", "RIDAGEMN", "RIDEXAGM", "DMDHRAGE",
+        "DMDHHSIZ", "DMDFMSIZ", "DMDHHSZA", "DMDHHSZB", "DMDHHSZE",
+        "INDFMPIR", "WTINT2YR", "WTMEC2YR",
+    },
+}
+
+
+def series(table: str) -> str:
+    """Table name without its cycle suffix: "PBCD_I" -> "PBCD"."""
+    return table.rsplit("_", 1)[0]
+
+
+def dtypes_for(table: str, columns) -> dict:
+    """Explicit dtype per column; SEQN is read as float (CSV has "83732.0") and cast after."""
+    continuous = CONTINUOUS_COLS[series(table)]
+    dtypes = {}
+    for col in columns:
+        if col == "SEQN":
+            dtypes[col] = "float64"
+        elif col in FLOAT64_COLS:
+            dtypes[col] = "float64"
+        elif col in continuous:
+            dtypes[col] = "float32"
+        else:
+            dtypes[col] = "category"
+    return dtypes
+
+
+def csv_path(table: str, cleaned: bool = False) -> Path:
+    return CSV_DIR / "cleaned" / f"cleaned_{table}.csv" if cleaned else CSV_DIR / f"{table}.csv"
+
+
+def parquet_path(table: str, cleaned: bool = False) -> Path:
+    return PARQUET_DIR / (f"cleaned_{table}.parquet" if cleaned else f"{table}.parquet")
+
+
+def read_csv_typed(path, table: str, columns=None) -> pd.DataFrame:
+    header = pd.read_csv(path, nrows=0).columns
+    df = pd.read_csv(path, usecols=columns, dtype=dtypes_for(table, header))
+    if "SEQN" in df.columns:
+        df["SEQN"] = df["SEQN"].astype("int32")
+    return df
+
+
+def convert(table: str, cleaned: bool = False) -> Path:
+    df = read_csv_typed(csv_path(table, cleaned), table)
+    dst = parquet_path(table, cleaned)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(dst, engine="pyarrow", compression="zstd", index=False)
+    print(f"{table}: {len(df):,} rows -> {dst.relative_to(HERE)}")
+    return dst
+
+
+def load_table(table: str, columns=None, cleaned: bool = False) -> pd.DataFrame:
+    """Load one table, reading only `columns` when given."""
+    src = parquet_path(table, cleaned)
+    if src.exists():
+        return pd.read_parquet(src, columns=columns)
+    return read_csv_typed(csv_path(table, cleaned), table, columns)
+
+
+def save_table(df: pd.DataFrame, table: str, cleaned: bool = False) -> Path:
+    """Write a (possibly filtered) table back out as Parquet, keeping its dtypes."""
+    dst = parquet_path(table, cleaned)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(dst, engine="pyarrow", compression="zstd", index=False)
+    return dst
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert NHANES CSVs to typed Parquet")
+    parser.add_argument("--cleaned", action="store_true", help="also convert datasets-csv/cleaned/")
+    args = parser.parse_args()
+
+    for name in TABLES:
+        convert(name)
+        if args.cleaned and csv_path(name, cleaned=True).exists():
+            convert(name, cleaned=True)
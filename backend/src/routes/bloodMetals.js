@@ -54,17 +54,18 @@ router.post("/:patientId", audit("CREATE_BLOODMETALS"), async (req, res) => {
       include: { bloodMetals: { orderBy: { createdAt: "desc" } } },
     });
 
-    //  Auto-trigger prediction service
+    //  Auto-trigger prediction service (every model in one call)
     try {
-      const endpoints = ["hormone", "infertility", "menstrual", "menopause"];
-      await Promise.all(
-        endpoints.map((ep) =>
-          axios.post(
-            `${process.env.ML_SERVICE_URL}/predict/${ep}`,
-            { features: fullPatient },
-            { headers: { Authorization: req.headers.authorization } }
-          )
-        )
+      await axios.post(
+        `${process.env.ML_SERVICE_URL}/predict/all`,
+        { features: fullPatient },
+        {
+          headers: {
+            Authorization: req.headers.authorization,
+            // one report -> one set of predictions, however often this is retried
+            "Idempotency-Key": `bloodMetals:${bloodMetals.id}`,
+          },
+        }
       );
     } catch (err) {
       console.error("Auto prediction failed:", err.message);
@@ -1,5 +1,6 @@
 // backend/src/routes/ml.js
 
+import crypto from "crypto";
 import express from "express";
 import axios from "axios";
 import { verifyToken, requireRole } from "../middleware/auth.js";
@@ -10,6 +11,11 @@ import { PrismaClient } from "@prisma/client";
 const router = express.Router();
 const prisma = new PrismaClient();
 
+// The client's Idempotency-Key when it sent one, so its retries map to the
+// same Prediction rows; otherwise a fresh key per proxied call
+const idempotencyKey = (req) =>
+  req.headers["idempotency-key"] || crypto.randomUUID();
+
 router.post(
   "/:model/:method",
   verifyToken,
@@ -38,15 +44,21 @@ router.post(
           return res.status(404).json({ error: "Patient not found" });
         }
 
-        //  Build payload to send to FastAPI
-        payload = { features: patient };
+        //  Build payload to send to FastAPI (keeping options like "uncertainty")
+        const { patientId: _, ...options } = req.body;
+        payload = { ...options, features: patient };
       }
 
       // Forward to FastAPI
       const response = await axios.post(
         `${process.env.ML_SERVICE_URL}/predict/${model}`,
         payload,
-        { headers: { Authorization: req.headers.authorization } }
+        {
+          headers: {
+            Authorization: req.headers.authorization,
+            "Idempotency-Key": idempotencyKey(req),
+          },
+        }
       );
 
       res.json(response.data);
@@ -105,6 +117,127 @@ router.post(
   }
 );
 
+router.post(
+  "/:model/sensitivity2d/:method",
+  verifyToken,
+  requireRole("doctor"),
+  audit("SENSITIVITY_2D"),
+  async (req, res) => {
+    try {
+      const { model, method } = req.params;
+      let payload = req.body;
+
+      if (method === "db") {
+        const { patientId } = req.body;
+        if (!patientId) {
+          return res.status(400).json({ error: "patientId required" });
+        }
+
+        const patient = await prisma.patient.findUnique({
+          where: { id: patientId },
+          include: { bloodMetals: { orderBy: { createdAt: "desc" } } },
+        });
+
+        if (!patient) {
+          return res.status(404).json({ error: "Patient not found" });
+        }
+
+        // keep feature_x / feature_y / num_points / grid from the request
+        payload = { ...req.body, features: patient };
+      }
+
+      const response = await axios.post(
+        `${process.env.ML_SERVICE_URL}/predict/sensitivity2d/${model}`,
+        payload,
+        { headers: { Authorization: req.headers.authorization } }
+      );
+
+      res.json(response.data);
+    } catch (err) {
+      console.error("2D sensitivity service error:", err.message);
+      res.status(500).json({
+        error: "2D sensitivity service error",
+        details: err.response?.data || err.message,
+      });
+    }
+  }
+);
+
+router.post(
+  "/:model/counterfactual/:method",
+  verifyToken,
+  requireRole("doctor"),
+  audit("COUNTERFACTUAL"),
+  async (req, res) => {
+    try {
+      const { model, method } = req.params;
+      let payload = req.body;
+
+      if (method === "db") {
+        const { patientId } = req.body;
+        if (!patientId) {
+          return res.status(400).json({ error: "patientId required" });
+        }
+
+        const patient = await prisma.patient.findUnique({
+          where: { id: patientId },
+          include: { bloodMetals: { orderBy: { createdAt: "desc" } } },
+        });
+
+        if (!patient) {
+          return res.status(404).json({ error: "Patient not found" });
+        }
+
+        // keep metals / direction / max_results / budget_ms from the request
+        payload = { ...req.body, features: patient };
+      }
+
+      const response = await axios.post(
+        `${process.env.ML_SERVICE_URL}/predict/counterfactual/${model}`,
+        payload,
+        { headers: { Authorization: req.headers.authorization } }
+      );
+
+      res.json(response.data);
+    } catch (err) {
+      console.error("Counterfactual service error:", err.message);
+      res.status(500).json({
+        error: "Counterfactual service error",
+        details: err.response?.data || err.message,
+      });
+    }
+  }
+);
+
+// Cohort PDP / ICE curves: no patient involved, the query string
+// (features, grid_points, ice_lines) is passed through as is
+router.get(
+  "/:model/cohort",
+  verifyToken,
+  requireRole("doctor"),
+  audit("COHORT_DEPENDENCE"),
+  async (req, res) => {
+    try {
+      const response = await axios.get(
+        `${process.env.ML_SERVICE_URL}/predict/cohort/${req.params.model}`,
+        {
+          params: req.query,
+          paramsSerializer: { indexes: null }, // features=a&features=b
+          headers: { Authorization: req.headers.authorization },
+        }
+      );
+
+      res.json(response.data);
+    } catch (err) {
+      console.error("Cohort dependence service error:", err.message);
+      res.status(err.response?.status === 404 ? 404 : 500).json({
+        error: "Cohort dependence service error",
+        details: err.response?.data || err.message,
+      });
+    }
+  }
+);
+
 router.post(
   "/:model/shap/:method",
   verifyToken,
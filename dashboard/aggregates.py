@@ -0,0 +1,145 @@
+"""
+Precomputed statistics for the dashboard.
+
+Everything the correlation, overview and fertility views summarise is computed
+once per dataset version and pickled under .cache/, so widget changes only
+index into small precomputed tables:
+
+- pearson_r / pearson_n / pearson_p: Pearson matrix over all numeric columns
+  using pairwise-complete observations (same as DataFrame.corr()), with the
+  pair counts and two-sided p-values
+- describe: df.describe() of the numeric columns
+- infertility_by_age: share of respondents reporting infertility per age group
+- missing: missing share per column and per block of rows (for the overview
+  heatmap, which would otherwise ship a rows x columns boolean matrix)
+
+    python aggregates.py        # precompute for the current dataset
+
+The Pearson matrix is built from a few matrix products over the
+missing-value mask rather than one pass per column pair, so it stays cheap
+as the cohort grows.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+CACHE_DIR = Path(__file__).parent / ".cache"
+
+# Bump when the contents or layout of the aggregates change
+AGGREGATES_VERSION = 2
+
+INFERTILITY_LABELS = {1: 'Yes', 2: 'No'}
+AGE_BINS = [18, 25, 30, 35, 40, 45, 50]
+AGE_LABELS = ['18-24', '25-29', '30-34', '35-39', '40-44', '45-50']
+
+# Rows are grouped into at most this many blocks for the missingness heatmap
+MISSING_MAX_BLOCKS = 200
+
+
+def pearson_matrix(df: pd.DataFrame):
+    """Pairwise-complete Pearson r, pair counts n and two-sided p-values."""
+    cols = df.columns
+    X = df.to_numpy(dtype=np.float64)
+    M = ~np.isnan(X)
+    # centre each column first to keep the sums well conditioned
+    X = np.where(M, X - np.nanmean(X, axis=0), 0.0)
+    Mf = M.astype(np.float64)
+
+    n = Mf.T @ Mf                  # rows where both i and j are present
+    sx = X.T @ Mf                  # sum of x_i over those rows
+    sxx = (X * X).T @ Mf           # sum of x_i^2 over those rows
+    sxy = X.T @ X                  # sum of x_i * x_j (zeros where either is missing)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = n * sxy - sx * sx.T
+        # n * var(x_i) over each pair's rows; rounding noise on a constant column counts as zero
+        var = n * sxx - sx ** 2
+        var[var <= 1e-10 * n * sxx] = 0.0
+        r = np.clip(cov / np.sqrt(var * var.T), -1.0, 1.0)
+        r[(n < 2) | (var == 0) | (var.T == 0)] = np.nan
+        dof = n - 2
+        t = r * np.sqrt(dof / (1.0 - r ** 2))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    p[dof < 1] = np.nan
+    p[np.abs(r) == 1.0] = 0.0
+    np.fill_diagonal(r, np.where(np.diag(var) > 0, 1.0, np.nan))
+
+    frame = lambda a: pd.DataFrame(a, index=cols, columns=cols)
+    return frame(r), frame(n.astype(np.int64)), frame(p)
+
+
+def infertility_rate_by_age(df: pd.DataFrame) -> pd.DataFrame:
+    ages = df[(df['age_years'] >= 18) & (df['age_years'] < 50)]
+    age_group = pd.cut(ages['age_years'], bins=AGE_BINS, labels=AGE_LABELS, right=False)
+    infertile = ages['infertility_1yr'].map(INFERTILITY_LABELS) == 'Yes'
+    rates = infertile.groupby(age_group, observed=False).mean()
+    rates = rates.rename('is_infertile').rename_axis('age_group').reset_index()
+    rates['Infertility Rate (%)'] = rates['is_infertile'] * 100
+    return rates
+
+
+def missingness(df: pd.DataFrame, max_blocks: int = MISSING_MAX_BLOCKS) -> dict:
+    isna = df.isna()
+    block_rows = max(1, -(-len(df) // max_blocks))
+    by_block = isna.groupby(np.arange(len(df)) // block_rows).mean()
+    by_block.index = by_block.index * block_rows  # label blocks by their first row
+    return {
+        "by_column": (isna.mean() * 100).rename("missing_pct").rename_axis("column"),
+        "by_block": by_block,
+        "block_rows": block_rows,
+    }
+
+
+def compute_aggregates(df: pd.DataFrame) -> dict:
+    numeric = df.select_dtypes(include=np.number)
+    r, n, p = pearson_matrix(numeric)
+    return {
+        "pearson_r": r,
+        "pearson_n": n,
+        "pearson_p": p,
+        "describe": numeric.describe(),
+        "infertility_by_age": infertility_rate_by_age(df),
+        "missing": missingness(df),
+    }
+
+
+def cache_key(path) -> str:
+    st_ = os.stat(path)
+    return f"{Path(path).name}-{st_.st_mtime_ns}-{st_.st_size}-v{AGGREGATES_VERSION}"
+
+
+def load_or_compute(path, load_df) -> dict:
+    """Aggregates for the dataset at `path`, read from .cache/ or computed and written there.
+
+    `load_df` is called only on a miss. Cache files for older versions of
+    the same dataset file are removed when a new one is written.
+    """
+    key = cache_key(path)
+    target = CACHE_DIR / f"aggregates-{key}.pkl"
+    if target.exists():
+        try:
+            return pd.read_pickle(target)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable aggregates cache {target.name}: {e}")
+
+    result = compute_aggregates(load_df())
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    tmp = target.with_suffix(".tmp")
+    pd.to_pickle(result, tmp)
+    os.replace(tmp, target)
+    for old in CACHE_DIR.glob(f"aggregates-{Path(path).name}-*.pkl"):
+        if old != target:
+            old.unlink(missing_ok=True)
+    return result
+
+
+if __name__ == "__main__":
+    from convert_data import read_dataset, resolve_source
+
+    src = resolve_source()
+    agg = load_or_compute(src, lambda: read_dataset(src))
+    print(f"Aggregates for {src.name}: {agg['pearson_r'].shape[0]} numeric columns")
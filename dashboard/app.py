@@ -5,8 +5,13 @@ import seaborn as sns
 import streamlit as st
 import altair as alt
 import plotly.express as px
-from scipy.stats import pearsonr
-import plotly.graph_objects as go
+
+from data import (HORMONE_COLS, METAL_COLS, aggregates, association_rules, data_source_selector,
+                  dataset_version, derived_frames, load_dataset)
+from rendering import (
+    box_from_stats, histogram, missingness_figures, point_cap_note, render_settings, scatter, violins,
+)
+from rules import filter_rules
 
 # --- PAGE CONFIG ---
 st.set_page_config(
@@ -17,7 +22,8 @@ st.set_page_config(
 )
 
 
-df = pd.read_csv('final_cleaned.csv')
+# Columns the stakeholder heatmap/scatter need; the sandbox loads everything
+STAKEHOLDER_COLS = HORMONE_COLS + METAL_COLS
 
 
 # --- A. Function to display the Landing Page (with new card design) ---
@@ -181,6 +187,13 @@ def show_stakeholder_dashboard():
     st.title("ReproSight: Key Insights")
     st.markdown("### Explore key findings across different aspects of reproductive health.")
 
+    # Cached across reruns; invalidated when the data file changes (see data.py)
+    df = load_dataset(STAKEHOLDER_COLS)
+    frames = derived_frames()
+    agg = aggregates()
+    version = dataset_version()
+    max_points, density = render_settings()
+
 # --- 4 TABS FOR MAIN DOMAINS ---
     tab1, tab2, tab3, tab4 = st.tabs([
         "Hormonal Patterns", 
@@ -195,8 +208,8 @@ def show_stakeholder_dashboard():
         # st.markdown("This heatmap shows the linear relationship between various heavy metals and key reproductive hormones. Bright red indicates a strong negative correlation, while bright blue indicates a strong positive correlation.")
 
         # Define the lists of columns for the heatmap
-        hormone_cols = ['testosterone', 'estradiol', 'shbg']
-        metal_cols = ['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L']
+        hormone_cols = HORMONE_COLS
+        metal_cols = METAL_COLS
 
         # Ensure all selected columns exist in the dataframe
         valid_hormone_cols = [col for col in hormone_cols if col in df.columns]
@@ -205,8 +218,8 @@ def show_stakeholder_dashboard():
         if not valid_hormone_cols or not valid_metal_cols:
             st.warning("Some hormone or metal columns were not found in the dataset.")
         else:
-            # Calculate the full correlation matrix for the selected columns
-            corr_matrix = df[valid_hormone_cols + valid_metal_cols].corr()
+            # Precomputed pairwise-complete correlation matrix (see aggregates.py)
+            corr_matrix = agg["pearson_r"]
 
             # Isolate the part of the matrix that shows metals vs. hormones
             metal_hormone_corr = corr_matrix.loc[valid_hormone_cols, valid_metal_cols]
@@ -232,20 +245,20 @@ def show_stakeholder_dashboard():
             hormone_to_plot = st.selectbox("Select a hormone to plot:", options=valid_hormone_cols, key="hormone_scatter_select")
         
         if metal_to_plot and hormone_to_plot:
-            fig_scatter = px.scatter(
-                df, 
+            fig_scatter, shown, total = scatter(
+                df,
                 x=metal_to_plot, y=hormone_to_plot,
-                trendline="ols",
+                version=version, frame="stakeholder", max_points=max_points, density=density,
+                trendline=True,  # OLS fitted on all rows, drawn as a line
                 title=f"Relationship between {metal_to_plot} and {hormone_to_plot}",
                 labels={
                     metal_to_plot: f"Blood {metal_to_plot.split('_')[0].capitalize()} Concentration",
                     hormone_to_plot: f"{hormone_to_plot.capitalize()} Level"
                 },
-                trendline_color_override="red"   # ← change trendline color here
-
-
+                trendline_color="red"   # ← change trendline color here
             )
             st.plotly_chart(fig_scatter, use_container_width=True)
+            point_cap_note(shown, total)
 
 
     # --- Tab 2: Fertility Analysis ---    
@@ -259,28 +272,29 @@ def show_stakeholder_dashboard():
         # --- Insight: Heavy Metal Exposure in Fertile vs. Infertile Groups ---
         st.subheader("How does heavy metal exposure differ between fertile and infertile groups?")
         
-        # Create a copy with readable labels
-        df['infertility_status'] = df['infertility_1yr'].map({1: 'Yes', 2: 'No'})
+        # Readable labels live on the cached fertility frame, not the shared df
+        df_fertility = frames["fertility"]
 
         metal_to_analyze = st.selectbox(
             "Select a heavy metal to compare:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLS,
             key="fertility_metal_select"
         )
 
         if metal_to_analyze:
             fig_title = f"Distribution of {metal_to_analyze} for Fertile and Infertile Groups"
-            fig = px.box(
-                df,
-                x='infertility_status',   # Use the new mapped column here
-                y=metal_to_analyze,
-                color='infertility_status',
+            # Boxes drawn from per-group quartiles computed server-side
+            fig = box_from_stats(
+                df_fertility,
+                'infertility_status',   # Use the new mapped column here
+                metal_to_analyze,
+                version=version, frame="fertility",
                 title=fig_title,
                 labels={
                     "infertility_status": "Reported Infertility (1 Year+)",
                     metal_to_analyze: f"Blood {metal_to_analyze.split('_')[0].capitalize()} Concentration"
                 },
-                category_orders={"infertility_status": ["Yes", "No"]}
+                order=["Yes", "No"]
             )
             st.plotly_chart(fig, use_container_width=True)
 
@@ -296,24 +310,9 @@ def show_stakeholder_dashboard():
             
             # --- Insight 2: Infertility Rate by Age Group (NEW) ---
             st.subheader("Infertility Rate by Age Group")
-            df_fertility = df.copy()
-            df_fertility['infertility_status'] = df_fertility['infertility_1yr'].map({1: 'Yes', 2: 'No'}).fillna('Unknown')
-            # 1. Define age bins and labels for reproductive years
-            bins = [18, 25, 30, 35, 40, 45, 50]
-            labels = ['18-24', '25-29', '30-34', '35-39', '40-44', '45-50']
-            
-            # 2. Create age group column (filtering out ages > 50)
-            df_age_analysis = df_fertility[(df_fertility['age_years'] >= 18) & (df_fertility['age_years'] < 50)].copy()
-            df_age_analysis['age_group'] = pd.cut(df_age_analysis['age_years'], bins=bins, labels=labels, right=False)
-            
-            # 3. Create a boolean column for infertility
-            df_age_analysis['is_infertile'] = (df_age_analysis['infertility_status'] == 'Yes')
-            
-            # 4. Calculate the mean infertility rate for each age group
-            infertility_rate_by_age = df_age_analysis.groupby('age_group')['is_infertile'].mean().reset_index()
-            infertility_rate_by_age['Infertility Rate (%)'] = infertility_rate_by_age['is_infertile'] * 100
+            # Rates per age group (18-50) are computed once per dataset version in data.py
+            infertility_rate_by_age = agg["infertility_by_age"]
 
-            # 5. Create the bar chart
             if not infertility_rate_by_age.empty:
                 fig_age = px.bar(
                     infertility_rate_by_age,
@@ -341,20 +340,19 @@ def show_stakeholder_dashboard():
         # Let the user select a metal to analyze
         metal_menstrual = st.selectbox(
             "Select a heavy metal to compare:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLS,
             key="menstrual_metal_select" # Use a unique key
         )
         if metal_menstrual:
-            fig_rain = go.Figure()
-            # Loop for Raincloud plot
-            for status in df['regular_periods'].unique():
-                df_filtered = df[df['regular_periods'] == status]
-                fig_rain.add_trace(go.Violin(
-                    x=df_filtered['regular_periods'], y=df_filtered[metal_menstrual], name=status,
-                    box_visible=True, meanline_visible=True, points='all', jitter=0.3, pointpos=-1.8
-                ))
-            fig_rain.update_layout(title_text=f"Raincloud Plot: {metal_menstrual} for Regular vs. Irregular Cycles", xaxis_title="Regular Menstrual Periods", showlegend=False)
+            # Raincloud plot from a capped sample per group
+            fig_rain, shown, total = violins(
+                frames["regular_period_groups"], metal_menstrual,
+                version=version, frame="regular_periods", max_points=max_points,
+                title=f"Raincloud Plot: {metal_menstrual} for Regular vs. Irregular Cycles",
+                xaxis_title="Regular Menstrual Periods",
+            )
             st.plotly_chart(fig_rain, use_container_width=True)
+            point_cap_note(shown, total)
 
         st.markdown("---")
 
@@ -362,31 +360,28 @@ def show_stakeholder_dashboard():
         # --- Insight 2: Age of First Period vs. Metal Exposure (NEW BOX PLOT) ---
         st.subheader("How heavy Metal Exposure affects the Age of First Period")
         
-        # Filter for realistic first period ages
-        df_menarche = df[df['first_period_age'].between(8, 20)].copy()
-        
-        # Convert the age column to a string so Plotly treats it as a category, not a number
-        df_menarche['first_period_age'] = df_menarche['first_period_age'].astype(str)
+        # Realistic first period ages (8-20), already converted to strings so Plotly treats them as categories
+        df_menarche = frames["menarche"]
 
         metal_menarche = st.selectbox(
             "Select a heavy metal to investigate:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLS,
             key="menarche_metal_select"
         )
         if metal_menarche:
-            fig_menarche_box = px.box(
+            fig_menarche_box = box_from_stats(
                 df_menarche,
-                y='first_period_age',  # X-axis is now the discrete age
-                x=metal_menarche,      # Y-axis is the continuous metal level
-                color='first_period_age', # Color by age for clarity
+                'first_period_age',    # one box per discrete age
+                metal_menarche,        # continuous metal level along x
+                version=version, frame="menarche", horizontal=True,
                 title=f"Distribution of {metal_menarche} by Age of First Period",
                 labels={
                     "first_period_age": "Age of First Period",
                     metal_menarche: f"Blood {metal_menarche.split('_')[0].capitalize()} Concentration"
-                }
+                },
+                # Numerical order (e.g., 11, 12, 13)
+                order=sorted(df_menarche['first_period_age'].unique(), key=float)
             )
-            # Sort the x-axis to be in numerical order (e.g., 11, 12, 13)
-            fig_menarche_box.update_xaxes(categoryorder='category ascending')
             st.plotly_chart(fig_menarche_box, use_container_width=True)
             st.info("This chart helps explore if metal exposure levels differ by the age of first menstruation. You can look for a trend (e.g., rising or falling) in the boxes as age increases.")
 
@@ -397,32 +392,32 @@ def show_stakeholder_dashboard():
         st.header("Menopause Trends")
         st.subheader("Investigating the Link Between Toxin Exposure and Menopause Age")
         
-        # Filter the dataframe to only include rows with valid 'last_period_age' data
-        df_menopause = df.dropna(subset=['last_period_age'])
-        # 2. Then, filter out the unrealistic ages greater than 100
-        df_menopause = df_menopause[df_menopause['last_period_age'] < 100]
+        # Rows with a valid 'last_period_age' (present and below 100)
+        df_menopause = frames["menopause"]
 
         # Let the user select a metal to investigate
         metal_menopause = st.selectbox(
             "Select a heavy metal to investigate:",
-            options=['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L'],
+            options=METAL_COLS,
             key="menopause_metal_select" # Use a unique key
         )
 
         if metal_menopause:
-            fig = px.scatter(
-                df_menopause, 
-                x=metal_menopause, 
-                y='last_period_age', 
-                trendline="ols", # Ordinary Least Squares trendline
+            fig, shown, total = scatter(
+                df_menopause,
+                x=metal_menopause,
+                y='last_period_age',
+                version=version, frame="menopause", max_points=max_points, density=density,
+                trendline=True, # Ordinary Least Squares trendline, fitted on all rows
                 title=f"Relationship between {metal_menopause} and Age of Last Period",
                 labels={
                     "last_period_age": "Age of Last Menstrual Period",
                     metal_menopause: f"Blood {metal_menopause.split('_')[0].capitalize()} Concentration"
                 },
-                trendline_color_override="red"   # ← change trendline color here
+                trendline_color="red"   # ← change trendline color here
             )
             st.plotly_chart(fig, use_container_width=True)
+            point_cap_note(shown, total)
             st.info(
                 """
                 **How to Interpret This Chart:** A downward-sloping trendline could suggest an association between higher exposure to a metal and an earlier age of menopause.
@@ -435,15 +430,21 @@ def show_scientist_dashboard():
     """Displays the detailed, interactive dashboard for data scientists."""
     st.title("ReproSight: Modeler's Sandbox")
 
+    df = load_dataset()
+    agg = aggregates()
+    version = dataset_version()
+    max_points, density = render_settings()
+
     st.markdown("### Interactive EDA Toolkit for Deep-Dive Analysis")
 
 
 # --- THE TABBED INTERFACE ---
-    tab1, tab2, tab3, tab4 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "Data Overview",
         "Univariate Explorer",
         "Bivariate Explorer",
-        "Correlation Matrix"
+        "Correlation Matrix",
+        "Association Rules"
     ])
 
     # --- Tab 1: Data Overview ---
@@ -465,14 +466,13 @@ def show_scientist_dashboard():
         # st.dataframe(df.dtypes.to_frame().rename(columns={0: 'Data Type'}))
 
         st.subheader("Missing Values Heatmap")
-        # A simple heatmap to show missing data patterns
-        missing_data = df.isnull()
-        fig_missing = px.imshow(missing_data, title="Heatmap of Missing Values",
-                                labels=dict(color="Missing (True/False)"))
+        # Precomputed summaries: missing share per column, and per block of rows
+        fig_missing_cols, fig_missing = missingness_figures(agg["missing"])
+        st.plotly_chart(fig_missing_cols, use_container_width=True)
         st.plotly_chart(fig_missing, use_container_width=True)
         
         st.subheader("Summary Statistics (Numerical Columns)")
-        st.dataframe(df.describe())
+        st.dataframe(agg["describe"])
 
 
     # --- Tab 2, 3, 4: (The code for these tabs remains the same for now) ---
@@ -482,11 +482,11 @@ def show_scientist_dashboard():
         # This selectbox will now be populated with your new columns
         column_to_inspect = st.selectbox("Select a column to inspect", df.columns)
         # The rest of the logic works as is!
-        if df[column_to_inspect].dtype in ['int64', 'float64']:
-            fig = px.histogram(df, x=column_to_inspect, nbins=40, title=f"Distribution of {column_to_inspect}")
+        if pd.api.types.is_numeric_dtype(df[column_to_inspect]):
+            fig = histogram(df[column_to_inspect], nbins=40, title=f"Distribution of {column_to_inspect}")
         else:
-            fig = px.bar(df[column_to_inspect].value_counts().reset_index(),
-                 x='index', y=column_to_inspect,
+            counts = df[column_to_inspect].value_counts().rename_axis(column_to_inspect).reset_index(name='count')
+            fig = px.bar(counts, x=column_to_inspect, y='count',
                  title=f"Category Counts for {column_to_inspect}")
         st.plotly_chart(fig)
 
@@ -513,15 +513,20 @@ def show_scientist_dashboard():
         if x_var and y_var:
             if x_var in numeric_cols and y_var in numeric_cols:
                 st.subheader(f"Scatter Plot: {x_var} vs. {y_var}")
-                fig = px.scatter(df, x=x_var, y=y_var, color=color_var, title=f"{x_var} vs. {y_var}")
+                fig, shown, total = scatter(
+                    df, x=x_var, y=y_var, color=color_var, title=f"{x_var} vs. {y_var}",
+                    version=version, frame="full", max_points=max_points, density=density,
+                )
                 st.plotly_chart(fig, use_container_width=True)
+                point_cap_note(shown, total)
 
-                # Create a temporary dataframe with only the two columns and drop rows where EITHER value is missing
-                temp_df = df[[x_var, y_var]].dropna()
+                # Precomputed over the rows where both values are present
+                n_pairs = agg["pearson_n"].loc[x_var, y_var]
                 
                 # Check if there's enough data left to calculate correlation
-                if len(temp_df) > 1:
-                    corr, p_value = pearsonr(temp_df[x_var], temp_df[y_var])
+                if n_pairs > 1:
+                    corr = agg["pearson_r"].loc[x_var, y_var]
+                    p_value = agg["pearson_p"].loc[x_var, y_var]
                     st.info(f"**Pearson Correlation**: {corr:.3f}\n\n**P-value**: {p_value:.3g}")
                     st.write("A low p-value (e.g., < 0.05) suggests a statistically significant linear relationship.")
                 else:
@@ -542,10 +547,8 @@ def show_scientist_dashboard():
         # ...
         st.write("Visualize the linear relationships between all numerical variables.")
 
-        numeric_df = df.select_dtypes(include=np.number)
-        
-        # 1. Calculate the correlation matrix and immediately round it
-        corr_matrix = numeric_df.corr().round(2)
+        # 1. Take the precomputed correlation matrix and round it
+        corr_matrix = agg["pearson_r"].round(2)
 
         corr_threshold = st.slider(
             "Filter by absolute correlation strength", 
@@ -569,13 +572,53 @@ def show_scientist_dashboard():
         )
         
         st.plotly_chart(fig, use_container_width=True)
-        
+
+    with tab5:
+        st.header("Association Rules")
+        st.write("IF-THEN patterns between metal risk bands (the infertility model's thresholds), "
+                 "age, hormone levels and reproductive outcomes.")
+
+        mined = association_rules()
+        col1, col2, col3 = st.columns(3)
+        min_support = col1.slider("Min support", min_value=float(mined["min_support"]), max_value=0.5,
+                                  value=0.05, step=0.01)
+        min_confidence = col2.slider("Min confidence", min_value=0.0, max_value=1.0, value=0.5, step=0.05)
+        min_lift = col3.slider("Min lift", min_value=1.0, max_value=5.0, value=1.2, step=0.1)
+
+        col1, col2 = st.columns(2)
+        consequent = col1.selectbox("Consequent", ["Any", "infertility", "regular_periods"])
+        top_n = col2.number_input("Rules to show", min_value=5, max_value=500, value=25, step=5)
+
+        top_rules = filter_rules(
+            mined["rules"], min_support=min_support, min_confidence=min_confidence, min_lift=min_lift,
+            consequent_prefix=None if consequent == "Any" else consequent, top=int(top_n),
+        )
+        st.caption(f"{len(top_rules):,} rules shown, mined from {mined['transactions']:,} respondents "
+                   "who answered the infertility or menstrual questions.")
+
+        table = top_rules.assign(
+            antecedents=top_rules["antecedents"].map(", ".join),
+            consequents=top_rules["consequents"].map(", ".join),
+        )
+        st.dataframe(table.round(3), use_container_width=True, hide_index=True)
+
+        if not table.empty:
+            fig = px.scatter(
+                table, x="support", y="confidence", color="lift", size="lift",
+                hover_data=["antecedents", "consequents"],
+                title="Support vs. Confidence of the Shown Rules",
+                color_continuous_scale="Viridis",
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
 
 # --- SIDEBAR ---
 st.sidebar.title("Navigation")
 # The user selects their role here
 app_mode = st.sidebar.selectbox("What would you like to explore?",
     ["Select mode ...",  "Explore Dataset", "Key Insights"])
+# NHANES extract, or the live cohort when DASHBOARD_DB_URL is configured
+data_source_selector()
 
 # --- MAIN PAGE ---
 if app_mode == "Explore Dataset":
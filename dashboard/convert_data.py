@@ -0,0 +1,59 @@
+"""
+Convert the dashboard dataset from CSV to typed Parquet.
+
+    python convert_data.py                       # final_cleaned.csv -> final_cleaned.parquet
+    python convert_data.py other.csv out.parquet
+
+Measurements are stored as float32 (survey weights stay float64). Coded
+questionnaire answers are kept numeric as well, since the correlation,
+histogram and range filters in app.py treat them as numbers. data.py reads
+the Parquet file when it is at least as new as the CSV and falls back to the
+CSV (with the same dtypes) otherwise.
+"""
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+HERE = Path(__file__).parent
+CSV_PATH = HERE / "final_cleaned.csv"
+PARQUET_PATH = HERE / "final_cleaned.parquet"
+
+# Columns that need more than float32 precision
+FLOAT64_COLS = ['Blood metal weights']
+
+
+def dtypes_for(columns) -> dict:
+    return {c: ('float64' if c in FLOAT64_COLS else 'float32') for c in columns}
+
+
+def read_csv(path=CSV_PATH, columns=None) -> pd.DataFrame:
+    """CSV read with the same explicit dtypes as the Parquet file (no type inference)."""
+    header = pd.read_csv(path, nrows=0).columns
+    return pd.read_csv(path, usecols=columns, dtype=dtypes_for(header))
+
+
+def resolve_source() -> Path:
+    """Parquet copy when it is up to date with the CSV, otherwise the CSV itself."""
+    if PARQUET_PATH.exists() and (
+        not CSV_PATH.exists() or PARQUET_PATH.stat().st_mtime_ns >= CSV_PATH.stat().st_mtime_ns
+    ):
+        return PARQUET_PATH
+    return CSV_PATH
+
+
+def read_dataset(path, columns=None) -> pd.DataFrame:
+    if str(path).endswith(".parquet"):
+        return pd.read_parquet(path, columns=columns)
+    return read_csv(path, columns)
+
+
+def convert(src=CSV_PATH, dst=PARQUET_PATH) -> Path:
+    df = read_csv(src)
+    df.to_parquet(dst, engine="pyarrow", compression="zstd", index=False)
+    print(f"Wrote {dst} ({len(df):,} rows, {df.shape[1]} columns)")
+    return Path(dst)
+
+
+if __name__ == "__main__":
+    convert(*sys.argv[1:3])
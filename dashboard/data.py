@@ -0,0 +1,147 @@
+"""
+Cached data layer for the ReproSight dashboard.
+
+Streamlit re-runs app.py top to bottom on every widget interaction, so the
+dataset and the per-tab frames derived from it are built here once and
+shared across reruns and sessions. Cache entries are keyed on the file path
+and its mtime, so replacing the data file invalidates them on the next
+rerun without restarting the app.
+
+The typed Parquet copy written by convert_data.py is preferred when it is at
+least as new as final_cleaned.csv; views ask only for the columns they use.
+Correlations, describe tables and group rates come from aggregates.py, which
+also keeps them on disk between app restarts.
+
+When DASHBOARD_DB_URL is set, the sidebar also offers the live cohort from
+the application database (live_source.py). It is materialised into a Parquet
+file with the same layout, so the caches above work unchanged: an
+incremental refresh that changes nothing keeps the file, and its cache
+entries, as they are.
+
+The returned frames are shared objects (st.cache_resource does not copy);
+treat them as read-only and .copy() before modifying.
+"""
+import os
+from typing import Optional, Sequence
+
+import pandas as pd
+import streamlit as st
+
+import live_source
+import rules
+from aggregates import load_or_compute
+from convert_data import read_dataset, resolve_source
+
+METAL_COLS = ['lead_µg/dL', 'cadmium_µg/L', 'mercury_µg/L', 'selenium_µg/L', 'manganese_µg/L']
+HORMONE_COLS = ['testosterone', 'estradiol', 'shbg']
+
+INFERTILITY_LABELS = {1: 'Yes', 2: 'No'}
+
+SOURCE_NHANES = "NHANES 2015-2016"
+SOURCE_LIVE = "Live cohort"
+DEFAULT_SOURCE = SOURCE_LIVE if os.environ.get("DASHBOARD_SOURCE") == "live" else SOURCE_NHANES
+
+
+def data_source_selector() -> str:
+    """Sidebar choice between the NHANES extract and the live cohort (only shown when configured)."""
+    if not live_source.enabled():
+        return SOURCE_NHANES
+    options = [SOURCE_NHANES, SOURCE_LIVE]
+    source = st.sidebar.radio("Data source", options, index=options.index(DEFAULT_SOURCE), key="data_source")
+    if source == SOURCE_LIVE:
+        refresh = st.sidebar.button("Refresh live data")
+        try:
+            with st.spinner("Syncing live cohort..."):
+                live_source.refresh_if_stale(force=refresh)
+        except Exception as e:
+            print(f"⚠️ Live cohort sync failed: {e}")
+            st.sidebar.warning("Could not reach the database; showing the last synced copy.")
+        if not live_source.COHORT_PATH.exists():
+            st.sidebar.error("No live data synced yet; showing the NHANES extract.")
+            return SOURCE_NHANES
+        st.sidebar.caption("Hormone values in the live cohort are model predictions.")
+    return source
+
+
+def current_source():
+    """Data file for this session's selected source."""
+    if st.session_state.get("data_source") == SOURCE_LIVE and live_source.COHORT_PATH.exists():
+        return live_source.COHORT_PATH
+    return resolve_source()
+
+
+def dataset_version(path=None) -> int:
+    """Cache key component that changes whenever the file is replaced."""
+    return os.stat(path or current_source()).st_mtime_ns
+
+
+@st.cache_resource(show_spinner="Loading dataset...", max_entries=8)
+def _read_dataset(path: str, version: int, columns: Optional[tuple]) -> pd.DataFrame:
+    return read_dataset(path, list(columns) if columns else None)
+
+
+def load_dataset(columns: Optional[Sequence[str]] = None, path=None) -> pd.DataFrame:
+    """Whole dataset, or only `columns` (one cache entry per column set)."""
+    path = path or current_source()
+    return _read_dataset(str(path), dataset_version(path), tuple(columns) if columns else None)
+
+
+# Columns the stakeholder tabs read
+DERIVED_SOURCE_COLS = METAL_COLS + [
+    'infertility_1yr', 'regular_periods', 'first_period_age', 'last_period_age',
+]
+
+
+@st.cache_resource(show_spinner=False, max_entries=2)
+def _derived_frames(path: str, version: int) -> dict:
+    df = _read_dataset(path, version, tuple(DERIVED_SOURCE_COLS))
+
+    # Fertility tab: readable labels without touching the base frame
+    fertility = df[METAL_COLS + ['infertility_1yr']].assign(
+        infertility_status=df['infertility_1yr'].map(INFERTILITY_LABELS)
+    )
+
+    # Menstrual tab: realistic menarche ages, as strings so Plotly treats them as categories
+    menarche = df.loc[df['first_period_age'].between(8, 20), METAL_COLS + ['first_period_age']]
+    menarche = menarche.assign(first_period_age=menarche['first_period_age'].astype(str))
+
+    # Menopause tab: valid ages of last period only
+    menopause = df.loc[df['last_period_age'] < 100, METAL_COLS + ['last_period_age']]
+
+    return {
+        "fertility": fertility,
+        "menarche": menarche,
+        "menopause": menopause,
+        "regular_period_groups": {
+            status: group[METAL_COLS + ['regular_periods']]
+            for status, group in df.groupby('regular_periods', sort=False)
+        },
+    }
+
+
+def derived_frames(path=None) -> dict:
+    """Per-tab frames computed once per dataset version."""
+    path = path or current_source()
+    return _derived_frames(str(path), dataset_version(path))
+
+
+@st.cache_resource(show_spinner="Computing statistics...", max_entries=2)
+def _aggregates(path: str, version: int) -> dict:
+    return load_or_compute(path, lambda: _read_dataset(path, version, None))
+
+
+def aggregates(path=None) -> dict:
+    """Precomputed correlation/describe/group-rate tables (see aggregates.py)."""
+    path = path or current_source()
+    return _aggregates(str(path), dataset_version(path))
+
+
+@st.cache_resource(show_spinner="Mining association rules...", max_entries=2)
+def _association_rules(path: str, version: int) -> dict:
+    return rules.load_or_mine(path, lambda: _read_dataset(path, version, tuple(rules.SOURCE_COLS)))
+
+
+def association_rules(path=None) -> dict:
+    """Metal/outcome association rules mined once per dataset version (see rules.py)."""
+    path = path or current_source()
+    return _association_rules(str(path), dataset_version(path))
@@ -0,0 +1,307 @@
+"""
+Optional live cohort source: patients, blood metal tests and predictions from
+the application's Postgres database.
+
+Rows are pulled over a read-only connection (DASHBOARD_DB_URL, ideally a
+read-only role or a replica) into per-table Parquet files under .cache/live/.
+Each sync only asks for rows changed since the last one, using the table's
+updatedAt (Patient, BloodMetals) or createdAt (Prediction, append-only)
+watermark. The last DASHBOARD_SYNC_OVERLAP_SECONDS before the watermark are
+re-read and de-duplicated by id: createdAt is the inserting transaction's
+start time and Prisma sets updatedAt client-side, so a row committed after
+a sync can carry an older timestamp. A row that commits later than that
+window is still missed, as are deleted rows; run with --full to rebuild.
+
+The synced tables are then flattened into cohort.parquet in the same column
+layout as final_cleaned.csv, one row per patient:
+
+- metals come from the latest BloodMetals row and are converted from µmol/L
+  to the NHANES units the views use
+- testosterone / estradiol / shbg are the latest *model predictions* (the
+  app stores no measured hormones), other models appear as predicted_<model>
+- questionnaire answers are re-coded to the NHANES codes (1 = yes, 2 = no)
+
+Only the columns needed for analytics are read; names, NIC and contact
+details never leave the database.
+
+    python live_source.py            # incremental sync + rebuild cohort.parquet
+    python live_source.py --full     # drop the local cache first
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+import pandas as pd
+
+from convert_data import CSV_PATH
+
+LIVE_DB_URL = os.environ.get("DASHBOARD_DB_URL")
+REFRESH_SECONDS = int(os.environ.get("DASHBOARD_REFRESH_SECONDS", 300))
+STATEMENT_TIMEOUT_MS = int(os.environ.get("DASHBOARD_STATEMENT_TIMEOUT_MS", 30_000))
+SYNC_OVERLAP_SECONDS = int(os.environ.get("DASHBOARD_SYNC_OVERLAP_SECONDS", 300))
+FETCH_BATCH = 5000
+
+CACHE_DIR = Path(__file__).parent / ".cache" / "live"
+STATE_PATH = CACHE_DIR / "state.json"
+COHORT_PATH = CACHE_DIR / "cohort.parquet"
+
+# table -> (watermark column, columns pulled); see ml-service/prisma/schema.prisma
+TABLES = {
+    "Patient": ("updatedAt", [
+        "id", "ageYears", "ageMonths", "gender", "bmi",
+        "pregnancyCount", "pregnancyStatus", "triedYearPregnant", "vaginalDeliveries",
+        "everUsedFemaleHormones", "hadHysterectomy", "ovariesRemoved", "everUsedBirthControlPills",
+        "maritalStatus", "createdAt", "updatedAt",
+    ]),
+    "BloodMetals": ("updatedAt", [
+        "id", "patientId", "lead_umolL", "cadmium_umolL", "mercury_umolL",
+        "selenium_umolL", "manganese_umolL", "createdAt", "updatedAt",
+    ]),
+    "Prediction": ("createdAt", ["id", "patientId", "model", "value", "createdAt"]),
+}
+
+# Query parameters Prisma accepts in DATABASE_URL that libpq does not
+PRISMA_ONLY_PARAMS = {"schema", "connection_limit", "pool_timeout", "pgbouncer",
+                      "socket_timeout", "statement_cache_size"}
+
+MARITAL_STATUS_CODES = {
+    "MARRIED": 1, "WIDOWED": 2, "DIVORCED": 3, "SEPARATED": 4,
+    "NEVER_MARRIED": 5, "LIVING_WITH_PARTNER": 6, "UNKNOWN": 7,
+}
+
+# µmol/L -> NHANES reporting units (atomic weights as in the ML service's feature mappers)
+METAL_UNITS = {
+    "lead_umolL": {"lead_µg/dL": 207.2 / 10.0, "lead_µmol/L": 1.0},
+    "cadmium_umolL": {"cadmium_µg/L": 112.414, "cadmium_nmol/L": 1000.0},
+    "mercury_umolL": {"mercury_µg/L": 200.59, "mercury_nmol/L": 1000.0},
+    "selenium_umolL": {"selenium_µg/L": 78.971, "selenium_µmol/L": 1.0},
+    "manganese_umolL": {"manganese_µg/L": 54.938, "manganese_nmol/L": 1000.0},
+}
+
+HORMONE_PREDICTIONS = {
+    "hormone_testosterone": "testosterone",
+    "hormone_estradiol": "estradiol",
+    "hormone_shbg": "shbg",
+}
+
+_sync_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(LIVE_DB_URL)
+
+
+# ---------------- Connection ----------------
+def libpq_url(url: str):
+    """Strip Prisma-only query params; returns (url, schema)."""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    schema = query.get("schema", "public")
+    query = {k: v for k, v in query.items() if k not in PRISMA_ONLY_PARAMS}
+    return urlunsplit(parts._replace(query=urlencode(query))), schema
+
+
+def connect(url: str = None):
+    import psycopg
+
+    dsn, schema = libpq_url(url or LIVE_DB_URL)
+    conn = psycopg.connect(
+        dsn,
+        connect_timeout=10,
+        options=f"-c default_transaction_read_only=on -c statement_timeout={STATEMENT_TIMEOUT_MS}",
+    )
+    conn.read_only = True
+    return conn, schema
+
+
+# ---------------- Local state ----------------
+def _load_state() -> dict:
+    if STATE_PATH.exists():
+        return json.loads(STATE_PATH.read_text())
+    return {}
+
+
+def _save_state(state: dict):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, STATE_PATH)
+
+
+def _table_path(table: str) -> Path:
+    return CACHE_DIR / f"{table}.parquet"
+
+
+def _write_parquet(df: pd.DataFrame, path: Path):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    df.to_parquet(tmp, engine="pyarrow", compression="zstd", index=False)
+    os.replace(tmp, path)
+
+
+def read_table(table: str) -> pd.DataFrame:
+    path = _table_path(table)
+    if path.exists():
+        return pd.read_parquet(path)
+    return pd.DataFrame(columns=TABLES[table][1])
+
+
+# ---------------- Sync ----------------
+def _fetch_since(conn, schema: str, table: str, watermark):
+    from psycopg import sql
+
+    wm_col, columns = TABLES[table]
+    query = sql.SQL("SELECT {cols} FROM {tbl}{where} ORDER BY {wm}").format(
+        cols=sql.SQL(", ").join(sql.Identifier(c) for c in columns),
+        tbl=sql.Identifier(schema, table),
+        where=sql.SQL(" WHERE {} >= %s").format(sql.Identifier(wm_col)) if watermark else sql.SQL(""),
+        wm=sql.Identifier(wm_col),
+    )
+    frames = []
+    # server-side cursor: rows arrive in batches instead of one large result set
+    with conn.cursor(name=f"dashboard_sync_{table.lower()}") as cur:
+        cur.execute(query, (watermark,) if watermark else None)
+        while True:
+            rows = cur.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            frames.append(pd.DataFrame(rows, columns=columns))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+
+def sync_table(conn, schema: str, table: str, state: dict) -> int:
+    """Pull rows changed since the stored watermark and merge them into the local copy."""
+    wm_col, _ = TABLES[table]
+    watermark = state.get(table, {}).get("watermark")
+    since = None
+    if watermark:
+        # overlap window for rows that committed after the last sync with an older timestamp
+        since = (pd.Timestamp(watermark) - pd.Timedelta(seconds=SYNC_OVERLAP_SECONDS)).to_pydatetime()
+    new = _fetch_since(conn, schema, table, since)
+
+    if new.empty:
+        return 0
+
+    old = read_table(table)
+    # the overlap is re-read every time; only count rows that are new or changed
+    seen = set(zip(old["id"], pd.to_datetime(old[wm_col])))
+    changed = sum(row not in seen for row in zip(new["id"], pd.to_datetime(new[wm_col])))
+
+    merged = pd.concat([old, new], ignore_index=True)
+    merged = merged.drop_duplicates("id", keep="last")
+    _write_parquet(merged, _table_path(table))
+
+    latest = pd.Timestamp(new[wm_col].max())
+    if watermark:
+        latest = max(latest, pd.Timestamp(watermark))
+    state[table] = {"watermark": latest.isoformat(), "rows": len(merged)}
+    return changed
+
+
+def sync(url: str = None, full: bool = False) -> dict:
+    """Incremental sync of every table, then rebuild cohort.parquet if anything changed."""
+    if full:
+        for path in CACHE_DIR.glob("*.parquet"):
+            path.unlink()
+        STATE_PATH.unlink(missing_ok=True)
+
+    state = _load_state()
+    conn, schema = connect(url)
+    try:
+        changed = {table: sync_table(conn, schema, table, state) for table in TABLES}
+        conn.rollback()  # read-only transaction; nothing to commit
+    finally:
+        conn.close()
+
+    if any(changed.values()) or not COHORT_PATH.exists():
+        _write_parquet(build_cohort(), COHORT_PATH)
+    state["last_sync"] = time.time()
+    _save_state(state)
+    return changed
+
+
+def refresh_if_stale(max_age: int = REFRESH_SECONDS, force: bool = False):
+    """Sync when the last one is older than max_age seconds.
+
+    Only one sync runs at a time per process; concurrent sessions keep using
+    the current cohort file instead of waiting.
+    """
+    last = _load_state().get("last_sync", 0)
+    if not force and COHORT_PATH.exists() and time.time() - last < max_age:
+        return None
+    if not _sync_lock.acquire(blocking=False):
+        return None
+    try:
+        return sync()
+    finally:
+        _sync_lock.release()
+
+
+# ---------------- Cohort ----------------
+def _yes_no(series: pd.Series) -> pd.Series:
+    return series.map({True: 1.0, False: 2.0}).astype("float32")
+
+
+def build_cohort() -> pd.DataFrame:
+    """One row per patient in the final_cleaned.csv column layout (plus live-only columns)."""
+    patients = read_table("Patient").set_index("id")
+
+    metals = read_table("BloodMetals").sort_values("createdAt")
+    latest_metals = metals.drop_duplicates("patientId", keep="last").set_index("patientId")
+
+    preds = read_table("Prediction").sort_values("createdAt")
+    latest_preds = (
+        preds.drop_duplicates(["patientId", "model"], keep="last")
+        .pivot(index="patientId", columns="model", values="value")
+    )
+
+    out = pd.DataFrame(index=patients.index)
+    for src, targets in METAL_UNITS.items():
+        values = pd.to_numeric(latest_metals[src], errors="coerce").reindex(out.index)
+        for col, factor in targets.items():
+            out[col] = values * factor
+
+    for model, col in HORMONE_PREDICTIONS.items():
+        out[col] = latest_preds[model].reindex(out.index) if model in latest_preds else np.nan
+    for model in latest_preds.columns.difference(list(HORMONE_PREDICTIONS)):
+        out[f"predicted_{model}"] = latest_preds[model].reindex(out.index)
+
+    gender = patients["gender"].str.lower()
+    pregnancies = pd.to_numeric(patients["pregnancyCount"], errors="coerce")
+    out["gender"] = gender.map({"male": 1.0, "female": 2.0})
+    out["age_years"] = pd.to_numeric(patients["ageYears"], errors="coerce")
+    out["marital_status"] = patients["maritalStatus"].map(MARITAL_STATUS_CODES)
+    out["pregnancy_status"] = _yes_no(patients["pregnancyStatus"])
+    out["pregnant_times"] = pregnancies
+    out["ever_pregnant"] = np.where(pregnancies.isna(), np.nan, np.where(pregnancies > 0, 1.0, 2.0))
+    out["vaginal_deliveries"] = pd.to_numeric(patients["vaginalDeliveries"], errors="coerce")
+    out["hysterectomy"] = _yes_no(patients["hadHysterectomy"])
+    out["ovaries_removed"] = _yes_no(patients["ovariesRemoved"])
+    out["female_hormones"] = _yes_no(patients["everUsedFemaleHormones"])
+    out["birth_control"] = _yes_no(patients["everUsedBirthControlPills"])
+
+    # same columns (and order) as the NHANES extract; anything not collected stays empty
+    layout = pd.read_csv(CSV_PATH, nrows=0).columns
+    extra = [c for c in out.columns if c not in layout]
+    out = out.reindex(columns=list(layout) + extra)
+    out["patient_updated_at"] = patients["updatedAt"]
+
+    numeric = out.columns.difference(["Blood metal weights", "patient_updated_at"])
+    out[numeric] = out[numeric].astype("float32")
+    return out.rename_axis("patient_id").reset_index()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sync the live cohort into .cache/live/")
+    parser.add_argument("--full", action="store_true", help="drop the local copy and re-read everything")
+    args = parser.parse_args()
+
+    if not enabled():
+        raise SystemExit("Set DASHBOARD_DB_URL to a (read-only) Postgres URL first.")
+    print(sync(full=args.full))
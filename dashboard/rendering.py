@@ -0,0 +1,229 @@
+"""
+Chart builders that keep what is sent to the browser bounded.
+
+Plotly figures embed their data, so a chart built straight from the cohort
+grows with it. The helpers here summarise on the server instead:
+
+- scatter(): WebGL (scattergl) points, stratified down to a point cap, or a
+  server-binned density heatmap; the OLS trendline is fitted on all rows
+- box_from_stats(): boxes drawn from precomputed quartiles/fences
+- violins(): per-group violins from a capped stratified sample
+- histogram(): bins counted with numpy, drawn as bars
+- missingness_figures(): per-column and per-row-block missing shares
+
+The point cap defaults to DASHBOARD_MAX_POINTS (5000) and can be changed
+from the sidebar. Samples and fits are cached per dataset version.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+
+DEFAULT_MAX_POINTS = int(os.environ.get("DASHBOARD_MAX_POINTS", 5000))
+SAMPLE_SEED = 42
+DENSITY_BINS = 60
+
+
+def render_settings():
+    """Sidebar controls shared by every chart; returns (max_points, density)."""
+    with st.sidebar.expander("Chart rendering"):
+        max_points = st.number_input(
+            "Max points per chart", min_value=500, max_value=100_000,
+            value=DEFAULT_MAX_POINTS, step=500, key="render_max_points",
+        )
+        density = st.radio(
+            "Large scatters", ["Sample points", "Density"], key="render_large_scatter",
+        ) == "Density"
+    return int(max_points), density
+
+
+# ---------------- Sampling and fits ----------------
+def stratified_sample(df: pd.DataFrame, n: int, by=None, seed: int = SAMPLE_SEED) -> pd.DataFrame:
+    """At most n rows, keeping each `by` group's share (every group keeps at least one row)."""
+    if len(df) <= n:
+        return df
+    if by is None or by not in df.columns:
+        return df.sample(n=n, random_state=seed)
+    groups = df.groupby(by, observed=True, dropna=False, sort=False)
+    quota = (groups.size() / len(df) * n).round().clip(lower=1).astype(int)
+    parts = [g.sample(n=min(len(g), quota[key]), random_state=seed) for key, g in groups]
+    return pd.concat(parts)
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _cached_sample(_df: pd.DataFrame, version, frame: str, columns: tuple, by, n: int):
+    return stratified_sample(_df[list(columns)].dropna(subset=[c for c in columns if c != by]), n, by)
+
+
+def sample_for_plot(df, version, frame: str, columns, n: int, by=None) -> pd.DataFrame:
+    """Cached stratified sample of the non-missing rows of `columns` (frame names the source)."""
+    columns = tuple(dict.fromkeys(c for c in columns if c))
+    return _cached_sample(df, version, frame, columns, by, n)
+
+
+def ols_fit(x: np.ndarray, y: np.ndarray):
+    """Closed-form least squares y = intercept + slope * x; returns (slope, intercept, r2, n)."""
+    mask = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[mask].astype(np.float64), y[mask].astype(np.float64)
+    n = len(x)
+    if n < 2:
+        return None
+    xm, ym = x.mean(), y.mean()
+    sxx = ((x - xm) ** 2).sum()
+    if sxx == 0:
+        return None
+    slope = ((x - xm) * (y - ym)).sum() / sxx
+    intercept = ym - slope * xm
+    ss_tot = ((y - ym) ** 2).sum()
+    r2 = 1 - ((y - intercept - slope * x) ** 2).sum() / ss_tot if ss_tot > 0 else np.nan
+    return {"slope": slope, "intercept": intercept, "r2": r2, "n": n,
+            "x_min": float(x.min()), "x_max": float(x.max())}
+
+
+@st.cache_resource(show_spinner=False, max_entries=256)
+def _cached_fit(_df: pd.DataFrame, version, frame: str, x: str, y: str):
+    return ols_fit(_df[x].to_numpy(dtype=np.float64), _df[y].to_numpy(dtype=np.float64))
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _cached_hist2d(_df: pd.DataFrame, version, frame: str, x: str, y: str, bins: int):
+    data = _df[[x, y]].dropna()
+    counts, xe, ye = np.histogram2d(data[x], data[y], bins=bins)
+    return counts, xe, ye
+
+
+# ---------------- Figures ----------------
+def scatter(df, x, y, *, version, frame, max_points, density=False, color=None,
+            trendline=False, title=None, labels=None, trendline_color="red"):
+    """Scatter of y against x that never embeds more than max_points rows.
+
+    Small data is drawn as-is with WebGL. Above the cap it is either a
+    stratified sample (by `color` when given) or a server-binned density
+    heatmap. The trendline is always fitted on every row.
+    """
+    labels = labels or {}
+    n_rows = int(df[[x, y]].notna().all(axis=1).sum())
+
+    if density and n_rows > max_points:
+        counts, xe, ye = _cached_hist2d(df, version, frame, x, y, DENSITY_BINS)
+        fig = go.Figure(go.Heatmap(
+            x=(xe[:-1] + xe[1:]) / 2, y=(ye[:-1] + ye[1:]) / 2, z=counts.T,
+            colorscale="Blues", colorbar=dict(title="Rows"),
+            zmin=0, hoverongaps=False,
+        ))
+        fig.update_layout(title=title, xaxis_title=labels.get(x, x), yaxis_title=labels.get(y, y))
+        shown = n_rows
+    else:
+        data = sample_for_plot(df, version, frame, [x, y, color], max_points, by=color)
+        fig = px.scatter(data, x=x, y=y, color=color, title=title, labels=labels, render_mode="webgl")
+        shown = len(data)
+
+    if trendline:
+        fit = _cached_fit(df, version, frame, x, y)
+        if fit is not None:
+            xs = np.array([fit["x_min"], fit["x_max"]])
+            fig.add_trace(go.Scattergl(
+                x=xs, y=fit["intercept"] + fit["slope"] * xs, mode="lines",
+                line=dict(color=trendline_color), name="OLS trendline",
+                hovertemplate=(f"y = {fit['intercept']:.4g} + {fit['slope']:.4g}·x"
+                               f"<br>R² = {fit['r2']:.3f}, n = {fit['n']:,}<extra></extra>"),
+            ))
+    return fig, shown, n_rows
+
+
+def box_stats(df: pd.DataFrame, group: str, value: str) -> pd.DataFrame:
+    """Quartiles, whisker fences (1.5 IQR, clipped to the data) and mean per group."""
+    data = df[[group, value]].dropna()
+    g = data.groupby(group, observed=True)[value]
+    stats = pd.DataFrame({
+        "q1": g.quantile(0.25), "median": g.median(), "q3": g.quantile(0.75),
+        "mean": g.mean(), "min": g.min(), "max": g.max(), "n": g.size(),
+    })
+    iqr = stats["q3"] - stats["q1"]
+    stats["lowerfence"] = np.maximum(stats["q1"] - 1.5 * iqr, stats["min"])
+    stats["upperfence"] = np.minimum(stats["q3"] + 1.5 * iqr, stats["max"])
+    return stats
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def _cached_box_stats(_df, version, frame: str, group: str, value: str):
+    return box_stats(_df, group, value)
+
+
+def box_from_stats(df, group, value, *, version, frame, horizontal=False, order=None,
+                   title=None, labels=None):
+    """Box plot whose boxes come from precomputed statistics, one trace per group."""
+    labels = labels or {}
+    stats = _cached_box_stats(df, version, frame, group, value)
+    keys = [k for k in (order or stats.index) if k in stats.index]
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, key in enumerate(keys):
+        s = stats.loc[key]
+        pos = [key]
+        box = dict(
+            q1=[s.q1], median=[s["median"]], q3=[s.q3], mean=[s["mean"]],
+            lowerfence=[s.lowerfence], upperfence=[s.upperfence],
+            name=str(key), marker_color=colors[i % len(colors)],
+            hovertext=f"n = {int(s.n):,}",
+        )
+        fig.add_trace(go.Box(y=pos, orientation="h", **box) if horizontal else go.Box(x=pos, **box))
+    fig.update_layout(
+        title=title, showlegend=True,
+        xaxis_title=labels.get(value if horizontal else group, value if horizontal else group),
+        yaxis_title=labels.get(group if horizontal else value, group if horizontal else value),
+    )
+    return fig
+
+
+def violins(groups: dict, value: str, *, version, frame, max_points, title=None, xaxis_title=None):
+    """Raincloud-style violins from a capped sample per group (`groups` maps label -> frame)."""
+    per_group = max(max_points // max(len(groups), 1), 50)
+    fig = go.Figure()
+    shown = total = 0
+    for status, g in groups.items():
+        data = sample_for_plot(g, version, f"{frame}:{status}", [value], per_group)
+        shown += len(data)
+        total += int(g[value].notna().sum())
+        fig.add_trace(go.Violin(
+            x=[status] * len(data), y=data[value], name=str(status),
+            box_visible=True, meanline_visible=True, points='all', jitter=0.3, pointpos=-1.8,
+        ))
+    fig.update_layout(title_text=title, xaxis_title=xaxis_title, showlegend=False)
+    return fig, shown, total
+
+
+def histogram(series: pd.Series, nbins: int = 40, title=None):
+    values = series.dropna().to_numpy(dtype=np.float64)
+    counts, edges = np.histogram(values, bins=nbins) if len(values) else (np.array([]), np.array([0.0]))
+    fig = go.Figure(go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+        marker_line_width=0,
+    ))
+    fig.update_layout(title=title, xaxis_title=series.name, yaxis_title="count", bargap=0)
+    return fig
+
+
+def missingness_figures(missing: dict):
+    """Per-column bar and row-block heatmap from the summaries in aggregates.py."""
+    by_col = missing["by_column"]
+    fig_cols = px.bar(
+        by_col.reset_index(), x="column", y="missing_pct",
+        title="Missing Values per Column (%)", labels={"missing_pct": "Missing (%)", "column": ""},
+    )
+    blocks = missing["by_block"]
+    fig_blocks = px.imshow(
+        blocks, aspect="auto", zmin=0, zmax=1, color_continuous_scale="Greys",
+        title=f"Share of Missing Values per Block of {missing['block_rows']:,} Rows",
+        labels=dict(x="Column", y="Row block", color="Missing share"),
+    )
+    return fig_cols, fig_blocks
+
+
+def point_cap_note(shown: int, total: int):
+    if shown < total:
+        st.caption(f"Showing a stratified sample of {shown:,} of {total:,} rows; "
+                   "the trendline and statistics use all rows.")
@@ -0,0 +1,225 @@
+"""
+Association rules between blood metal levels, hormones and reproductive outcomes.
+
+The mining from apriori.ipynb as a module the dashboard can call:
+
+1. discretize(): metals are put into the low / medium / high risk bands the
+   infertility model uses (METAL_RISK_THRESHOLDS, mirrored from
+   ml-service/app/preprocess/infertility_preprocessor.py), age and hormones
+   into quantile bins, and the yes/no answers into items. A missing value
+   gives no item (it is not imputed).
+2. frequent_itemsets(): Apriori over a bit-packed item matrix. Every item is
+   one bit per respondent, so the support of a candidate is a popcount of an
+   AND of its parent's bits with one more item; only the previous level's
+   bitsets are kept. Items of the same variable are never combined.
+3. association_rules(): confidence, lift, leverage and conviction for every
+   split of every frequent itemset.
+
+Rules are mined once per dataset version down to MIN_SUPPORT_FLOOR and
+pickled under .cache/ (like aggregates.py); filter_rules() then applies the
+interactive support / confidence / lift thresholds to that table.
+
+    python rules.py        # mine for the current dataset and print the top rules
+"""
+import os
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregates import CACHE_DIR
+
+# Bump when the items or the rule table change
+RULES_VERSION = 1
+
+MIN_SUPPORT_FLOOR = 0.01
+MAX_ITEMSET_LEN = 4
+
+# Same bands as METAL_RISK_THRESHOLDS in the infertility preprocessor: (low, medium] upper bounds
+METAL_RISK_THRESHOLDS = {
+    'lead_µg/dL': (1.0, 2.0),
+    'cadmium_µg/L': (0.3, 0.5),
+    'mercury_µg/L': (1.0, 3.0),
+    'selenium_µg/L': (120, 180),
+    'manganese_µg/L': (8.0, 12.0),
+}
+RISK_LABELS = ['low', 'medium', 'high']
+
+# Continuous variables binned into quantiles
+QUANTILE_COLS = {'age_years': 4, 'testosterone': 3, 'estradiol': 3, 'shbg': 3}
+
+# Coded answers (1 = yes, 2 = no)
+OUTCOME_COLS = {
+    'infertility_1yr': 'infertility',
+    'regular_periods': 'regular_periods',
+}
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def _variable(item: str) -> str:
+    return item.split('=', 1)[0]
+
+
+def discretize(df: pd.DataFrame) -> pd.DataFrame:
+    """Boolean item matrix (rows x items, columns named "variable=value")."""
+    items = {}
+    for col, (low, medium) in METAL_RISK_THRESHOLDS.items():
+        bands = pd.cut(df[col], bins=[-np.inf, low, medium, np.inf], labels=RISK_LABELS)
+        name = col.split('_')[0]
+        for label in RISK_LABELS:
+            items[f"{name}={label}"] = (bands == label).to_numpy()
+
+    for col, q in QUANTILE_COLS.items():
+        values = df[col]
+        if values.notna().sum() < q:
+            continue
+        bins = pd.qcut(values, q, duplicates='drop')
+        for interval in bins.cat.categories:
+            items[f"{col}={interval.left:g}-{interval.right:g}"] = (bins == interval).to_numpy()
+
+    for col, name in OUTCOME_COLS.items():
+        items[f"{name}=yes"] = (df[col] == 1).to_numpy()
+        items[f"{name}=no"] = (df[col] == 2).to_numpy()
+
+    # mine over respondents who answered at least one outcome question
+    answered = df[list(OUTCOME_COLS)].isin([1, 2]).any(axis=1).to_numpy()
+    return pd.DataFrame(items)[answered].reset_index(drop=True)
+
+
+def frequent_itemsets(items: pd.DataFrame, min_support: float = MIN_SUPPORT_FLOOR,
+                      max_len: int = MAX_ITEMSET_LEN) -> pd.DataFrame:
+    """Itemsets with support >= min_support (itemset as a tuple of item names, support, count)."""
+    n = len(items)
+    if n == 0:
+        return pd.DataFrame(columns=['itemset', 'support', 'count'])
+    min_count = int(np.ceil(min_support * n))
+    names = list(items.columns)
+    variables = [_variable(c) for c in names]
+    # one row of packed bits per item
+    bits = np.packbits(items.to_numpy(dtype=bool).T, axis=1)
+
+    def count(b):
+        return int(_POPCOUNT[b].sum())
+
+    level = {}
+    for i in range(len(names)):
+        c = count(bits[i])
+        if c >= min_count:
+            level[(i,)] = (bits[i], c)
+
+    found = {k: v[1] for k, v in level.items()}
+    for _ in range(2, max_len + 1):
+        keys = sorted(level)
+        nxt = {}
+        # join itemsets sharing all but their last item (Apriori candidate generation)
+        for a_idx, a in enumerate(keys):
+            for b in keys[a_idx + 1:]:
+                if a[:-1] != b[:-1]:
+                    break
+                last = b[-1]
+                if variables[last] in {variables[i] for i in a}:
+                    continue
+                cand = a + (last,)
+                if any(sub not in level for sub in combinations(cand, len(cand) - 1)):
+                    continue
+                vec = level[a][0] & bits[last]
+                c = count(vec)
+                if c >= min_count:
+                    nxt[cand] = (vec, c)
+        if not nxt:
+            break
+        found.update({k: v[1] for k, v in nxt.items()})
+        level = nxt
+
+    return pd.DataFrame({
+        'itemset': [tuple(names[i] for i in k) for k in found],
+        'support': [c / n for c in found.values()],
+        'count': list(found.values()),
+    })
+
+
+def association_rules(itemsets: pd.DataFrame) -> pd.DataFrame:
+    """Every antecedent -> consequent split of every frequent itemset of two or more items."""
+    support = {frozenset(s): v for s, v in zip(itemsets['itemset'], itemsets['support'])}
+    rows = []
+    for itemset, supp in zip(itemsets['itemset'], itemsets['support']):
+        if len(itemset) < 2:
+            continue
+        full = frozenset(itemset)
+        for k in range(1, len(itemset)):
+            for antecedent in combinations(itemset, k):
+                a = frozenset(antecedent)
+                c = full - a
+                confidence = supp / support[a]
+                c_supp = support[c]
+                rows.append((
+                    tuple(sorted(a)), tuple(sorted(c)), supp, confidence,
+                    confidence / c_supp, supp - support[a] * c_supp,
+                    (1 - c_supp) / (1 - confidence) if confidence < 1 else np.inf,
+                ))
+    return pd.DataFrame(rows, columns=[
+        'antecedents', 'consequents', 'support', 'confidence', 'lift', 'leverage', 'conviction',
+    ])
+
+
+def mine(df: pd.DataFrame, min_support: float = MIN_SUPPORT_FLOOR, max_len: int = MAX_ITEMSET_LEN) -> dict:
+    items = discretize(df)
+    itemsets = frequent_itemsets(items, min_support, max_len)
+    return {
+        "rules": association_rules(itemsets),
+        "itemsets": itemsets,
+        "transactions": len(items),
+        "items": list(items.columns),
+        "min_support": min_support,
+    }
+
+
+def filter_rules(rules: pd.DataFrame, min_support=0.05, min_confidence=0.0, min_lift=1.0,
+                 consequent_prefix=None, top=None) -> pd.DataFrame:
+    """Rules above the thresholds, optionally only those whose consequent is one variable."""
+    keep = (rules['support'] >= min_support) & (rules['confidence'] >= min_confidence) & (rules['lift'] >= min_lift)
+    if consequent_prefix:
+        keep &= rules['consequents'].map(lambda c: all(_variable(i) == consequent_prefix for i in c))
+    out = rules[keep].sort_values(['lift', 'confidence'], ascending=False)
+    return out.head(top) if top else out
+
+
+def cache_key(path) -> str:
+    st_ = os.stat(path)
+    return f"{Path(path).name}-{st_.st_mtime_ns}-{st_.st_size}-s{MIN_SUPPORT_FLOOR}-l{MAX_ITEMSET_LEN}-v{RULES_VERSION}"
+
+
+def load_or_mine(path, load_df) -> dict:
+    """Mined rules for the dataset at `path`, read from .cache/ or mined and written there."""
+    target = CACHE_DIR / f"rules-{cache_key(path)}.pkl"
+    if target.exists():
+        try:
+            return pd.read_pickle(target)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable rules cache {target.name}: {e}")
+
+    result = mine(load_df())
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    tmp = target.with_suffix(".tmp")
+    pd.to_pickle(result, tmp)
+    os.replace(tmp, target)
+    for old in CACHE_DIR.glob(f"rules-{Path(path).name}-*.pkl"):
+        if old != target:
+            old.unlink(missing_ok=True)
+    return result
+
+
+# Columns discretize() reads
+SOURCE_COLS = list(METAL_RISK_THRESHOLDS) + list(QUANTILE_COLS) + list(OUTCOME_COLS)
+
+
+if __name__ == "__main__":
+    from convert_data import read_dataset, resolve_source
+
+    src = resolve_source()
+    result = load_or_mine(src, lambda: read_dataset(src, SOURCE_COLS))
+    print(f"{len(result['rules']):,} rules from {result['transactions']:,} respondents")
+    print(filter_rules(result['rules'], min_lift=1.2, top=20).to_string(index=False))
@@ -1,10 +1,61 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
-    database_url: str
+    database_url: Optional[str] = None
     port: int = 8000
 
+    # --- Persistence backend ---
+    # "prisma" (Postgres, default), "memory" (in-process, nothing persisted)
+    # or "sqlite" (in-process, written through to sqlite_path)
+    db_backend: str = "prisma"
+    sqlite_path: str = "ml_service.sqlite3"
+
+    # --- Connection pool (Prisma query engine) ---
+    db_pool_size: int = 10          # connections; also caps concurrent queries from this worker
+    db_pool_timeout: float = 10.0   # seconds to wait for a free connection
+    db_connect_timeout: int = 10    # seconds for the initial engine connect
+
+    # --- Bulk prediction writes ---
+    # "prisma" (create_many) or "asyncpg" (dedicated pool, COPY/executemany)
+    db_bulk_writer: str = "prisma"
+    asyncpg_pool_min: int = 1
+    asyncpg_pool_max: int = 10
+    asyncpg_command_timeout: float = 10.0
+    asyncpg_copy_threshold: int = 50  # rows; smaller batches use executemany
+
+    # --- Response compression (brotli, gzip fallback) ---
+    compression_min_size: int = 1024  # bytes; smaller responses go out uncompressed
+
+    # --- Precomputed sensitivity / SHAP artifacts ---
+    artifacts_enabled: bool = True
+    artifact_compress_level: int = 6  # zlib level for stored payloads
+
+    # --- Model hot reload (see app/services/model_registry.py) ---
+    model_reload_interval: float = 10.0  # seconds between checks of app/models/saved; 0 disables
+
+    # --- Shadow scoring of candidate models (see app/services/shadow_service.py) ---
+    shadow_enabled: bool = True         # candidates come from the manifest's "shadow" section
+    shadow_sample_rate: float = 1.0     # share of predict requests the candidates also score
+    shadow_store_path: str = "shadow.sqlite3"
+
+    # --- Cohort partial dependence / ICE (see app/services/cohort_service.py) ---
+    cohort_store_path: str = "cohort.sqlite3"
+
+    # --- Auth ---
+    jwt_cache_size: int = 1024  # verified tokens kept (LRU); entries expire with the token's exp
+
+    # --- Inference scheduler (see app/services/scheduler.py) ---
+    inference_workers: int = 4      # threads running model work
+    interactive_weight: float = 8.0
+    interactive_limit: int = 0      # max concurrent jobs per lane; 0 = every worker
+    explanation_weight: float = 3.0
+    explanation_limit: int = 3
+    bulk_weight: float = 1.0
+    bulk_limit: int = 2             # keeps workers free for interactive requests
+
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 settings = Settings()
@@ -1,9 +1,114 @@
-from prisma import Prisma
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-db = Prisma()
+from fastapi import HTTPException
+
+from app.core.config import settings
+
+def pooled_url(url: str) -> str:
+    """Add the engine pool params (connection_limit/pool_timeout) unless the URL sets them."""
+    parts = urlsplit(url)
+    params = dict(parse_qsl(parts.query, keep_blank_values=True))
+    params.setdefault("connection_limit", str(settings.db_pool_size))
+    params.setdefault("pool_timeout", str(int(settings.db_pool_timeout)))
+    return urlunsplit(parts._replace(query=urlencode(params)))
+
+def create_client():
+    """Build the persistence client selected by DB_BACKEND.
+
+    Every backend exposes the Prisma client surface the service uses
+    (connect/disconnect and db.<model>.create/find_*), so routes keep
+    importing the global `db` regardless of what sits behind it.
+    """
+    backend = settings.db_backend.lower()
+    if backend == "prisma":
+        from prisma import Prisma
+        datasource = {"url": pooled_url(settings.database_url)} if settings.database_url else None
+        return Prisma(datasource=datasource, connect_timeout=settings.db_connect_timeout)
+    if backend == "memory":
+        from app.core.local_db import LocalClient
+        return LocalClient()
+    if backend == "sqlite":
+        from app.core.local_db import LocalClient
+        return LocalClient(path=settings.sqlite_path)
+    raise ValueError(f"Unknown DB_BACKEND: {settings.db_backend}")
+
+db = create_client()
+
+def use_asyncpg() -> bool:
+    return settings.db_backend.lower() == "prisma" and settings.db_bulk_writer.lower() == "asyncpg"
+
+
+class PoolMetrics:
+    """Acquisition counters for the connection slots handed out by acquire()."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.hold_total = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "size": self.size,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "utilization": self.in_use / self.size if self.size else 0.0,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": 1000 * self.wait_total / self.acquired if self.acquired else 0.0,
+            "max_wait_ms": 1000 * self.wait_max,
+            "avg_hold_ms": 1000 * self.hold_total / self.acquired if self.acquired else 0.0,
+        }
+
+
+pool_metrics = PoolMetrics(settings.db_pool_size)
+_slots = asyncio.Semaphore(settings.db_pool_size)
+
+@asynccontextmanager
+async def acquire():
+    """Wait for one of db_pool_size slots before touching the database.
+
+    Mirrors the engine's connection_limit, so queueing happens here where it
+    can be measured (and bounded by db_pool_timeout) instead of inside the engine.
+    """
+    t0 = time.perf_counter()
+    pool_metrics.waiting += 1
+    try:
+        await asyncio.wait_for(_slots.acquire(), timeout=settings.db_pool_timeout)
+    except asyncio.TimeoutError:
+        pool_metrics.timeouts += 1
+        raise HTTPException(status_code=503, detail="Database busy, try again")
+    finally:
+        pool_metrics.waiting -= 1
+
+    waited = time.perf_counter() - t0
+    pool_metrics.acquired += 1
+    pool_metrics.wait_total += waited
+    pool_metrics.wait_max = max(pool_metrics.wait_max, waited)
+    pool_metrics.in_use += 1
+    held_from = time.perf_counter()
+    try:
+        yield db
+    finally:
+        pool_metrics.in_use -= 1
+        pool_metrics.hold_total += time.perf_counter() - held_from
+        _slots.release()
 
 async def init_db():
     await db.connect()
+    if use_asyncpg():
+        from app.core import pg_pool
+        await pg_pool.init_pool()
 
 async def close_db():
+    if use_asyncpg():
+        from app.core import pg_pool
+        await pg_pool.close_pool()
     await db.disconnect()
@@ -0,0 +1,288 @@
+# app/core/local_db.py
+"""
+In-process stand-in for the Prisma client.
+
+Selected with DB_BACKEND=memory or DB_BACKEND=sqlite (see app/core/db.py).
+It mirrors the slice of the prisma-client-py API the service calls, so
+load tests and local runs can drive the real routes without Postgres.
+Rows live in memory; the sqlite variant writes them through to a file so
+they survive a restart.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from app.utils.ids import new_id
+
+# Model names as exposed on the client (db.<name>), see prisma/schema.prisma
+TABLES = ("user", "role", "userrole", "patient", "bloodmetals", "prediction", "patientartifact", "accesslog")
+
+# Models carrying an @updatedAt column
+UPDATED_AT = {"patient", "bloodmetals"}
+
+# @unique / @@unique constraints (besides id), used by skip_duplicates
+UNIQUE = {
+    "user": [("email",), ("googleId",)],
+    "role": [("name",)],
+    "patient": [("nic",)],
+    "patientartifact": [("patientId", "kind", "model", "modelVersion", "featureHash")],
+    "prediction": [("idempotencyKey", "model")],
+}
+
+# Relations resolvable through include=: model -> {field: (related model, foreign key)}
+RELATIONS = {
+    "patient": {
+        "bloodMetals": ("bloodmetals", "patientId"),
+        "predictions": ("prediction", "patientId"),
+        "artifacts": ("patientartifact", "patientId"),
+    },
+}
+
+FILTER_OPS = {"equals", "not", "in", "not_in", "gt", "gte", "lt", "lte"}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Record(dict):
+    """Row with attribute access, like the pydantic models Prisma returns."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def model_dump(self) -> Dict:
+        return dict(self)
+
+
+def _match_op(value, op, arg) -> bool:
+    if op == "equals":
+        return value == arg
+    if op == "not":
+        return value != arg
+    if op == "in":
+        return value in arg
+    if op == "not_in":
+        return value not in arg
+    if value is None:
+        return False
+    if op == "gt":
+        return value > arg
+    if op == "gte":
+        return value >= arg
+    if op == "lt":
+        return value < arg
+    if op == "lte":
+        return value <= arg
+    raise ValueError(f"Unsupported filter: {op}")
+
+
+def _matches(row: Dict, where: Optional[Dict]) -> bool:
+    for field, cond in (where or {}).items():
+        if isinstance(cond, dict) and set(cond) <= FILTER_OPS:
+            if not all(_match_op(row.get(field), op, arg) for op, arg in cond.items()):
+                return False
+        elif isinstance(cond, dict):
+            # compound unique key, e.g. {"patientId_model": {"patientId": .., "model": ..}}
+            if not _matches(row, cond):
+                return False
+        elif row.get(field) != cond:
+            return False
+    return True
+
+
+def _sort(rows: List[Dict], order) -> List[Dict]:
+    if not order:
+        return rows
+    for spec in reversed(order if isinstance(order, list) else [order]):
+        for field, direction in spec.items():
+            rows = sorted(
+                rows,
+                key=lambda r: (r.get(field) is None, r.get(field)),
+                reverse=str(direction).lower() == "desc",
+            )
+    return rows
+
+
+class LocalTable:
+    def __init__(self, client: "LocalClient", name: str):
+        self._client = client
+        self._name = name
+        self._rows: Dict[str, Dict] = {}
+
+    # --- helpers ---
+    def _new_row(self, data: Dict) -> Dict:
+        now = _now()
+        row = {"id": new_id(), "createdAt": now}
+        if self._name in UPDATED_AT:
+            row["updatedAt"] = now
+        row.update(data)
+        return row
+
+    def _conflicts(self, row: Dict) -> bool:
+        if row["id"] in self._rows:
+            return True
+        for fields in UNIQUE.get(self._name, []):
+            key = tuple(row.get(f) for f in fields)
+            if any(v is None for v in key):
+                continue
+            if any(tuple(r.get(f) for f in fields) == key for r in self._rows.values()):
+                return True
+        return False
+
+    def _select(self, where=None, order=None, take=None, skip=None) -> List[Dict]:
+        rows = [r for r in self._rows.values() if _matches(r, where)]
+        rows = _sort(rows, order)
+        if skip:
+            rows = rows[skip:]
+        if take is not None:
+            rows = rows[:take]
+        return rows
+
+    def _output(self, row: Dict, include: Optional[Dict] = None) -> Record:
+        out = Record(row)
+        for field, spec in (include or {}).items():
+            if not spec or field not in RELATIONS.get(self._name, {}):
+                continue
+            related, fk = RELATIONS[self._name][field]
+            args = spec if isinstance(spec, dict) else {}
+            where = {**(args.get("where") or {}), fk: row["id"]}
+            rows = self._client.table(related)._select(where, args.get("order_by"), args.get("take"))
+            out[field] = [Record(r) for r in rows]
+        return out
+
+    # --- Prisma client surface ---
+    async def create(self, data: Dict, include: Optional[Dict] = None) -> Record:
+        row = self._new_row(data)
+        if self._conflicts(row):
+            raise ValueError(f"Unique constraint failed on {self._name}")
+        self._rows[row["id"]] = row
+        await self._client.persist(self._name, [row])
+        return self._output(row, include)
+
+    async def create_many(self, data: List[Dict], skip_duplicates: bool = False) -> int:
+        created = []
+        for item in data:
+            row = self._new_row(item)
+            if self._conflicts(row):
+                if skip_duplicates:
+                    continue
+                raise ValueError(f"Unique constraint failed on {self._name}")
+            self._rows[row["id"]] = row
+            created.append(row)
+        await self._client.persist(self._name, created)
+        return len(created)
+
+    async def find_unique(self, where: Dict, include: Optional[Dict] = None) -> Optional[Record]:
+        rows = self._select(where, take=1)
+        return self._output(rows[0], include) if rows else None
+
+    async def find_first(self, where: Optional[Dict] = None, include: Optional[Dict] = None,
+                         order=None) -> Optional[Record]:
+        rows = self._select(where, order, take=1)
+        return self._output(rows[0], include) if rows else None
+
+    async def find_many(self, where: Optional[Dict] = None, include: Optional[Dict] = None,
+                        order=None, take: Optional[int] = None, skip: Optional[int] = None) -> List[Record]:
+        return [self._output(r, include) for r in self._select(where, order, take, skip)]
+
+    async def count(self, where: Optional[Dict] = None) -> int:
+        return len(self._select(where))
+
+    async def update(self, where: Dict, data: Dict, include: Optional[Dict] = None) -> Optional[Record]:
+        rows = self._select(where, take=1)
+        if not rows:
+            return None
+        row = rows[0]
+        row.update(data)
+        if self._name in UPDATED_AT:
+            row["updatedAt"] = _now()
+        await self._client.persist(self._name, [row])
+        return self._output(row, include)
+
+    async def upsert(self, where: Dict, data: Dict, include: Optional[Dict] = None) -> Record:
+        existing = await self.update(where, data.get("update", {}), include)
+        if existing is not None:
+            return existing
+        return await self.create(data.get("create", {}), include)
+
+    async def delete_many(self, where: Optional[Dict] = None) -> int:
+        rows = self._select(where)
+        for row in rows:
+            del self._rows[row["id"]]
+        await self._client.unpersist(self._name, [r["id"] for r in rows])
+        return len(rows)
+
+
+class LocalClient:
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._tables = {name: LocalTable(self, name) for name in TABLES}
+        self._connected = False
+
+    def __getattr__(self, name):
+        tables = self.__dict__.get("_tables", {})
+        if name in tables:
+            return tables[name]
+        raise AttributeError(name)
+
+    def table(self, name: str) -> LocalTable:
+        return self._tables[name]
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def connect(self):
+        if self._path:
+            await asyncio.to_thread(self._open)
+        self._connected = True
+
+    async def disconnect(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+            self._conn = None
+        self._connected = False
+
+    # --- sqlite write-through ---
+    def _open(self):
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records (model TEXT, id TEXT, data TEXT, PRIMARY KEY (model, id))"
+        )
+        for model, data in self._conn.execute("SELECT model, data FROM records"):
+            if model not in self._tables:
+                continue
+            row = json.loads(data)
+            for key, value in row.items():
+                if key.endswith("At") and isinstance(value, str):
+                    row[key] = datetime.fromisoformat(value)
+            self._tables[model]._rows[row["id"]] = row
+
+    def _write(self, sql: str, params: List[tuple]):
+        with self._lock:
+            self._conn.executemany(sql, params)
+            self._conn.commit()
+
+    async def persist(self, model: str, rows: List[Dict]):
+        if self._conn is None or not rows:
+            return
+        params = [(model, r["id"], json.dumps(r, default=str)) for r in rows]
+        await asyncio.to_thread(
+            self._write, "INSERT OR REPLACE INTO records (model, id, data) VALUES (?, ?, ?)", params
+        )
+
+    async def unpersist(self, model: str, ids: List[str]):
+        if self._conn is None or not ids:
+            return
+        await asyncio.to_thread(
+            self._write, "DELETE FROM records WHERE model = ? AND id = ?", [(model, i) for i in ids]
+        )
@@ -0,0 +1,111 @@
+# app/core/pg_pool.py
+"""
+Dedicated asyncpg pool for bulk Prediction writes.
+
+Enabled with DB_BULK_WRITER=asyncpg. Batches are written with COPY
+(copy_records_to_table) above asyncpg_copy_threshold rows and with a
+single executemany below it, bypassing the Prisma query engine queue.
+Batches carrying an idempotency key always take the executemany path with
+ON CONFLICT DO NOTHING (COPY can't skip rows a retry already wrote).
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import asyncpg
+
+from app.core.config import settings
+from app.utils.ids import new_id
+
+# Query params understood by the Prisma engine but rejected by asyncpg
+PRISMA_ONLY_PARAMS = {"schema", "connection_limit", "pool_timeout", "pgbouncer",
+                      "socket_timeout", "statement_cache_size", "connect_timeout"}
+
+PREDICTION_COLUMNS = ["id", "patientId", "model", "value", "modelVersion", "idempotencyKey", "createdAt"]
+
+pool: Optional[asyncpg.Pool] = None
+_schema: Optional[str] = None
+_stats = {"batches": 0, "rows": 0, "copy_batches": 0, "errors": 0}
+
+
+def asyncpg_dsn(url: str):
+    """Strip Prisma-only params; returns (dsn, schema)."""
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    schema = dict(params).get("schema")
+    kept = [(k, v) for k, v in params if k not in PRISMA_ONLY_PARAMS]
+    return urlunsplit(parts._replace(query=urlencode(kept))), schema
+
+
+async def init_pool():
+    global pool, _schema
+    if not settings.database_url:
+        raise RuntimeError("DB_BULK_WRITER=asyncpg requires DATABASE_URL")
+    dsn, _schema = asyncpg_dsn(settings.database_url)
+    server_settings = {"search_path": _schema} if _schema else None
+    pool = await asyncpg.create_pool(
+        dsn,
+        min_size=settings.asyncpg_pool_min,
+        max_size=settings.asyncpg_pool_max,
+        command_timeout=settings.asyncpg_command_timeout,
+        server_settings=server_settings,
+    )
+
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+async def write_predictions(rows: List[Dict]) -> int:
+    """Insert Prediction rows ({patientId, model, value, modelVersion, idempotencyKey}) in one round trip."""
+    if pool is None:
+        raise RuntimeError("asyncpg pool not initialised")
+    # Prisma fills id/createdAt client-side, so the raw path must too
+    created_at = datetime.now(timezone.utc).replace(tzinfo=None)
+    records = [(new_id(), r["patientId"], r["model"], float(r["value"]), r.get("modelVersion"),
+                r.get("idempotencyKey"), created_at)
+               for r in rows]
+    idempotent = any(r[5] is not None for r in records)
+
+    try:
+        async with pool.acquire(timeout=settings.db_pool_timeout) as conn:
+            if len(records) >= settings.asyncpg_copy_threshold and not idempotent:
+                await conn.copy_records_to_table(
+                    "Prediction", records=records, columns=PREDICTION_COLUMNS, schema_name=_schema
+                )
+                _stats["copy_batches"] += 1
+            else:
+                table = f'"{_schema}"."Prediction"' if _schema else '"Prediction"'
+                columns = ", ".join(f'"{c}"' for c in PREDICTION_COLUMNS)
+                conflict = ' ON CONFLICT ("idempotencyKey", "model") DO NOTHING' if idempotent else ""
+                await conn.executemany(
+                    f"INSERT INTO {table} ({columns}) VALUES ($1, $2, $3, $4, $5, $6, $7){conflict}",
+                    records,
+                )
+    except Exception:
+        _stats["errors"] += 1
+        raise
+
+    _stats["batches"] += 1
+    _stats["rows"] += len(records)
+    return len(records)
+
+
+def pool_stats() -> Dict:
+    if pool is None:
+        return {"enabled": False}
+    size, idle = pool.get_size(), pool.get_idle_size()
+    max_size = pool.get_max_size()
+    return {
+        "enabled": True,
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "min_size": pool.get_min_size(),
+        "max_size": max_size,
+        "utilization": (size - idle) / max_size if max_size else 0.0,
+        **_stats,
+    }
@@ -1,7 +1,15 @@
+import asyncio
+
 from fastapi import FastAPI
 from fastapi.concurrency import asynccontextmanager
+from brotli_asgi import BrotliMiddleware
 from app.routes.predict import router as predict_router
+from app.routes.metrics import router as metrics_router
+from app.routes.whatif import router as whatif_router
 from app.core.db import init_db, close_db
+from app.core.config import settings
+from app.services.model_registry import registry
+from app.services.scheduler import scheduler
 from dotenv import load_dotenv
 import os
 
@@ -11,15 +19,26 @@ load_dotenv()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    watcher = None
+    if settings.model_reload_interval > 0:
+        watcher = asyncio.create_task(registry.watch(settings.model_reload_interval))
     try:
         yield
     finally:
+        if watcher is not None:
+            watcher.cancel()
+        scheduler.shutdown()
         await close_db()
 
 app = FastAPI(title="ML Prediction Service",lifespan=lifespan)
 
+# Negotiated compression: br when accepted, gzip otherwise (streamed responses included)
+app.add_middleware(BrotliMiddleware, minimum_size=settings.compression_min_size, gzip_fallback=True)
+
 # Register routes
 app.include_router(predict_router, prefix="/predict", tags=["Prediction"])
+app.include_router(whatif_router, prefix="/predict", tags=["Prediction"])
+app.include_router(metrics_router, prefix="/metrics", tags=["Metrics"])
 
 if __name__ == "__main__":
     import uvicorn
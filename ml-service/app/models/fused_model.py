@@ -0,0 +1,78 @@
+# models/fused_model.py
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from .joblib_model import JoblibModel
+
+
+class FusedModel:
+    """Multi-output model serving several sub-models of a grouped key in one call.
+
+    Written by scripts/train.py (--models hormone) as a dict artifact:
+    {"model": pipeline, "outputs": [...], "input_key": "hormone",
+     "target_mean": [...], "target_scale": [...], "background": DataFrame}.
+    Sub-models of the group not in "outputs" keep their own files.
+    The pipeline is fit on standardised targets so no output dominates the
+    shared splits; predict() returns them in their original units.
+    """
+
+    def __init__(self, base: JoblibModel):
+        meta = base.meta
+        self.model = base.model
+        self.outputs = list(meta["outputs"])
+        self.input_key = meta["input_key"]  # feature mapper key of the input row
+        self.target_mean = np.asarray(meta.get("target_mean", 0.0), dtype=float)
+        self.target_scale = np.asarray(meta.get("target_scale", 1.0), dtype=float)
+        self.background = meta.get("background")  # model-ready training rows, for SHAP
+        self.columns = list(getattr(self.model, "feature_names_in_", []))
+
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        """(rows, outputs) in original units."""
+        pred = np.asarray(self.model.predict(df), dtype=float).reshape(len(df), len(self.outputs))
+        return pred * self.target_scale + self.target_mean
+
+    def views(self) -> Dict[str, "OutputView"]:
+        return {name: OutputView(self, i) for i, name in enumerate(self.outputs)}
+
+
+class _OutputPredictor:
+    """predict() of one output, accepting the plain arrays SHAP's explainers pass in."""
+
+    def __init__(self, fused: FusedModel, index: int):
+        self.fused = fused
+        self.index = index
+
+    def predict(self, X) -> np.ndarray:
+        if not isinstance(X, pd.DataFrame):
+            X = pd.DataFrame(np.asarray(X).reshape(-1, len(self.fused.columns)), columns=self.fused.columns)
+        return np.ascontiguousarray(self.fused.predict(X)[:, self.index])
+
+
+class OutputView:
+    """One output of a FusedModel, usable wherever a single-output model is
+    (sub-model entries of ModelSet.models, sensitivity, SHAP, shadow scoring).
+
+    It reads the fused model's input row (`input_key`) rather than the
+    per-hormone one; see inference.model_input.
+    """
+
+    def __init__(self, fused: FusedModel, index: int):
+        self.fused = fused
+        self.index = index
+        self.input_key = fused.input_key
+        self.background = fused.background
+        self.model = _OutputPredictor(fused, index)
+
+    def predict(self, df: pd.DataFrame) -> np.ndarray:
+        return np.ascontiguousarray(self.fused.predict(df)[:, self.index])
+
+
+def load_model(path) -> object:
+    """JoblibModel, or {output: OutputView} for a fused multi-output artifact."""
+    model = JoblibModel(path)
+    if model.meta.get("outputs"):
+        return FusedModel(model).views()
+    return model
+
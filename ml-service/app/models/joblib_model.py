@@ -10,6 +10,8 @@ class JoblibModel:
         loaded = joblib.load(path)
         # handle both dict or direct model
         self.model = loaded["model"] if isinstance(loaded, dict) else loaded
+        # the rest of a dict artifact (e.g. the outputs of a fused model, see fused_model.py)
+        self.meta = {k: v for k, v in loaded.items() if k != "model"} if isinstance(loaded, dict) else {}
 
     def predict(self, df: pd.DataFrame):
         return self.model.predict(df)
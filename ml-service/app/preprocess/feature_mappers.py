@@ -1,6 +1,7 @@
 from typing import Dict
 import numpy as np
 import pandas as pd
+from app.preprocess.hormone_preprocessor import preprocess_domain_rules
 from app.preprocess.infertility_preprocessor import preprocess_infertility_for_model
 
 # --- Column orders (per model) ---
@@ -19,6 +20,13 @@ COLUMN_ORDERS = {
         'RIDAGEMN', 'LBDBMNSI', 'RHQ131', 'RIAGENDR',
         'RIDEXPRG', 'BMXBMI'
     ],
+    # fused multi-output hormone model (scripts/train.py --models hormone): testosterone and SHBG,
+    # which read the same columns; estradiol stays on its own model
+    "hormone": [
+        'LBDBSESI', 'LBDTHGSI', 'LBDBCDSI', 'LBDBPBSI',
+        'RIDAGEMN', 'LBDBMNSI', 'RHQ131', 'RIAGENDR',
+        'RIDEXPRG', 'BMXBMI'
+    ],
     "menopause": [   'RIDAGEYR', 'LBXBPB', 'RHQ420',
     'LBXBCD', 'RHQ160', 'LBXBMN',
     'LBXTHG', 'LBXBSE'],
@@ -26,15 +34,18 @@ COLUMN_ORDERS = {
     "menstrual": ['RIDAGEYR', 'RHD280', 'RHQ540',
     'RHQ305', 'DMDMARTL', 'LBXBPB', 'LBXBCD', 'LBXTHG', 'LBXBSE', 'LBXBMN'],
 
-    "menstrual": ['RIDAGEYR', 'RHD280', 'RHQ540',
-    'RHQ305', 'DMDMARTL', 'LBXBPB', 'LBXBCD', 'LBXTHG', 'LBXBSE', 'LBXBMN'],
-
     "infertility": [
          'WTSH2YR', 'LBXBPB', 'LBDBPBSI', 'LBXBCD', 'LBDBCDSI', 'LBXTHG', 'LBDTHGSI', 'LBXBSE', 'LBDBSESI', 'LBXBMN', 'LBDBMNSI',
          'RHQ031', 'RHQ060', 'RHQ078', 'RHD280', 'RHQ420', 'RHQ540', 'RIDAGEYR', 'RIDRETH3', 'DMDBORN4', 'DMDMARTL' ]
     ,
 }
 
+# Coded answers the menopause / menstrual pipelines take as categories ("1", "2", ...)
+CATEGORICAL_CODES = {
+    "menopause": ['RHQ420'],
+    "menstrual": ['DMDMARTL', 'RHQ540', 'RHQ305', 'RHD280'],
+}
+
 MARITAL_STATUS_MAP = {
     "MARRIED": 1,
     "WIDOWED": 2,
@@ -99,6 +110,35 @@ MARITAL_STATUS_MAP = {
 #         "RHQ078": None,
 #     }
 
+# --- Blood metals: raw LBX field -> (SI column, multiplier, atomic weight) ---
+# SI units as NHANES reports them (and the hormone models were trained on)
+METAL_SI = {
+    "LBXBPB": ("LBDBPBSI", 10.0, 207.2),      # µg/dL → µmol/L (lead)
+    "LBXBCD": ("LBDBCDSI", 1000.0, 112.414),  # µg/L → nmol/L
+    "LBXTHG": ("LBDTHGSI", 1000.0, 200.59),   # µg/L → nmol/L
+    "LBXBSE": ("LBDBSESI", 1.0, 78.971),      # µg/L → µmol/L
+    "LBXBMN": ("LBDBMNSI", 1000.0, 54.938),   # µg/L → nmol/L
+}
+
+
+def safe_float(x):
+    try:
+        return None if x is None else float(x)
+    except Exception:
+        return None
+
+
+def metal_columns(blood: Dict) -> Dict:
+    """Raw LBX and converted SI columns for the metal fields present in `blood`."""
+    columns = {}
+    for field, (si_column, multiplier, atomic_weight) in METAL_SI.items():
+        if field in blood:
+            raw = safe_float(blood[field])
+            columns[field] = raw
+            columns[si_column] = raw * multiplier / atomic_weight if raw is not None else None
+    return columns
+
+
 def map_common_features(input: Dict) -> Dict:
     """Extract shared features from the API input into NHANES-style codes."""
 
@@ -113,33 +153,8 @@ def map_common_features(input: Dict) -> Dict:
     marital_status = input.get("maritalStatus")
     marital_code = MARITAL_STATUS_MAP.get(str(marital_status).upper()) if marital_status else None
 
-    # --- Helper for safe numeric parsing ---
-    def safe_float(x):
-        try:
-            return None if x is None else float(x)
-        except Exception:
-            return None
-
-    # --- Read LBX fields (µg/L or µg/dL) ---
-    lbxpb = safe_float(blood.get("LBXBPB"))  # µg/dL (lead)
-    lbxcd = safe_float(blood.get("LBXBCD"))  # µg/L
-    lbxthg = safe_float(blood.get("LBXTHG")) # µg/L
-    lbxbse = safe_float(blood.get("LBXBSE")) # µg/L
-    lbxbmn = safe_float(blood.get("LBXBMN")) # µg/L
-
-    # --- Atomic weights for conversion ---
-    LEAD_US = 207.2
-    CADMIUM_US = 112.414
-    MERCURY_US = 200.59
-    SELENIUM_US = 78.971
-    MANGANESE_US = 54.938
-
-    # --- µg/L → µmol/L (or nmol/L for Hg) conversions ---
-    lead_umolL = (lbxpb * 10.0 / LEAD_US) if lbxpb is not None else None       # µg/dL → µmol/L
-    cadmium_umolL = (lbxcd / CADMIUM_US) if lbxcd is not None else None        # µg/L → µmol/L
-    mercury_nmolL = (lbxthg * 1000.0 / MERCURY_US) if lbxthg is not None else None  # µg/L → nmol/L
-    selenium_umolL = (lbxbse / SELENIUM_US) if lbxbse is not None else None    # µg/L → µmol/L
-    manganese_umolL = (lbxbmn / MANGANESE_US) if lbxbmn is not None else None  # µg/L → µmol/L
+    # --- Read LBX fields (µg/L or µg/dL) and their SI conversions ---
+    metals = metal_columns({field: blood.get(field) for field in METAL_SI})
 
     return {
         "RIDAGEMN": age_months,
@@ -149,18 +164,18 @@ def map_common_features(input: Dict) -> Dict:
         "RHQ131": 1 if int(input.get("pregnancyCount", 0) or 0) else 2,
 
         # --- Converted SI fields (NHANES-style) ---
-        "LBDBPBSI": lead_umolL,
-        "LBDBCDSI": cadmium_umolL,
-        "LBDTHGSI": mercury_nmolL,
-        "LBDBSESI": selenium_umolL,
-        "LBDBMNSI": manganese_umolL,
+        "LBDBPBSI": metals["LBDBPBSI"],
+        "LBDBCDSI": metals["LBDBCDSI"],
+        "LBDTHGSI": metals["LBDTHGSI"],
+        "LBDBSESI": metals["LBDBSESI"],
+        "LBDBMNSI": metals["LBDBMNSI"],
 
         # --- Also keep raw LBX fields (for models that use them directly) ---
-        "LBXBPB": lbxpb,
-        "LBXBCD": lbxcd,
-        "LBXTHG": lbxthg,
-        "LBXBSE": lbxbse,
-        "LBXBMN": lbxbmn,
+        "LBXBPB": metals["LBXBPB"],
+        "LBXBCD": metals["LBXBCD"],
+        "LBXTHG": metals["LBXTHG"],
+        "LBXBSE": metals["LBXBSE"],
+        "LBXBMN": metals["LBXBMN"],
 
         # --- Meta & demographic info ---
         "BMXBMI": input.get("bmi"),
@@ -196,37 +211,65 @@ def map_shbg_features(input: Dict) -> Dict:
     features = map_common_features(input)
     return {col: features.get(col) for col in COLUMN_ORDERS["hormone_shbg"]}
 
+def map_hormone_features(input: Dict) -> Dict:
+    features = map_common_features(input)
+    return {col: features.get(col) for col in COLUMN_ORDERS["hormone"]}
+
 def map_menopause_features(input: Dict) -> Dict:
     features = map_common_features(input)
-    # features["RHD280"] = str(features["RHD280"])
-    # features["RHQ074"] = str(features["RHQ074"])
-    features["RHQ420"] = str(features["RHQ420"])
     return {col: features.get(col) for col in COLUMN_ORDERS["menopause"]}
 
 def map_menstrual_features(input: Dict) -> Dict:
     features = map_common_features(input)
-    features["DMDMARTL"] = str(features["DMDMARTL"])
-    features["RHQ540"] = str(features["RHQ540"])
-    features["RHQ305"] = str(features["RHQ305"])
-    features["RHD280"] = str(features["RHD280"])
     return {col: features.get(col) for col in COLUMN_ORDERS["menstrual"]}
 
 
 def map_infertility_features(input: Dict) -> Dict:
     features = map_common_features(input)
-    # --- Final order as model expects ---
-    tempdf = {col: features.get(col) for col in COLUMN_ORDERS["infertility"]}
-    tempdf = preprocess_infertility_for_model(tempdf)
-    # print("="*40)
-    # print("Temp DF before preprocessing:", tempdf.columns)
-    # print("="*40)
-    return tempdf
+    # --- Final order as model expects (risk encoding happens in to_model_frame) ---
+    return {col: features.get(col) for col in COLUMN_ORDERS["infertility"]}
+
+
+def map_all_features(input: Dict) -> Dict[str, Dict]:
+    """Every model's row from a single map_common_features pass (same rows as the per-model mappers)."""
+    features = map_common_features(input)
+    features["is_menopausal"] = input.get("is_menopausal", 0)  # only estradiol reads it
+    return {key: {col: features.get(col) for col in COLUMN_ORDERS[key]} for key in COLUMN_ORDERS}
+
+
+# --- NHANES-coded rows -> model input (shared by serving and ml-service/training) ---
+def category_code(value):
+    """1 / 1.0 / "1" -> "1"; missing -> NaN so the pipeline's imputer fills it."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return np.nan
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    return str(int(number)) if number.is_integer() else str(number)
+
+
+def to_model_frame(df: pd.DataFrame, model_key: str) -> pd.DataFrame:
+    """Model-specific step after mapping: columns in COLUMN_ORDERS[model_key] -> what the model is fed.
+
+    The service applies it to mapped API input and the training pipeline to
+    NHANES rows, so both always see the same feature code.
+    """
+    df = df[COLUMN_ORDERS[model_key]].copy()
+    if model_key.startswith("hormone"):
+        return preprocess_domain_rules(df)
+    if model_key == "infertility":
+        return preprocess_infertility_for_model(df)
+    for col in CATEGORICAL_CODES.get(model_key, []):
+        df[col] = df[col].map(category_code).astype(object)
+    return df
 
 # --- Mapper registry ---
 FEATURE_MAPPERS = {
     "hormone_testosterone": map_testosterone_features,
     "hormone_estradiol": map_estradiol_features,
     "hormone_shbg": map_shbg_features,
+    "hormone": map_hormone_features,
     "menopause": map_menopause_features,
     "menstrual": map_menstrual_features,
     "infertility": map_infertility_features,
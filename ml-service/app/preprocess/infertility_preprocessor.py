@@ -1,6 +1,43 @@
 import pandas as pd
 import numpy as np
 
+# Lower limits of detection (NHANES units); missing metals are imputed as LLOD / sqrt(2)
+METAL_LLOD = {'lead': 0.05, 'cadmium': 0.07, 'mercury': 0.2, 'selenium': 59.35, 'manganese': 2.21}
+
+# Risk bands per metal: <= low -> 0, <= medium -> 1, above -> 2
+METAL_RISK_THRESHOLDS = {
+    'lead_ugdl': {'low': 1.0, 'medium': 2.0},
+    'cadmium_ugl': {'low': 0.3, 'medium': 0.5},
+    'mercury_ugl': {'low': 1.0, 'medium': 3.0},
+    'selenium_ugl': {'low': 120, 'medium': 180},
+    'manganese_ugl': {'low': 8.0, 'medium': 12.0},
+}
+
+# NHANES field each banded metal is read from
+METAL_FIELDS = {
+    'lead_ugdl': 'LBXBPB',
+    'cadmium_ugl': 'LBXBCD',
+    'mercury_ugl': 'LBXTHG',
+    'selenium_ugl': 'LBXBSE',
+    'manganese_ugl': 'LBXBMN',
+}
+
+
+def risk_bands(row: dict) -> tuple:
+    """Risk band of each metal in an NHANES-coded row, as the encoding below assigns them.
+
+    The model sees the metals only through these bands, so two rows that
+    differ only in metal values within the same bands get the same prediction.
+    """
+    bands = []
+    for metal, t in METAL_RISK_THRESHOLDS.items():
+        value = pd.to_numeric(row.get(METAL_FIELDS[metal]), errors='coerce')
+        if pd.isna(value):
+            value = METAL_LLOD[metal.rsplit('_', 1)[0]] / np.sqrt(2)
+        bands.append(0 if value <= t['low'] else 1 if value <= t['medium'] else 2)
+    return tuple(bands)
+
+
 def preprocess_infertility_for_model(raw_input):
     """
     Prepares raw NHANES reproductive/metal record(s) for infertility model prediction.
@@ -57,22 +94,13 @@ def preprocess_infertility_for_model(raw_input):
 
     #  LLOD IMPUTATION 
     SQRT2 = np.sqrt(2)
-    metal_llod1 = {'lead': 0.05, 'cadmium': 0.07, 'mercury': 0.2, 'selenium': 59.35, 'manganese': 2.21}
-    for metal, llod in metal_llod1.items():
+    for metal, llod in METAL_LLOD.items():
         col = f"{metal}_ugl" if f"{metal}_ugl" in df.columns else f"{metal}_ugdl"
         if col in df.columns:
             df[col] = df[col].fillna(llod / SQRT2)
 
     #  RISK ENCODING 
-    thresholds = {
-        'lead_ugdl': {'low': 1.0, 'medium': 2.0},
-        'cadmium_ugl': {'low': 0.3, 'medium': 0.5},
-        'mercury_ugl': {'low': 1.0, 'medium': 3.0},
-        'selenium_ugl': {'low': 120, 'medium': 180},
-        'manganese_ugl': {'low': 8.0, 'medium': 12.0},
-    }
-
-    for metal, t in thresholds.items():
+    for metal, t in METAL_RISK_THRESHOLDS.items():
         if metal in df.columns:
             cat_col = metal.replace('_ugdl', '').replace('_ugl', '') + '_risk'
             df[cat_col] = pd.cut(
@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends
+
+from app.core.db import pool_metrics, use_asyncpg
+from app.security import auth_cache_stats, require_roles
+from app.services import whatif_service
+from app.services.model_registry import registry
+from app.services.scheduler import scheduler
+from app.services.singleflight import flights
+
+# operational detail (model files, reload errors, auth cache): admins only, applied to every route here
+router = APIRouter(dependencies=[Depends(require_roles("admin"))])
+
+@router.get("/db")
+async def db_metrics():
+    """Connection slot utilisation for Prisma and, when enabled, the asyncpg bulk pool."""
+    asyncpg_stats = {"enabled": False}
+    if use_asyncpg():
+        from app.core import pg_pool
+        asyncpg_stats = pg_pool.pool_stats()
+    return {"prisma": pool_metrics.snapshot(), "asyncpg": asyncpg_stats}
+
+@router.get("/models")
+async def model_metrics():
+    """Model versions currently serving, their files and the hot-reload state."""
+    return registry.describe()
+
+@router.get("/singleflight")
+async def singleflight_metrics():
+    """Per route: requests that computed (leaders), requests that joined one in flight (coalesced), failures."""
+    return flights.stats()
+
+@router.get("/scheduler")
+async def scheduler_metrics():
+    """Inference lanes: queue depth, running jobs vs limit, queue-time percentiles and run time."""
+    return scheduler.stats()
+
+@router.get("/auth")
+async def auth_metrics():
+    """Verified-token cache: size and hit/miss/expired/invalid counts."""
+    return auth_cache_stats()
+
+@router.get("/whatif")
+async def whatif_metrics():
+    """What-if WebSocket sessions opened, currently open, and slider updates served."""
+    return dict(whatif_service.stats)
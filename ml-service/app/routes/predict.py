@@ -1,227 +1,312 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel
-from typing import Dict, List
-from pathlib import Path
-import pandas as pd
-import numpy as np
-
-from app.security import verify_jwt
-from app.models.joblib_model import JoblibModel
-from app.core.db import db
-from app.preprocess.feature_mappers import FEATURE_MAPPERS, COLUMN_ORDERS
-from app.preprocess.hormone_preprocessor import preprocess_domain_rules
-
-import shap, io, base64
+import asyncio
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
+
+from app.security import require_roles
+from app.services import (
+    artifact_service, cohort_service, counterfactual_service, shadow_service, uncertainty_service,
+)
+from app.services.prediction_service import save_predictions
+from app.services.inference import (
+    DEFAULT_CONTINUOUS, DEFAULT_CONTINUOUS_2, DEFAULT_GRID_POINTS, DEFAULT_NUM_POINTS, MAX_GRID_POINTS,
+    build_feature_df, collect_sensitivity2d, feature_hash, frames_hash, iter_sensitivity, iter_shap, model_inputs,
+)
+from app.services.model_registry import registry
+from app.services.scheduler import EXPLANATION, INTERACTIVE, scheduler
+from app.services.singleflight import flights
+from app.utils.encoding import EncodingOptions, encode_response, stream_response
+
 # import matplotlib.pyplot as plt
 
-router = APIRouter()
+# every prediction route is for clinical staff; the check is applied once here
+router = APIRouter(dependencies=[Depends(require_roles("doctor", "nurse"))])
 
 class PredictInput(BaseModel):
     features: Dict
 
-class SensitivityInput(BaseModel):
-    features: Dict
-    continuous_features: List[str] = [
-        "LBDBPBSI", "LBDBCDSI", "LBDTHGSI", "LBDBSESI", "LBDBMNSI"
-    ]
-    continuous_features_2: List[str] = [
-        "LBXBPB", "LBXBCD", "LBXTHG", "LBXSE", "LBXBMN"
-    ]
-    num_points: int = 1000
-
-MODELS_DIR = Path(__file__).parent.parent / "models" / "saved"
-
-# --- Load models ---
-MODELS = {
-    "hormone": {
-        "testosterone": JoblibModel(MODELS_DIR / "xgb_model_tst_03.joblib"),
-        "estradiol": JoblibModel(MODELS_DIR / "xgb_model_est_02.joblib"),
-        "shbg": JoblibModel(MODELS_DIR / "xgb_model_shbg_03.joblib"),
-    },
-    "menopause": JoblibModel(MODELS_DIR / "Menopause_Pipeline_Model.joblib"),
-    "menstrual": JoblibModel(MODELS_DIR / "Menstrual_Pipeline_Model.joblib"),
-    "infertility": JoblibModel(MODELS_DIR / "best_model_risk_only.joblib"),
-}
-
-def build_feature_df(features: Dict, model_key: str) -> pd.DataFrame:
-    mapper = FEATURE_MAPPERS.get(model_key)
-    if not mapper:
-        raise ValueError(f"No feature mapper for {model_key}")
-    mapped = mapper(features)
-    # print(f"Mapped features for {model_key}: {mapped}")
-    if model_key == "infertility":
-        return mapped
-    else:
-        return pd.DataFrame([mapped])
+class UncertaintyOptions(BaseModel):
+    samples: int = Field(uncertainty_service.DEFAULT_SAMPLES, ge=10, le=uncertainty_service.MAX_SAMPLES)
+    cv: Dict[str, float] = {}                # per LBX metal field, over uncertainty_service.DEFAULT_CV
+    level: float = Field(uncertainty_service.DEFAULT_LEVEL, gt=0, lt=1)
+    thresholds: Dict[str, List[float]] = {}  # regression outputs: cut points a flip is counted across
+    seed: int = uncertainty_service.SEED
 
-def feature_sensitivity(model, X_row: pd.Series, feature: str, num_points: int = 1000):
-    """Return x (feature values) and y (predictions) without plotting."""
-    base_value = X_row[feature]
-    fmin, fmax = base_value * 0.1, base_value * 10
-    feature_values = np.linspace(fmin, fmax, num_points)
+class ModelPredictInput(PredictInput):
+    uncertainty: Optional[UncertaintyOptions] = None
 
-    varied_rows = pd.DataFrame([X_row.values] * num_points, columns=X_row.index)
-    varied_rows[feature] = feature_values
+class SensitivityInput(BaseModel):
+    features: Dict
+    continuous_features: List[str] = DEFAULT_CONTINUOUS
+    continuous_features_2: List[str] = DEFAULT_CONTINUOUS_2
+    num_points: int = DEFAULT_NUM_POINTS
 
-    preds = model.predict(varied_rows)
+class Sensitivity2DInput(BaseModel):
+    features: Dict
+    feature_x: str = "LBXBPB"
+    feature_y: str = "LBXBCD"
+    num_points: int = Field(DEFAULT_GRID_POINTS, ge=2, le=MAX_GRID_POINTS)
+    grid: Literal["uniform", "thresholds"] = "uniform"
 
-    return feature_values.tolist(), preds.tolist()
+class CounterfactualInput(BaseModel):
+    features: Dict
+    metals: Optional[List[str]] = None  # LBX fields that may change; default all five
+    direction: Literal["decrease", "any"] = "decrease"
+    max_results: int = Field(counterfactual_service.DEFAULT_MAX_RESULTS, ge=1, le=50)
+    budget_ms: float = Field(counterfactual_service.DEFAULT_BUDGET_MS, gt=0, le=5000)
+
+def _idempotency_key(value: Optional[str] = Header(None, alias="Idempotency-Key")) -> Optional[str]:
+    """Client-chosen key; a retried request with the same key doesn't add Prediction rows again."""
+    return value
+
+# registered before /{model} so "all" isn't taken for a model name
+@router.post("/all")
+async def predict_all(input: PredictInput, background: BackgroundTasks,
+                      idempotency_key: Optional[str] = Depends(_idempotency_key)):
+    """
+    Score every model for one patient in a single call.
+    The patient is mapped once, every sub-model runs concurrently on the
+    inference workers and all predictions are saved in one bulk write. A sub-model
+    that fails is reported under "errors" without failing the others.
+    """
+    ms = registry.current
+    models = list(ms.models)
+    model_of = {key: model for model in models for key, _ in ms.submodels(model)}
+    units = [unit for model in models for unit in ms.prediction_units(model)]
+    X = model_inputs(input.features, [input_key for _, _, input_key in units])
+
+    async def run():
+        outcomes = await asyncio.gather(
+            *(scheduler.run(INTERACTIVE, shadow_service.timed_predict_outputs, clf, X[input_key])
+              for _, clf, input_key in units),
+            return_exceptions=True,
+        )
+        timings, errors = {}, {}
+        for (keys, _, _), outcome in zip(units, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"⚠️ Prediction failed for {keys}: {outcome}")
+                errors.update({key: str(outcome) for key in keys})
+            else:
+                values, elapsed = outcome
+                timings.update({key: (value, elapsed) for key, value in zip(keys, values)})
+        results = {key: value for key, (value, _) in timings.items()}
+
+        await save_predictions(input.features.get("id"), results,
+                               {key: ms.versions[model] for key, model in model_of.items()}, idempotency_key)
+        response = {"model": "all", "modelVersions": {m: ms.versions[m] for m in models}, "predictions": results}
+        if errors:
+            response["errors"] = errors
+        return response, timings, errors
+
+    # the Idempotency-Key is part of the key: the write records only the leader's key, so requests
+    # with different keys must not share it (a retry of a coalesced one would write its rows again)
+    flight = ("predict_all", tuple(ms.versions[m] for m in models), input.features.get("id"), idempotency_key,
+              frames_hash(X))
+    (response, timings, errors), shared = await flights.do(flight, run)
+
+    # the request that did the work schedules the follow-ups; coalesced duplicates don't repeat them
+    if not shared:
+        for model in models:
+            keys = [key for key, _ in ms.submodels(model)]
+            if any(key in errors for key in keys):
+                continue
+            background.add_task(artifact_service.precompute_patient, ms, model, input.features)
+            background.add_task(shadow_service.score_shadows, ms, model, input.features,
+                                {key: timings[key] for key in keys})
+    return response
 
 @router.post("/{model}")
-async def predict(model: str, input: PredictInput, user=Depends(verify_jwt)):
-    if "doctor" not in user.get("roles", []) and "nurse" not in user.get("roles", []):
-        raise HTTPException(status_code=403, detail="Forbidden")
-
-    if model not in MODELS:
+async def predict(model: str, input: ModelPredictInput, background: BackgroundTasks,
+                  idempotency_key: Optional[str] = Depends(_idempotency_key)):
+    """
+    Predict (and save) one model for one patient.
+    With "uncertainty" in the body, the response also carries a Monte Carlo
+    estimate of how the prediction moves under the blood metals' measurement
+    error: mean, interval and flip probability per output, from one batched
+    predict over every draw (see uncertainty_service.py). Draws aren't saved.
+    """
+    # one snapshot for the whole request (a hot reload may swap registry.current meanwhile)
+    ms = registry.current
+    if model not in ms.models:
         raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
 
     # print(input.features)
 
-    # --- Special case: hormone (multi-model predictions) ---
-    if model == "hormone":
-        results = {}
-        for sm, clf in MODELS["hormone"].items():
-            key = f"hormone_{sm}"
-            X = build_feature_df(input.features, key)
-            X = preprocess_domain_rules(X)
-            print(X)
-            y_pred = clf.predict(X)
-            value = float(y_pred[0])
-            print("="*20)
-            print(f"{key} prediction: {value}")
-
-            patient_id = input.features.get("id")
-            if patient_id not in (None, "None"):
-                await db.prediction.create(
-                    data={
-                        "patientId": patient_id,
-                        "model": key,
-                        "value": value
-                    }
-                )
-            results[key] = value
-            
-        return {"model": model, "predictions": results}
-
-    # --- Normal single-model case ---
-    clf = MODELS[model]
-    # print(input.features)
-    X = build_feature_df(input.features, model)
-    print(X)
-    y_pred = clf.predict(X)
-    value = float(y_pred[0])
-    print("="*20)
-    print(f"{model} prediction: {value}")
-
-    patient_id = input.features.get("id")
-    if patient_id not in (None, "None"):
-        await db.prediction.create(
-            data={
-                "patientId": patient_id,
-                "model": model,
-                "value": value
-            }
+    async def run():
+        # --- Special case: hormone (multi-model predictions) ---
+        if model == "hormone":
+            results, timings = {}, {}
+            # one call per fused model (it returns all its outputs) and one per separate booster
+            for keys, clf, input_key in ms.prediction_units(model):
+                X = build_feature_df(input.features, input_key)
+                values, elapsed = await scheduler.run(INTERACTIVE, shadow_service.timed_predict_outputs, clf, X)
+                for key, value in zip(keys, values):
+                    results[key] = value
+                    timings[key] = (value, elapsed)
+
+            # one batched write for all three sub-models
+            await save_predictions(input.features.get("id"), results, ms.versions[model], idempotency_key)
+            return {"model": model, "modelVersion": ms.versions[model], "predictions": results}, timings
+
+        # --- Normal single-model case ---
+        clf = ms.models[model]
+        # print(input.features)
+        X = build_feature_df(input.features, model)
+        value, elapsed = await scheduler.run(INTERACTIVE, shadow_service.timed_predict, clf, X)
+
+        await save_predictions(input.features.get("id"), {model: value}, ms.versions[model], idempotency_key)
+        return {"model": model, "modelVersion": ms.versions[model], "prediction": value}, {model: (value, elapsed)}
+
+    # identical concurrent requests (double submit, two views loading at once) share one run and one write;
+    # only with the same Idempotency-Key (or none), since the write records the leader's key
+    flight = ("predict", model, ms.versions[model], input.features.get("id"), idempotency_key,
+              feature_hash(model, input.features))
+    if input.uncertainty is None:
+        (response, timings), shared = await flights.do(flight, run)
+    else:
+        options = input.uncertainty.model_dump()
+        try:
+            uncertainty_service.check_options(ms, model, options["cv"], options["thresholds"])
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        # the draws run next to the prediction, not after it
+        mc_flight = ("uncertainty", model, ms.versions[model], feature_hash(model, input.features, options))
+        ((response, timings), shared), (uncertainty, _) = await asyncio.gather(
+            flights.do(flight, run),
+            flights.do(mc_flight, lambda: scheduler.run(
+                INTERACTIVE, uncertainty_service.monte_carlo, ms, model, input.features, **options)),
         )
+        response = {**response, "uncertainty": uncertainty}
 
-    return {"model": model, "prediction": value}
+    if not shared:
+        # refresh stored sensitivity/SHAP for this patient once the response is out
+        background.add_task(artifact_service.precompute_patient, ms, model, input.features)
+        # candidates score the same input after the response (shadow mode)
+        background.add_task(shadow_service.score_shadows, ms, model, input.features, timings)
+    return response
 
 @router.post("/sensitivity/{model}")
-async def sensitivity(model: str, input: SensitivityInput, user=Depends(verify_jwt)):
-    if "doctor" not in user.get("roles", []) and "nurse" not in user.get("roles", []):
-        raise HTTPException(status_code=403, detail="Forbidden")
+async def sensitivity(model: str, input: SensitivityInput, encoding: EncodingOptions = Depends()):
+    """
+    One-feature-at-a-time sensitivity curves.
+    With ?stream=true (or Accept: application/x-ndjson) each curve is sent as an
+    NDJSON line as soon as it is computed, followed by a final {"done": true} line.
+    Results for stored patients are served from their precomputed artifact when
+    one matches; otherwise they are computed live (and stored, unless streamed).
+    """
     
-    if model not in MODELS:
+    ms = registry.current
+    if model not in ms.models:
         raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
 
-    results = {}
-
-    # --- Multi-model case (like hormone) ---
-    if isinstance(MODELS[model], dict):
-        for sm, clf in MODELS[model].items():
-            mapper_key = f"{model}_{sm}"   
-            X = build_feature_df(input.features, mapper_key)
-
-            # only hormone models get preprocessed
-            if model == "hormone":
-                X = preprocess_domain_rules(X)
-
-            X_row = X.iloc[0]
-
-            feature_results = {}
-            for feature in input.continuous_features:
-                if feature in X_row.index:
-                    base_val = X_row[feature]
-
-                    if base_val is None or pd.isna(base_val):
-                        print(f"⚠️ Skipping '{feature}' — missing or invalid base value")
-                        continue
-                    try:
-                        base_val = float(base_val)
-                    except (TypeError, ValueError):
-                        print(f"⚠️ Skipping '{feature}' — non-numeric base value ({base_val})")
-                        continue
-
-                    x_vals, y_vals = feature_sensitivity(clf, X_row, feature, input.num_points)
-                    if not x_vals or not y_vals:
-                        continue
-
-                    try:
-                        original_y = float(clf.predict(pd.DataFrame([X_row]))[0])
-                    except Exception as e:
-                        print(f"⚠️ Model prediction failed for '{feature}': {e}")
-                        continue
-
-                    feature_results[feature] = {
-                        "x": x_vals,
-                        "y": y_vals,
-                        "original_x": base_val,
-                        "original_y": original_y,
-                    }
-
-            results[mapper_key] = feature_results
-
-    # --- Single-model case ---
-    else:
-        clf = MODELS[model]
-        X = build_feature_df(input.features, model)
-        X_row = X.iloc[0]
-
+    args = (input.features, input.continuous_features, input.continuous_features_2, input.num_points)
 
-        feature_results = {}
-        for feature in input.continuous_features_2:
-            if feature in X_row.index:
-                base_val = X_row[feature]
+    if encoding.stream:
+        key = artifact_service.artifact_key(
+            ms, artifact_service.SENSITIVITY, model, input.features,
+            artifact_service.sensitivity_params(*args[1:]),
+        )
+        stored = await artifact_service.load(key)
+        source = (artifact_service.iter_stored_sensitivity(stored) if stored is not None
+                  else iter_sensitivity(ms, model, *args))
 
-                if base_val is None or pd.isna(base_val):
-                    print(f"⚠️ Skipping '{feature}' — missing or invalid base value")
-                    continue
+        def lines():
+            for mapper_key, curves in source:
                 try:
-                    base_val = float(base_val)
-                except (TypeError, ValueError):
-                    print(f"⚠️ Skipping '{feature}' — non-numeric base value ({base_val})")
-                    continue
+                    for feature, result in curves:
+                        yield {"model": model, "submodel": mapper_key, "feature": feature, **result}
+                except Exception as e:
+                    print(f"⚠️ Sensitivity failed for '{mapper_key}': {e}")
+                    yield {"model": model, "submodel": mapper_key, "error": str(e)}
+            yield {"model": model, "done": True}
+        # one curve per scheduler job, so a long sweep doesn't hold a worker for its whole length
+        return stream_response(scheduler.iterate(EXPLANATION, lines()), encoding)
 
-                x_vals, y_vals = feature_sensitivity(clf, X_row, feature, input.num_points)
-                if not x_vals or not y_vals:
-                    continue
+    flight = ("sensitivity", model, ms.versions[model], input.features.get("id"),
+              feature_hash(model, input.features, artifact_service.sensitivity_params(*args[1:])))
+    results, _ = await flights.do(flight, lambda: artifact_service.sensitivity(ms, model, *args))
 
-                try:
-                    original_y = float(clf.predict(pd.DataFrame([X_row]))[0])
-                except Exception as e:
-                    print(f"⚠️ Model prediction failed for '{feature}': {e}")
-                    continue
+    # print({"model": model, "sensitivity": results})
+    return encode_response({"model": model, "sensitivity": results}, encoding)
 
-                feature_results[feature] = {
-                    "x": x_vals,
-                    "y": y_vals,
-                    "original_x": base_val,
-                    "original_y": original_y,
-                }
+@router.post("/sensitivity2d/{model}")
+async def sensitivity2d(model: str, input: Sensitivity2DInput, encoding: EncodingOptions = Depends()):
+    """
+    Two-feature interaction surface: z[j][i] is the prediction at (x[i], y[j]).
+    The whole grid is scored in one predict call per model (one in total for
+    a fused hormone model). Metals may be named by their LBX or SI column.
+    grid="thresholds" places one point per interval between the trees' split
+    points (the exact surface, usually in fewer points), or spaces them by
+    split density when there are too many intervals (see inference.py); each
+    axis reports which grid it got.
+    """
+    ms = registry.current
+    if model not in ms.models:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
+    if input.feature_x == input.feature_y:
+        raise HTTPException(status_code=422, detail="feature_x and feature_y must differ")
 
-        results[model] = feature_results
+    args = (input.features, input.feature_x, input.feature_y, input.num_points, input.grid)
+    params = {"x": input.feature_x, "y": input.feature_y, "num_points": input.num_points, "grid": input.grid}
+    flight = ("sensitivity2d", model, ms.versions[model], input.features.get("id"),
+              feature_hash(model, input.features, params))
+    results, _ = await flights.do(flight, lambda: scheduler.run(EXPLANATION, collect_sensitivity2d, ms, model, *args))
 
-    # print({"model": model, "sensitivity": results})
-    return {"model": model, "sensitivity": results}
+    return encode_response({"model": model, "feature_x": input.feature_x, "feature_y": input.feature_y,
+                            "sensitivity2d": results}, encoding)
+
+@router.post("/counterfactual/{model}")
+async def counterfactual(model: str, input: CounterfactualInput):
+    """
+    Smallest blood metal changes that move a flagged patient to a lower risk
+    class, for models that read the metals as risk bands (infertility).
+    The search runs over band combinations in batched predict calls, pruning
+    combinations that change more than a counterfactual already found, and
+    stops at budget_ms ("complete": false); see counterfactual_service.py.
+    """
+    ms = registry.current
+    if model not in ms.models:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
+
+    params = input.model_dump(exclude={"features"})
+    flight = ("counterfactual", model, ms.versions[model], input.features.get("id"),
+              feature_hash(model, input.features, params))
+    try:
+        results, _ = await flights.do(flight, lambda: scheduler.run(
+            EXPLANATION, counterfactual_service.search, ms, model, input.features, **params))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return {"model": model, "modelVersion": ms.versions[model], **results}
+
+@router.get("/cohort/{model}")
+async def cohort_dependence(
+    model: str,
+    features: Optional[List[str]] = Query(None, description="Default: the five blood metals (LBX columns)"),
+    grid_points: int = Query(cohort_service.DEFAULT_GRID_POINTS, ge=2, le=100),
+    ice_lines: int = Query(cohort_service.DEFAULT_ICE_LINES, ge=0, le=500),
+    encoding: EncodingOptions = Depends(),
+):
+    """
+    Partial dependence and ICE curves over the NHANES reference cohort.
+    Served from the cohort store for the current model version (precomputed by
+    python -m scripts.cohort_pdp); a miss computes it once, one bulk job per
+    feature, and stores it.
+    """
+    ms = registry.current
+    if model not in ms.models:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
+
+    flight = ("cohort", model, ms.versions[model], tuple(features or ()), grid_points, ice_lines)
+    try:
+        results, _ = await flights.do(
+            flight, lambda: cohort_service.dependence(ms, model, features, grid_points, ice_lines),
+        )
+    except cohort_service.CohortMissing as e:
+        raise HTTPException(status_code=404,
+                            detail=f"No reference cohort for {e}; build it with python -m scripts.cohort_pdp")
+    return encode_response({"model": model, "modelVersion": ms.versions[model], "cohort": results}, encoding)
 
 # @router.post("/shap/{model}")
 # async def shap_analysis(model: str, input: PredictInput, user=Depends(verify_jwt)):
@@ -469,142 +554,31 @@ async def sensitivity(model: str, input: SensitivityInput, user=Depends(verify_j
 #     return {"model": model, "shap": results}
 
 @router.post("/shap/{model}")
-async def shap_analysis(model: str, input: PredictInput, user=Depends(verify_jwt)):
+async def shap_analysis(model: str, input: PredictInput, encoding: EncodingOptions = Depends()):
     """
     Compute SHAP feature contribution analysis for any model (Pipeline or raw estimator).
     Works with both regressors and classifiers (including RandomForest, XGBoost, etc.).
+    Supports ?stream=true for one NDJSON line per sub-model.
     """
 
-    # --- Authorization ---
-    if "doctor" not in user.get("roles", []) and "nurse" not in user.get("roles", []):
-        raise HTTPException(status_code=403, detail="Forbidden")
-
     # --- Validate model key ---
-    if model not in MODELS:
+    ms = registry.current
+    if model not in ms.models:
         raise HTTPException(status_code=404, detail=f"Unknown model: {model}")
 
-    import shap
-    import numpy as np
-    from sklearn.pipeline import Pipeline
-    from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-
-    results = {}
-
-    # Helper: unwrap deeply nested pipelines
-    def unwrap_model(obj):
-        """Recursively unwrap pipelines and nested model containers to get the final estimator."""
-        if isinstance(obj, Pipeline):
-            try:
-                last_step = list(obj.named_steps.values())[-1]
-                return unwrap_model(last_step)
-            except Exception:
-                return obj
-        if hasattr(obj, "model"):
-            return unwrap_model(obj.model)
-        return obj
-
-    #  Core: SHAP computation per submodel 
-    def compute_shap_for_model(clf, mapper_key: str, features: Dict):
-        try:
-            #  Step 1: Build input DataFrame 
-            X = build_feature_df(features, mapper_key)
-            if "hormone" in mapper_key:
-                X = preprocess_domain_rules(X)
-
-            pipeline = clf.model  # e.g. your JoblibModel wrapper exposes .model
-
-            #  Step 2: Identify preprocessor & model
-            preprocessor, model_obj = None, None
-            try:
-                if isinstance(pipeline, Pipeline):
-                    if "preprocessor_and_model" in pipeline.named_steps:
-                        inner = pipeline.named_steps["preprocessor_and_model"]
-                        preprocessor = inner.named_steps.get("preprocessor", None)
-                        model_obj = inner.named_steps.get("model", inner)
-                    else:
-                        preprocessor = pipeline.named_steps.get("preprocessor", None)
-                        model_obj = pipeline.named_steps.get("model", pipeline)
-                else:
-                    model_obj = pipeline
-            except Exception as e:
-                print(f" Error extracting preprocessor/model for {mapper_key}: {e}")
-                model_obj = unwrap_model(pipeline)
-
-            #  Step 3: Transform input if preprocessor exists 
-            X_transformed = X
-            if preprocessor is not None and hasattr(preprocessor, "transform"):
-                try:
-                    X_transformed = preprocessor.transform(X)
-                except Exception as e:
-                    print(f" Preprocessor transform failed for {mapper_key}: {e}")
+    if encoding.stream:
+        stored = await artifact_service.load(
+            artifact_service.artifact_key(ms, artifact_service.SHAP, model, input.features)
+        )
+        source = stored.items() if stored is not None else iter_shap(ms, model, input.features)
 
-            #  Step 4: Get feature names (post-transform)
-            if preprocessor is not None and hasattr(preprocessor, "get_feature_names_out"):
-                feature_names = preprocessor.get_feature_names_out()
-            else:
-                feature_names = X.columns
-
-            # Step 5: Unwrap model completely 
-            model_obj = unwrap_model(model_obj)
-            model_name = str(type(model_obj)).lower()
-            print(f"Final model for {mapper_key}: {model_obj.__class__.__name__}")
-
-            # Step 6: Compute SHAP values 
-            try:
-                if any(k in model_name for k in ["xgb", "xgboost", "lightgbm", "randomforest", "gradientboosting"]):
-                    explainer = shap.TreeExplainer(model_obj)
-                    shap_values = explainer.shap_values(X_transformed)
-                    expected_value = explainer.expected_value
-
-                    #  Handle classifiers (list of arrays)
-                    if isinstance(shap_values, list):
-                        # For binary classifiers → take positive class (1)
-                        shap_values = shap_values[1] if len(shap_values) > 1 else shap_values[0]
-
-                    if isinstance(expected_value, list):
-                        expected_value = expected_value[1] if len(expected_value) > 1 else expected_value[0]
-
-                else:
-                    # Kernel fallback (for linear or other models)
-                    bg = X_transformed[:30] if len(X_transformed) > 30 else X_transformed
-                    explainer = shap.KernelExplainer(model_obj.predict, bg)
-                    shap_values = explainer.shap_values(X_transformed[:1])
-                    expected_value = float(np.mean(model_obj.predict(bg)))
-
-            except Exception as e:
-                print(f" TreeExplainer failed for {mapper_key}, fallback to KernelExplainer: {e}")
-                bg = X_transformed[:30] if len(X_transformed) > 30 else X_transformed
-                explainer = shap.KernelExplainer(model_obj.predict, bg)
-                shap_values = explainer.shap_values(X_transformed[:1])
-                expected_value = float(np.mean(model_obj.predict(bg)))
-
-            # --- Step 7: Format result JSON -------------------------
-            shap_vals_row = shap_values[0] if hasattr(shap_values, "__len__") else shap_values
-            shap_vals_row = np.array(shap_vals_row).flatten().tolist()
-            features_used = list(feature_names)
-
-            return {
-                "expected_value": float(expected_value),
-                "features": features_used,
-                "values": shap_vals_row,
-            }
-
-        except Exception as e:
-            print(f" SHAP computation failed for {mapper_key}: {e}")
-            return {"error": str(e)}
-
-    #  Multi-model support 
-    if isinstance(MODELS[model], dict):
-        for sm, clf in MODELS[model].items():
-            mapper_key = f"{model}_{sm}"
-            results[mapper_key] = compute_shap_for_model(clf, mapper_key, input.features)
-    else:
-        clf = MODELS[model]
-        results[model] = compute_shap_for_model(clf, model, input.features)
+        def lines():
+            for mapper_key, result in source:
+                yield {"model": model, "submodel": mapper_key, **result}
+            yield {"model": model, "done": True}
+        return stream_response(scheduler.iterate(EXPLANATION, lines()), encoding)
 
-    # Debug / return 
-    print("=" * 30)
-    print({"model": model, "shap": results})
-    print("=" * 30)
+    flight = ("shap", model, ms.versions[model], input.features.get("id"), feature_hash(model, input.features))
+    results, _ = await flights.do(flight, lambda: artifact_service.shap_values(ms, model, input.features))
 
     return {"model": model, "shap": results}
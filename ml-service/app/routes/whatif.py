@@ -0,0 +1,91 @@
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+
+from app.security import normalize_roles, verify_token
+from app.services import whatif_service
+from app.services.model_registry import registry
+from app.services.scheduler import INTERACTIVE, scheduler
+from app.services.whatif_service import WhatIfSession
+
+# own router: predict's HTTPBearer router dependency can't run on a WebSocket handshake
+router = APIRouter()
+
+ALLOWED_ROLES = normalize_roles(["doctor", "nurse"])
+
+
+def _token(websocket: WebSocket, token: Optional[str]) -> Optional[str]:
+    """Bearer token from the Authorization header, else ?token= (browsers can't set WebSocket headers)."""
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        return credentials
+    return token
+
+
+@router.websocket("/whatif/{model}")
+async def whatif(websocket: WebSocket, model: str, token: Optional[str] = None):
+    """
+    Live what-if for metal sliders.
+
+    client -> {"features": {...}}                  once, the patient as sent to POST /predict/{model}
+    server -> {"type": "ready", "predictions", "metals", "modelVersion", "ms"}
+    client -> {"metals": {"LBXBPB": 3.1}, "seq": 7}  changed raw LBX values only (null clears one); seq is echoed
+    client -> {"reset": true}                      back to the patient's own metals
+    server -> {"type": "predictions", "predictions", "seq", "ms"}   or {"type": "error", "detail", "seq"}
+
+    The session keeps the preprocessed rows and patches only the changed
+    columns (see whatif_service). Predictions are not saved.
+    """
+    try:
+        principal = verify_token(_token(websocket, token) or "")
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Invalid token")
+        return
+    if ALLOWED_ROLES.isdisjoint(principal.roles):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Forbidden")
+        return
+
+    # the session keeps the models it opened with; a hot reload applies to the next session
+    ms = registry.current
+    if model not in ms.models:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=f"Model {model} not found")
+        return
+
+    await websocket.accept()
+    whatif_service.stats["opened"] += 1
+    whatif_service.stats["active"] += 1
+    try:
+        message = await websocket.receive_json()
+        try:
+            session = await scheduler.run(INTERACTIVE, WhatIfSession, ms, model, message["features"])
+            predictions, elapsed = await scheduler.run(INTERACTIVE, session.predict)
+        except Exception as e:
+            print(f"⚠️ What-if session for {model} failed to open: {e}")
+            await websocket.send_json({"type": "error", "detail": f"Could not open session: {e}"})
+            await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+            return
+        await websocket.send_json({"type": "ready", "model": model, "modelVersion": session.version,
+                                   "predictions": predictions, "metals": session.metals, "ms": elapsed})
+
+        while True:
+            seq = None
+            try:
+                message = await websocket.receive_json()  # ValueError on malformed JSON
+                if not isinstance(message, dict):
+                    raise ValueError("Expected a JSON object")
+                seq = message.get("seq")
+                if message.get("reset"):
+                    predictions, elapsed = await scheduler.run(INTERACTIVE, session.reset)
+                else:
+                    metals = message.get("metals", {})
+                    if not isinstance(metals, dict):
+                        raise ValueError('"metals" must be an object of {LBX field: value}')
+                    predictions, elapsed = await scheduler.run(INTERACTIVE, session.update, metals)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "detail": str(e), "seq": seq})
+                continue
+            await websocket.send_json({"type": "predictions", "predictions": predictions, "seq": seq, "ms": elapsed})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        whatif_service.stats["active"] -= 1
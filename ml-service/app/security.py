@@ -1,14 +1,90 @@
+from collections import OrderedDict
+import hashlib
+import time
+from typing import Dict, FrozenSet, NamedTuple, Optional
+
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer
 import jwt, os
 
+from app.core.config import settings
+
 security = HTTPBearer()
 JWT_SECRET = os.getenv("JWT_SECRET", "this_is_a_long_secret_value")
 
-def verify_jwt(credentials = Depends(security)):
-    token = credentials.credentials
+
+class Principal(NamedTuple):
+    payload: Dict
+    roles: FrozenSet[str]
+    exp: Optional[float]
+
+
+# sha256(token) -> Principal, most recently used last. Only tokens that
+# verified are cached, and an entry is dropped once its exp has passed, so a
+# hit is exactly what jwt.decode would have returned.
+_verified: "OrderedDict[bytes, Principal]" = OrderedDict()
+cache_stats = {"hits": 0, "misses": 0, "expired": 0, "invalid": 0}
+
+
+def normalize_roles(roles) -> FrozenSet[str]:
+    if isinstance(roles, str):
+        roles = [roles]
+    return frozenset(str(r).strip().lower() for r in roles or [])
+
+
+def _decode(token: str) -> Principal:
+    payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    exp = payload.get("exp")
+    return Principal(payload, normalize_roles(payload.get("roles")), float(exp) if exp is not None else None)
+
+
+def verify_token(token: str) -> Principal:
+    """Verified claims of a bearer token, from the cache when it has seen the token before."""
+    digest = hashlib.sha256(token.encode()).digest()
+
+    principal = _verified.get(digest)
+    if principal is not None:
+        if principal.exp is None or time.time() < principal.exp:
+            _verified.move_to_end(digest)
+            cache_stats["hits"] += 1
+            return principal
+        del _verified[digest]
+        cache_stats["expired"] += 1
+
+    cache_stats["misses"] += 1
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        return payload
+        principal = _decode(token)
     except jwt.PyJWTError:
+        cache_stats["invalid"] += 1
         raise HTTPException(status_code=403, detail="Invalid token")
+
+    _verified[digest] = principal
+    if len(_verified) > settings.jwt_cache_size:
+        _verified.popitem(last=False)
+    return principal
+
+
+async def authenticate(credentials = Depends(security)) -> Principal:
+    return verify_token(credentials.credentials)
+
+
+async def verify_jwt(principal: Principal = Depends(authenticate)) -> Dict:
+    return principal.payload
+
+
+def require_roles(*roles: str):
+    """Dependency that lets a request through when its token carries any of `roles`.
+
+    Use per route or for a whole router: APIRouter(dependencies=[Depends(require_roles("doctor"))]).
+    """
+    allowed = normalize_roles(roles)
+
+    async def check(principal: Principal = Depends(authenticate)) -> Dict:
+        if allowed.isdisjoint(principal.roles):
+            raise HTTPException(status_code=403, detail="Forbidden")
+        return principal.payload
+    return check
+
+
+def auth_cache_stats() -> Dict:
+    return {"size": len(_verified), "max_size": settings.jwt_cache_size, **cache_stats}
@@ -0,0 +1,197 @@
+# app/services/artifact_service.py
+"""
+Per-patient precomputed sensitivity curves and SHAP vectors.
+
+Rows live in PatientArtifact, keyed by (patient, kind, model, model version,
+feature hash), with the result stored as zlib-compressed JSON. The predict
+route schedules precompute_patient() after saving a patient's predictions, so
+the explanation views usually read straight from storage; a miss (new model
+file, changed inputs, non-default sweep params) computes live and stores the
+result for next time.
+"""
+import base64
+import zlib
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from app.core.config import settings
+from app.core.db import acquire
+from app.services.inference import (
+    DEFAULT_CONTINUOUS, DEFAULT_CONTINUOUS_2, DEFAULT_NUM_POINTS,
+    collect_sensitivity, feature_hash, iter_shap,
+)
+from app.services.model_registry import ModelSet
+from app.services.scheduler import BULK, EXPLANATION, scheduler
+from app.utils.logger import logger
+
+SENSITIVITY = "sensitivity"
+SHAP = "shap"
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+# ---------------- Payload encoding ----------------
+def pack(result: Dict) -> bytes:
+    return zlib.compress(orjson.dumps(result, option=ORJSON_OPTIONS), settings.artifact_compress_level)
+
+
+def unpack(blob: bytes) -> Dict:
+    return orjson.loads(zlib.decompress(blob))
+
+
+def _to_bytes_field(blob: bytes):
+    # Prisma maps Bytes columns to prisma.fields.Base64; the local backend keeps plain base64 text
+    if settings.db_backend == "prisma":
+        from prisma.fields import Base64
+        return Base64.encode(blob)
+    return base64.b64encode(blob).decode("ascii")
+
+
+def _from_bytes_field(value) -> bytes:
+    if isinstance(value, str):
+        return base64.b64decode(value)
+    return value.decode()
+
+
+def _curves_as_arrays(result: Dict) -> Dict:
+    """Stored curves come back as lists; restore ndarrays so ?float32 / binary encoding still applies."""
+    for curves in result.values():
+        for curve in curves.values():
+            curve["x"] = np.asarray(curve["x"], dtype=np.float64)
+            curve["y"] = np.asarray(curve["y"], dtype=np.float64)
+    return result
+
+
+# ---------------- Keys ----------------
+def artifact_key(ms: ModelSet, kind: str, model: str, features: Dict,
+                 params: Optional[Dict] = None) -> Optional[Dict]:
+    """Unique key for a patient's artifact, or None when the request isn't tied to a stored patient."""
+    patient_id = features.get("id")
+    if patient_id in (None, "None") or not settings.artifacts_enabled:
+        return None
+    return {
+        "patientId": patient_id,
+        "kind": kind,
+        "model": model,
+        "modelVersion": ms.versions[model],
+        "featureHash": feature_hash(model, features, params),
+    }
+
+
+def sensitivity_params(continuous: List[str], continuous_2: List[str], num_points: int) -> Dict:
+    return {"continuous": list(continuous), "continuous_2": list(continuous_2), "num_points": num_points}
+
+
+def _where(key: Dict) -> Dict:
+    return {"patientId_kind_model_modelVersion_featureHash": key}
+
+
+# ---------------- Storage ----------------
+async def load(key: Optional[Dict]) -> Optional[Dict]:
+    if key is None:
+        return None
+    try:
+        async with acquire() as db:
+            row = await db.patientartifact.find_unique(where=_where(key))
+    except Exception as e:
+        logger.warning(f"Artifact lookup failed for {key['kind']}/{key['model']}: {e}")
+        return None
+    if row is None:
+        return None
+    result = unpack(_from_bytes_field(row.payload))
+    return _curves_as_arrays(result) if key["kind"] == SENSITIVITY else result
+
+
+async def exists(key: Optional[Dict]) -> bool:
+    if key is None:
+        return False
+    try:
+        async with acquire() as db:
+            return await db.patientartifact.count(where=_where(key)) > 0
+    except Exception:
+        return False
+
+
+async def store(key: Optional[Dict], result: Dict, replace: bool = False):
+    """Upsert one artifact; replace=True first drops the patient's older rows of the same kind/model."""
+    if key is None or not result:
+        return
+    if any(isinstance(v, dict) and "error" in v for v in result.values()):
+        return  # don't pin a failed sub-model until the next refresh
+    payload = _to_bytes_field(pack(result))
+    try:
+        async with acquire() as db:
+            if replace:
+                await db.patientartifact.delete_many(where={
+                    "patientId": key["patientId"],
+                    "kind": key["kind"],
+                    "model": key["model"],
+                })
+            await db.patientartifact.upsert(
+                where=_where(key),
+                data={"create": {**key, "payload": payload}, "update": {"payload": payload}},
+            )
+    except Exception as e:
+        logger.warning(f"Artifact write failed for {key['kind']}/{key['model']}: {e}")
+
+
+async def load_or_compute(key: Optional[Dict], compute: Callable[[], Dict]) -> Dict:
+    cached = await load(key)
+    if cached is not None:
+        return cached
+    result = await scheduler.run(EXPLANATION, compute)
+    await store(key, result)
+    return result
+
+
+# ---------------- Read paths ----------------
+async def sensitivity(ms: ModelSet, model: str, features: Dict, continuous: List[str],
+                      continuous_2: List[str], num_points: int) -> Dict:
+    key = artifact_key(ms, SENSITIVITY, model, features, sensitivity_params(continuous, continuous_2, num_points))
+    return await load_or_compute(
+        key, lambda: collect_sensitivity(ms, model, features, continuous, continuous_2, num_points)
+    )
+
+
+async def shap_values(ms: ModelSet, model: str, features: Dict) -> Dict:
+    key = artifact_key(ms, SHAP, model, features)
+    return await load_or_compute(key, lambda: dict(iter_shap(ms, model, features)))
+
+
+def iter_stored_sensitivity(result: Dict) -> Iterator[Tuple[str, Iterator]]:
+    """Same shape as inference.iter_sensitivity, fed from a stored artifact."""
+    for mapper_key, curves in result.items():
+        yield mapper_key, iter(curves.items())
+
+
+# ---------------- Precompute ----------------
+async def precompute_patient(ms: ModelSet, model: str, features: Dict):
+    """Refresh a patient's stored artifacts with the default sweep; run as a background task.
+
+    `ms` is the snapshot that served the prediction, so the artifacts match
+    the stored Prediction.modelVersion even if a reload happened since.
+    """
+    sens_key = artifact_key(
+        ms, SENSITIVITY, model, features,
+        sensitivity_params(DEFAULT_CONTINUOUS, DEFAULT_CONTINUOUS_2, DEFAULT_NUM_POINTS),
+    )
+    if sens_key is None:
+        return
+    shap_key = artifact_key(ms, SHAP, model, features)
+
+    try:
+        # unchanged inputs under the same model version: what's stored is still valid
+        if not await exists(sens_key):
+            curves = await scheduler.run(
+                BULK, collect_sensitivity,
+                ms, model, features, DEFAULT_CONTINUOUS, DEFAULT_CONTINUOUS_2, DEFAULT_NUM_POINTS,
+            )
+            await store(sens_key, curves, replace=True)
+
+        if not await exists(shap_key):
+            shap_result = await scheduler.run(BULK, lambda: dict(iter_shap(ms, model, features)))
+            await store(shap_key, shap_result, replace=True)
+    except Exception as e:
+        logger.warning(f"Artifact precompute failed for patient {sens_key['patientId']} ({model}): {e}")
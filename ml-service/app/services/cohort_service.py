@@ -0,0 +1,155 @@
+# app/services/cohort_service.py
+"""
+Cohort-level partial dependence (PDP) and ICE curves.
+
+For one feature, every row of the reference cohort (cohort_store) gets the
+same grid value and the whole cohort is scored in one batched predict call;
+that repeats for each grid value. The PDP is the mean over rows; ICE lines
+are the per-row curves of a fixed random subsample. Classifiers are
+described by the probability of the positive class, as the served label
+would only show where the majority flips.
+
+Grid values are quantiles of the feature across the cohort (5th-95th), so the
+curves cover where patients actually are. Metals are named by their LBX
+columns and moved together with their SI column (inference.set_feature),
+so hormone and menopause curves share an axis.
+
+Features are independent jobs: the route fans them out on the bulk lane, and
+scripts/cohort_pdp.py across a thread pool. Results are stored per (model,
+version, params, cohort), so a dashboard reads them straight from the store
+until the model or the cohort changes.
+"""
+import asyncio
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.preprocess.feature_mappers import METAL_SI, to_model_frame
+from app.services import cohort_store
+from app.services.inference import feature_values, set_feature
+from app.services.model_registry import ModelSet
+from app.services.scheduler import BULK, scheduler
+
+DEFAULT_FEATURES = list(METAL_SI)
+DEFAULT_GRID_POINTS = 20
+DEFAULT_ICE_LINES = 50
+GRID_QUANTILES = (0.05, 0.95)
+SEED = 42
+
+
+class CohortMissing(LookupError):
+    """No reference cohort has been built for a mapper key (python -m scripts.cohort_pdp)."""
+
+
+def cohort_params(features: List[str], grid_points: int, ice_lines: int) -> Dict:
+    return {"features": list(features), "grid_points": grid_points, "ice_lines": ice_lines}
+
+
+def _scorer(clf):
+    """(predict fn returning (rows, outputs), what the values are)."""
+    proba = getattr(getattr(clf, "model", None), "predict_proba", None)
+    if proba is not None:
+        return (lambda X: np.asarray(proba(X), dtype=float)[:, -1:]), "probability"
+    return (lambda X: np.asarray(clf.predict(X), dtype=float).reshape(len(X), -1)), "prediction"
+
+
+def feature_dependence(keys: List[str], clf, input_key: str, cohort: pd.DataFrame, feature: str,
+                       grid_points: int, ice_lines: int) -> Dict[str, Dict]:
+    """{mapper key: PDP / ICE of `feature`} for one prediction unit over the cohort."""
+    values = feature_values(cohort, feature)
+    observed = values[np.isfinite(values)]
+    if observed.size == 0:
+        raise ValueError(f"'{feature}' is never observed in the cohort")
+    grid = np.unique(np.quantile(observed, np.linspace(*GRID_QUANTILES, grid_points)))
+
+    rng = np.random.default_rng(SEED)
+    ice_rows = np.sort(rng.choice(len(cohort), size=min(ice_lines, len(cohort)), replace=False))
+    score, output = _scorer(clf)
+
+    frame = cohort.copy()
+    preds = np.empty((len(grid), len(cohort), len(keys)))
+    for g, value in enumerate(grid):
+        set_feature(frame, feature, np.full(len(frame), value))
+        preds[g] = score(to_model_frame(frame, input_key))
+
+    results = {}
+    for i, key in enumerate(keys):
+        results[key] = {
+            "grid": grid,
+            "pdp": preds[:, :, i].mean(axis=1),
+            "pdp_std": preds[:, :, i].std(axis=1),  # spread across patients at each grid value
+            "ice": preds[:, ice_rows, i].T,          # ice[k][g]: sampled row k at grid[g]
+            "deciles": np.quantile(observed, np.linspace(0.1, 0.9, 9)),
+            "observed": int(observed.size),
+            "output": output,
+        }
+    return results
+
+
+def input_keys(ms: ModelSet, model: str) -> List[str]:
+    return list(dict.fromkeys(input_key for _, _, input_key in ms.prediction_units(model)))
+
+
+def cohort_digest(digests: Dict[str, Optional[str]]) -> str:
+    missing = [key for key, digest in digests.items() if digest is None]
+    if missing:
+        raise CohortMissing(", ".join(missing))
+    return "+".join(digests[key] for key in sorted(digests))
+
+
+def jobs(ms: ModelSet, model: str, cohorts: Dict[str, pd.DataFrame], features: List[str],
+         grid_points: int, ice_lines: int) -> Iterator[Tuple]:
+    """Arguments of every feature_dependence call a model needs: one per (prediction unit, feature)."""
+    for keys, clf, input_key in ms.prediction_units(model):
+        for feature in features:
+            yield keys, clf, input_key, cohorts[input_key], feature, grid_points, ice_lines
+
+
+def assemble(job_args: List[Tuple], outcomes: List) -> Dict[str, Dict]:
+    """{mapper key: {feature: result or {"error": ...}}} from the jobs' outcomes (results or exceptions)."""
+    result: Dict[str, Dict] = {}
+    for (keys, _, _, _, feature, _, _), outcome in zip(job_args, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"⚠️ Cohort dependence failed for {keys} / {feature}: {outcome}")
+            outcome = {key: {"error": str(outcome)} for key in keys}
+        for key, curve in outcome.items():
+            result.setdefault(key, {})[feature] = curve
+    return result
+
+
+def _as_arrays(result: Dict) -> Dict:
+    """Stored curves come back as lists; restore ndarrays so ?float32 / binary encoding still applies."""
+    for curves in result.values():
+        for curve in curves.values():
+            for field in ("grid", "pdp", "pdp_std", "ice", "deciles"):
+                if field in curve:
+                    curve[field] = np.asarray(curve[field], dtype=np.float64)
+    return result
+
+
+def has_errors(result: Dict) -> bool:
+    return any("error" in curve for curves in result.values() for curve in curves.values())
+
+
+async def dependence(ms: ModelSet, model: str, features: Optional[List[str]] = None,
+                     grid_points: int = DEFAULT_GRID_POINTS, ice_lines: int = DEFAULT_ICE_LINES) -> Dict:
+    """Stored PDP / ICE for the serving version of `model`, computing (one bulk job per feature) on a miss."""
+    features = list(features or DEFAULT_FEATURES)
+    params = cohort_params(features, grid_points, ice_lines)
+    version = ms.versions[model]
+    keys = input_keys(ms, model)
+    digest = cohort_digest({key: await asyncio.to_thread(cohort_store.cohort_digest, key) for key in keys})
+
+    stored = await asyncio.to_thread(cohort_store.load_result, model, version, params, digest)
+    if stored is not None:
+        return _as_arrays(stored)
+
+    cohorts = {key: (await asyncio.to_thread(cohort_store.load_cohort, key))[1] for key in keys}
+    job_args = list(jobs(ms, model, cohorts, features, grid_points, ice_lines))
+    outcomes = await asyncio.gather(*(scheduler.run(BULK, feature_dependence, *args) for args in job_args),
+                                    return_exceptions=True)
+    result = assemble(job_args, outcomes)
+    if not has_errors(result):
+        await asyncio.to_thread(cohort_store.save_result, model, version, params, digest, result)
+    return result
@@ -0,0 +1,110 @@
+# app/services/cohort_store.py
+"""
+SQLite store for cohort partial dependence (see cohort_service.py).
+
+- cohorts: the reference cohort per mapper key, as mapped NHANES rows
+  (what feature_mappers produces from API input), written by
+  scripts/cohort_pdp.py from the training extracts
+- results: PDP / ICE per (model, model version, params, cohort digest), so
+  a new model version or a rebuilt cohort is a miss rather than a stale hit
+
+Payloads are zlib-compressed JSON. WAL mode, like the shadow store, so every
+worker process can share the file (settings.cohort_store_path).
+"""
+import hashlib
+import sqlite3
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+import orjson
+import pandas as pd
+
+from app.core.config import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cohorts (
+    input_key TEXT PRIMARY KEY, digest TEXT, rows INTEGER, source TEXT, created REAL, payload BLOB
+);
+CREATE TABLE IF NOT EXISTS results (
+    model TEXT, version TEXT, params TEXT, cohort TEXT, created REAL, payload BLOB,
+    PRIMARY KEY (model, version, params, cohort)
+);
+"""
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or settings.cohort_store_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _pack(obj) -> bytes:
+    return zlib.compress(orjson.dumps(obj, option=ORJSON_OPTIONS), 6)
+
+
+def _unpack(blob: bytes):
+    return orjson.loads(zlib.decompress(blob))
+
+
+def save_cohort(input_key: str, frame: pd.DataFrame, source: str, path: Optional[str] = None) -> str:
+    """Replace the reference cohort of `input_key`; returns its digest."""
+    payload = _pack(frame.to_dict(orient="split"))
+    digest = hashlib.sha256(payload).hexdigest()[:16]
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO cohorts VALUES (?, ?, ?, ?, ?, ?)",
+                         (input_key, digest, len(frame), source, time.time(), payload))
+    finally:
+        conn.close()
+    return digest
+
+
+def cohort_digest(input_key: str, path: Optional[str] = None) -> Optional[str]:
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT digest FROM cohorts WHERE input_key = ?", (input_key,)).fetchone()
+    finally:
+        conn.close()
+    return None if row is None else row[0]
+
+
+def load_cohort(input_key: str, path: Optional[str] = None) -> Optional[Tuple[str, pd.DataFrame]]:
+    """(digest, mapped rows) of a reference cohort, or None when none was built."""
+    conn = connect(path)
+    try:
+        row = conn.execute("SELECT digest, payload FROM cohorts WHERE input_key = ?", (input_key,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    split = _unpack(row[1])
+    frame = pd.DataFrame(split["data"], columns=split["columns"]).apply(pd.to_numeric, errors="coerce")
+    return row[0], frame
+
+
+def save_result(model: str, version: str, params: Dict, cohort: str, result: Dict, path: Optional[str] = None):
+    conn = connect(path)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                         (model, version, orjson.dumps(params, option=ORJSON_OPTIONS).decode(), cohort,
+                          time.time(), _pack(result)))
+    finally:
+        conn.close()
+
+
+def load_result(model: str, version: str, params: Dict, cohort: str, path: Optional[str] = None) -> Optional[Dict]:
+    conn = connect(path)
+    try:
+        row = conn.execute(
+            "SELECT payload FROM results WHERE model = ? AND version = ? AND params = ? AND cohort = ?",
+            (model, version, orjson.dumps(params, option=ORJSON_OPTIONS).decode(), cohort),
+        ).fetchone()
+    finally:
+        conn.close()
+    return None if row is None else _unpack(row[0])
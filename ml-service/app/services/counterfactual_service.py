@@ -0,0 +1,160 @@
+# app/services/counterfactual_service.py
+"""
+"Minimum change" counterfactuals for models that read the blood metals only
+through risk bands (infertility: infertility_preprocessor.METAL_RISK_THRESHOLDS).
+
+Such a model can't tell two metal values in the same band apart, so the
+search is over band combinations rather than values: at most 3^5 = 243 of
+them, fewer with only reductions allowed. Each combination becomes the
+smallest value change reaching it (a reduced metal goes to the top of its
+new band, an increased one just above the bottom), the candidates are
+preprocessed in one batch, and then scored in rounds of equal total band
+distance from the patient, one batched predict per round.
+
+A candidate that changes every metal at least as far, in the same
+direction, as a counterfactual already found can't be a minimal one, so it
+is pruned before its round is scored; the rounds run in increasing distance,
+so every such candidate comes after the counterfactual it is measured
+against. The search stops early when the latency budget runs out and says so.
+
+Counterfactuals are ranked by how many metals change, then by the summed
+relative change of the values.
+"""
+import itertools
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.preprocess.feature_mappers import METAL_SI, map_all_features, to_model_frame
+from app.preprocess.infertility_preprocessor import METAL_FIELDS, METAL_RISK_THRESHOLDS, risk_bands
+from app.services.inference import set_feature
+from app.services.model_registry import ModelSet
+from app.services.uncertainty_service import measured_metals
+
+# models whose metal inputs are risk bands, i.e. the ones the search applies to
+BANDED_MODELS = {"infertility"}
+DEFAULT_BUDGET_MS = 250
+DEFAULT_MAX_RESULTS = 5
+
+# LBX field -> upper edges of bands 0 and 1, in METAL_RISK_THRESHOLDS order (risk_bands' order)
+BAND_EDGES = {METAL_FIELDS[metal]: (t["low"], t["medium"]) for metal, t in METAL_RISK_THRESHOLDS.items()}
+
+
+def _band_value(edges, band: int, current: int) -> float:
+    """The value closest to the current one that falls in `band` (bands are right-closed)."""
+    if band < current:
+        return float(edges[band])
+    return float(np.nextafter(edges[band - 1], np.inf))
+
+
+def search(ms: ModelSet, model: str, features: Dict, metals: Optional[List[str]] = None,
+           direction: str = "decrease", max_results: int = DEFAULT_MAX_RESULTS,
+           budget_ms: float = DEFAULT_BUDGET_MS) -> Dict:
+    """Smallest metal changes that move `model`'s prediction for the patient to a lower class."""
+    if model not in BANDED_MODELS:
+        raise ValueError(f"Counterfactual search needs a model that reads metals as risk bands: {sorted(BANDED_MODELS)}")
+    metals = list(METAL_SI) if metals is None else metals
+    unknown = sorted(set(metals) - set(METAL_SI))
+    if unknown:
+        raise ValueError(f"Unknown metal fields {unknown}; expected some of {list(METAL_SI)}")
+    start = time.perf_counter()
+
+    clf = ms.models[model]
+    classes = clf.model.classes_
+    row = map_all_features(features)[model]
+    fields = list(BAND_EDGES)
+    values = measured_metals({model: row})
+    current = np.array(risk_bands(row))
+
+    # bands each metal may take; unmeasured metals and those not asked for stay put
+    options = []
+    for i, field in enumerate(fields):
+        if field not in metals or values[field] is None:
+            options.append([current[i]])
+        elif direction == "decrease":
+            options.append(list(range(current[i] + 1)))
+        else:
+            options.append([0, 1, 2])
+    bands = np.array(list(itertools.product(*options)), dtype=int)
+    base = int(np.flatnonzero((bands == current).all(axis=1))[0])
+
+    # one mapped row per combination, the changed metals at their nearest value in the new band
+    frame = pd.DataFrame([row]).iloc[np.zeros(len(bands), dtype=int)].reset_index(drop=True)
+    targets = np.empty(bands.shape)
+    for i, field in enumerate(fields):
+        if len(options[i]) == 1:
+            targets[:, i] = np.nan
+            continue
+        targets[:, i] = [values[field] if b == current[i] else _band_value(BAND_EDGES[field], b, current[i])
+                         for b in bands[:, i]]
+        set_feature(frame, field, targets[:, i])
+    X = to_model_frame(frame, model)
+
+    proba = np.full((len(bands), len(classes)), np.nan)
+    proba[base] = clf.model.predict_proba(X.iloc[[base]])[0]
+    served = int(proba[base].argmax())
+
+    delta = bands - current
+    distance = np.abs(delta).sum(axis=1)
+    found: List[int] = []
+    evaluated, pruned, complete = 1, 0, True
+    for d in range(1, int(distance.max()) + 1 if served > 0 else 1):
+        if 1000 * (time.perf_counter() - start) > budget_ms:
+            complete = False
+            break
+        idx = np.flatnonzero(distance == d)
+        if found:
+            # changes every metal at least as far, same way, as a counterfactual already found
+            ref = delta[found][None, :, :]
+            cand = delta[idx][:, None, :]
+            covers = (ref == 0) | ((np.sign(cand) == np.sign(ref)) & (np.abs(cand) >= np.abs(ref)))
+            dominated = covers.all(axis=2).any(axis=1)
+            pruned += int(dominated.sum())
+            idx = idx[~dominated]
+        if idx.size == 0:
+            continue
+        proba[idx] = clf.model.predict_proba(X.iloc[idx])
+        evaluated += idx.size
+        found.extend(int(i) for i in idx[proba[idx].argmax(axis=1) < served])
+
+    def describe(i: int) -> Dict:
+        changes = {}
+        for j, field in enumerate(fields):
+            if delta[i, j] == 0:
+                continue
+            changes[field] = {
+                "from": values[field], "to": float(BAND_EDGES[field][bands[i, j]] if delta[i, j] < 0
+                                                   else BAND_EDGES[field][bands[i, j] - 1]),
+                "bound": "<=" if delta[i, j] < 0 else ">",
+                "from_band": int(current[j]), "to_band": int(bands[i, j]),
+                "relative_change": float((targets[i, j] - values[field]) / values[field]),
+            }
+        return {
+            "changes": changes,
+            "label": float(classes[int(np.nanargmax(proba[i]))]),
+            "probability": float(proba[i, served]),  # of the patient's current class
+            "cost": float(np.abs([c["relative_change"] for c in changes.values()]).sum()),
+        }
+
+    counterfactuals = sorted((describe(i) for i in found), key=lambda c: (len(c["changes"]), c["cost"]))
+    response = {
+        "current": {
+            "label": float(classes[served]),
+            "probability": float(proba[base, served]),
+            "bands": {field: int(b) for field, b in zip(fields, current)},
+            "values": values,
+        },
+        "flagged": served > 0,
+        "counterfactuals": counterfactuals[:max_results],
+        "candidates": len(bands) - 1, "evaluated": evaluated - 1, "pruned": pruned,
+        "complete": complete, "ms": 1000 * (time.perf_counter() - start),
+    }
+    if served > 0 and not found:
+        # nothing flips the class within the search: the combination that lowers the risk most
+        scored = np.flatnonzero(~np.isnan(proba[:, served]))
+        closest = int(scored[proba[scored, served].argmin()])
+        if closest != base:
+            response["closest"] = describe(closest)
+    return response
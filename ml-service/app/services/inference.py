@@ -0,0 +1,419 @@
+# app/services/inference.py
+"""
+The compute behind the prediction, sensitivity and SHAP routes.
+
+Models come from a ModelSet snapshot (see model_registry.py) that the route
+takes once per request and passes in, so a hot reload can't swap versions
+half-way through a request.
+
+Sensitivity and SHAP are exposed as generators that produce one sub-model /
+feature at a time, so routes can either collect them into a single response
+or stream them without holding every curve in memory.
+"""
+import hashlib
+import weakref
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import orjson
+import pandas as pd
+import shap
+from sklearn.pipeline import Pipeline
+
+from app.preprocess.feature_mappers import FEATURE_MAPPERS, METAL_SI, map_all_features, to_model_frame
+from app.services.model_registry import MODEL_FILES, ModelSet
+
+# --- Sensitivity defaults (also what the precompute pipeline stores) ---
+DEFAULT_CONTINUOUS = ["LBDBPBSI", "LBDBCDSI", "LBDTHGSI", "LBDBSESI", "LBDBMNSI"]
+DEFAULT_CONTINUOUS_2 = ["LBXBPB", "LBXBCD", "LBXTHG", "LBXSE", "LBXBMN"]
+DEFAULT_NUM_POINTS = 1000
+
+def build_feature_df(features: Dict, model_key: str) -> pd.DataFrame:
+    mapper = FEATURE_MAPPERS.get(model_key)
+    if not mapper:
+        raise ValueError(f"No feature mapper for {model_key}")
+    mapped = mapper(features)
+    # print(f"Mapped features for {model_key}: {mapped}")
+    return to_model_frame(pd.DataFrame([mapped]), model_key)
+
+def mapper_keys(model: str) -> List[str]:
+    """Feature mapper keys of a model; grouped models like hormone have one per sub-model."""
+    spec = MODEL_FILES[model]
+    return [f"{model}_{sm}" for sm in spec] if isinstance(spec, dict) else [model]
+
+def model_input(features: Dict, mapper_key: str, clf=None) -> pd.DataFrame:
+    """Model-ready frame for one sub-model (see feature_mappers.to_model_frame).
+
+    Pass the sub-model when it may be an output of a fused model, which reads
+    the fused model's row (its `input_key`) instead of the sub-model's own.
+    """
+    return build_feature_df(features, getattr(clf, "input_key", mapper_key))
+
+def model_inputs(features: Dict, keys: List[str]) -> Dict[str, pd.DataFrame]:
+    """Model-ready frames for the given mapper keys, mapping the patient only once."""
+    rows = map_all_features(features)
+    return {key: to_model_frame(pd.DataFrame([rows[key]]), key) for key in dict.fromkeys(keys)}
+
+def feature_hash(model: str, features: Dict, extra=None) -> str:
+    """Hash of the model-ready rows (plus any request params) a result depends on.
+
+    Hashing after mapping means fields the models never see (name, contact
+    details, timestamps) don't split the key.
+    """
+    return frames_hash({key: model_input(features, key) for key in mapper_keys(model)}, extra)
+
+def frames_hash(frames: Dict[str, pd.DataFrame], extra=None) -> str:
+    """feature_hash over frames already built (e.g. by model_inputs)."""
+    rows = {key: X.to_dict(orient="records") for key, X in frames.items()}
+    blob = orjson.dumps(
+        {"rows": rows, "extra": extra},
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+    )
+    return hashlib.sha256(blob).hexdigest()[:32]
+
+# ---------------- Sensitivity ----------------
+def feature_sensitivity(model, X_row: pd.Series, feature: str, num_points: int = 1000):
+    """Return x (feature values) and y (predictions) as arrays, without plotting."""
+    base_value = X_row[feature]
+    fmin, fmax = base_value * 0.1, base_value * 10
+    feature_values = np.linspace(fmin, fmax, num_points)
+
+    varied_rows = pd.DataFrame([X_row.values] * num_points, columns=X_row.index)
+    varied_rows[feature] = feature_values
+
+    preds = model.predict(varied_rows)
+
+    return feature_values, np.asarray(preds)
+
+def _sensitivity_curves(clf, mapper_key: str, features: Dict, continuous: List[str], num_points: int):
+    X = model_input(features, mapper_key, clf)
+    X_row = X.iloc[0]
+
+    try:
+        original_y = float(clf.predict(pd.DataFrame([X_row]))[0])
+    except Exception as e:
+        print(f"⚠️ Model prediction failed for '{mapper_key}': {e}")
+        return
+
+    for feature in continuous:
+        if feature not in X_row.index:
+            continue
+        base_val = X_row[feature]
+
+        if base_val is None or pd.isna(base_val):
+            print(f"⚠️ Skipping '{feature}' — missing or invalid base value")
+            continue
+        try:
+            base_val = float(base_val)
+        except (TypeError, ValueError):
+            print(f"⚠️ Skipping '{feature}' — non-numeric base value ({base_val})")
+            continue
+
+        x_vals, y_vals = feature_sensitivity(clf, X_row, feature, num_points)
+        if len(x_vals) == 0 or len(y_vals) == 0:
+            continue
+
+        yield feature, {
+            "x": x_vals,
+            "y": y_vals,
+            "original_x": base_val,
+            "original_y": original_y,
+        }
+
+def iter_sensitivity(ms: ModelSet, model: str, features: Dict, continuous: List[str], continuous_2: List[str],
+                     num_points: int) -> Iterator[Tuple[str, Iterator]]:
+    """Yield (mapper_key, curves) where curves lazily yields (feature, result).
+
+    Grouped models (hormone) sweep the SI columns in `continuous`; single
+    models sweep the raw LBX columns in `continuous_2`.
+    """
+    grouped = isinstance(ms.models[model], dict)
+    for mapper_key, clf in ms.submodels(model):
+        yield mapper_key, _sensitivity_curves(
+            clf, mapper_key, features, continuous if grouped else continuous_2, num_points
+        )
+
+def collect_sensitivity(ms: ModelSet, model: str, *args) -> Dict:
+    return {key: dict(curves) for key, curves in iter_sensitivity(ms, model, *args)}
+
+# ---------------- 2D sensitivity ----------------
+# A pair of features is swept over a grid in the mapped row (before
+# to_model_frame), so derived inputs like infertility's risk bands and the
+# hormone domain rules follow the grid exactly as they would follow a real
+# patient. A metal can be named by its LBX or its SI column; both are moved
+# together wherever the model reads either.
+#
+# grid="thresholds": tree ensembles are piecewise constant between their split
+# points, so an axis only needs one point per interval between consecutive
+# thresholds (inside the sweep range) to give the exact surface. When there are
+# more intervals than num_points (deep forests), the points are spaced by split
+# density instead, so they land where the model actually changes. Either needs
+# the feature to reach the trees through an affine per-column step (imputer,
+# scaler, passthrough); other axes (infertility's risk bands) stay uniform.
+DEFAULT_GRID_POINTS = 50
+MAX_GRID_POINTS = 200
+
+_split_cache: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+def _pipeline_parts(clf):
+    """(steps before the estimator or None, final estimator) of a served model."""
+    owner = getattr(clf, "fused", clf)  # an OutputView's trees are its FusedModel's
+    pipeline = getattr(owner, "model", owner)
+    if isinstance(pipeline, Pipeline):
+        return (pipeline[:-1] if len(pipeline.steps) > 1 else None), pipeline.steps[-1][1]
+    return None, pipeline
+
+def _tree_splits(estimator) -> Optional[Dict[int, np.ndarray]]:
+    """Sorted split thresholds per input column index of a fitted tree ensemble; None for other models."""
+    if estimator in _split_cache:
+        return _split_cache[estimator]
+    features, thresholds = [], []
+    if hasattr(estimator, "get_booster"):
+        booster = orjson.loads(estimator.get_booster().save_raw("json"))["learner"]["gradient_booster"]
+        for tree in booster.get("gbtree", booster)["model"]["trees"]:
+            internal = np.asarray(tree["left_children"]) != -1
+            features.append(np.asarray(tree["split_indices"])[internal])
+            thresholds.append(np.asarray(tree["split_conditions"], dtype=float)[internal])
+    elif hasattr(estimator, "tree_") or hasattr(estimator, "estimators_"):
+        trees = [estimator] if hasattr(estimator, "tree_") else np.ravel(estimator.estimators_)
+        for tree in trees:
+            internal = tree.tree_.feature >= 0
+            features.append(tree.tree_.feature[internal])
+            thresholds.append(tree.tree_.threshold[internal])
+    else:
+        return None
+    if not features:
+        return {}
+    features, thresholds = np.concatenate(features), np.concatenate(thresholds)
+    splits = {int(f): np.unique(thresholds[features == f]) for f in np.unique(features)}
+    _split_cache[estimator] = splits
+    return splits
+
+def set_feature(frame: pd.DataFrame, feature: str, values):
+    """Write `values` of `feature` into mapped rows, moving a metal's LBX and SI columns together."""
+    columns = {feature: values}
+    for field, (si_column, multiplier, atomic_weight) in METAL_SI.items():
+        if feature == field:
+            columns[si_column] = np.asarray(values, dtype=float) * multiplier / atomic_weight
+        elif feature == si_column:
+            columns[field] = np.asarray(values, dtype=float) * atomic_weight / multiplier
+    read = {col: v for col, v in columns.items() if col in frame.columns}
+    if not read:
+        raise ValueError(f"'{feature}' is not an input of this model")
+    for col, v in read.items():
+        frame[col] = v
+
+def feature_values(frame: pd.DataFrame, feature: str) -> np.ndarray:
+    """`feature` of mapped rows as floats, converted from the metal's other column when only that one is there."""
+    if feature in frame.columns:
+        return pd.to_numeric(frame[feature], errors="coerce").to_numpy(dtype=float)
+    for field, (si_column, multiplier, atomic_weight) in METAL_SI.items():
+        if feature == field and si_column in frame.columns:
+            return feature_values(frame, si_column) * atomic_weight / multiplier
+        if feature == si_column and field in frame.columns:
+            return feature_values(frame, field) * multiplier / atomic_weight
+    raise ValueError(f"'{feature}' is not an input of this model")
+
+def _base_value(row: Dict, feature: str) -> float:
+    value = feature_values(pd.DataFrame([row]), feature)[0]
+    if not np.isfinite(value) or value <= 0:
+        raise ValueError(f"No usable base value for '{feature}' ({value})")
+    return float(value)
+
+def _axis_splits(clf, input_key: str, row: Dict, feature: str, base: float) -> Optional[np.ndarray]:
+    """Split points of `feature` in its own units, when it reaches the trees affinely (see above)."""
+    pre, estimator = _pipeline_parts(clf)
+    splits = _tree_splits(estimator)
+    if splits is None:
+        return None
+    probe = pd.DataFrame([row] * 3)
+    xs = np.array([0.5, 1.0, 2.0]) * base
+    set_feature(probe, feature, xs)
+    X = to_model_frame(probe, input_key)
+    if pre is not None:
+        out = np.asarray(pre.transform(X), dtype=float)
+    else:
+        names = getattr(estimator, "feature_names_in_", None)
+        out = np.asarray((X if names is None else X.reindex(columns=list(names))), dtype=float)
+    moved = np.flatnonzero(~np.isclose(out[0], out[2], equal_nan=True))
+    if len(moved) != 1:
+        return None
+    j = int(moved[0])
+    slope = (out[2, j] - out[0, j]) / (xs[2] - xs[0])
+    if not np.isclose(out[1, j], out[0, j] + slope * (xs[1] - xs[0])):
+        return None
+    return np.sort((splits.get(j, np.empty(0)) - (out[0, j] - slope * xs[0])) / slope)
+
+def _grid_axis(base: float, num_points: int, splits: Optional[np.ndarray]) -> Tuple[np.ndarray, Optional[np.ndarray], str]:
+    """(points, interval edges or None, grid used); the sweep range is the 1D one, base * [0.1, 10]."""
+    lo, hi = base * 0.1, base * 10
+    if splits is not None:
+        inner = splits[(splits > lo) & (splits < hi)]
+        if len(inner) + 1 <= num_points:
+            edges = np.concatenate([[lo], inner, [hi]])
+            return (edges[:-1] + edges[1:]) / 2, edges, "thresholds"
+        # too many splits to give every interval a point: space points by split density instead
+        cuts = np.quantile(inner, np.linspace(0, 1, num_points + 1)[1:-1])
+        edges = np.concatenate([[lo], cuts, [hi]])
+        return (edges[:-1] + edges[1:]) / 2, None, "split_quantiles"
+    return np.linspace(lo, hi, num_points), None, "uniform"
+
+def _sensitivity_surface(keys: List[str], clf, input_key: str, row: Dict, feature_x: str, feature_y: str,
+                         num_points: int, grid: str) -> Dict[str, Dict]:
+    """{mapper key: surface} for one prediction unit, from a single predict call."""
+    bases = {f: _base_value(row, f) for f in (feature_x, feature_y)}
+    axes = {}
+    for f in (feature_x, feature_y):
+        splits = _axis_splits(clf, input_key, row, f, bases[f]) if grid == "thresholds" else None
+        axes[f] = _grid_axis(bases[f], num_points, splits)
+    (xs, x_edges, x_grid), (ys, y_edges, y_grid) = axes[feature_x], axes[feature_y]
+
+    # every grid point plus the patient's own row (last), as one batch
+    rows = pd.DataFrame([row] * (len(xs) * len(ys) + 1))
+    set_feature(rows, feature_x, np.append(np.tile(xs, len(ys)), bases[feature_x]))
+    set_feature(rows, feature_y, np.append(np.repeat(ys, len(xs)), bases[feature_y]))
+    preds = np.asarray(clf.predict(to_model_frame(rows, input_key)), dtype=float).reshape(len(rows), -1)
+
+    surfaces = {}
+    for i, key in enumerate(keys):
+        surface = {
+            "x": xs, "y": ys,
+            "z": preds[:-1, i].reshape(len(ys), len(xs)),  # z[j][i] is at (x[i], y[j])
+            "grid": {"x": x_grid, "y": y_grid},
+            "original_x": bases[feature_x], "original_y": bases[feature_y], "original_z": float(preds[-1, i]),
+        }
+        if x_edges is not None:
+            surface["x_edges"] = x_edges
+        if y_edges is not None:
+            surface["y_edges"] = y_edges
+        surfaces[key] = surface
+    return surfaces
+
+def iter_sensitivity2d(ms: ModelSet, model: str, features: Dict, feature_x: str, feature_y: str,
+                       num_points: int = DEFAULT_GRID_POINTS, grid: str = "uniform") -> Iterator[Tuple[str, Dict]]:
+    """Yield (mapper_key, surface or {"error": ...}); a fused model's outputs share one grid and call."""
+    rows = map_all_features(features)
+    for keys, clf, input_key in ms.prediction_units(model):
+        try:
+            surfaces = _sensitivity_surface(keys, clf, input_key, rows[input_key], feature_x, feature_y,
+                                            num_points, grid)
+        except Exception as e:
+            print(f"⚠️ 2D sensitivity failed for {keys}: {e}")
+            surfaces = {key: {"error": str(e)} for key in keys}
+        yield from surfaces.items()
+
+def collect_sensitivity2d(ms: ModelSet, model: str, *args) -> Dict:
+    return dict(iter_sensitivity2d(ms, model, *args))
+
+# ---------------- SHAP ----------------
+def unwrap_model(obj):
+    """Recursively unwrap pipelines and nested model containers to get the final estimator."""
+    if isinstance(obj, Pipeline):
+        try:
+            last_step = list(obj.named_steps.values())[-1]
+            return unwrap_model(last_step)
+        except Exception:
+            return obj
+    if hasattr(obj, "model"):
+        return unwrap_model(obj.model)
+    return obj
+
+def _background(clf, X_transformed):
+    background = getattr(clf, "background", None)
+    if background is not None:
+        return background
+    return X_transformed[:30] if len(X_transformed) > 30 else X_transformed
+
+#  Core: SHAP computation per submodel
+def compute_shap_for_model(clf, mapper_key: str, features: Dict):
+    try:
+        #  Step 1: Build input DataFrame
+        X = model_input(features, mapper_key, clf)
+
+        pipeline = clf.model  # e.g. your JoblibModel wrapper exposes .model
+
+        #  Step 2: Identify preprocessor & model
+        preprocessor, model_obj = None, None
+        try:
+            if isinstance(pipeline, Pipeline):
+                if "preprocessor_and_model" in pipeline.named_steps:
+                    inner = pipeline.named_steps["preprocessor_and_model"]
+                    preprocessor = inner.named_steps.get("preprocessor", None)
+                    model_obj = inner.named_steps.get("model", inner)
+                else:
+                    preprocessor = pipeline.named_steps.get("preprocessor", None)
+                    model_obj = pipeline.named_steps.get("model", pipeline)
+            else:
+                model_obj = pipeline
+        except Exception as e:
+            print(f" Error extracting preprocessor/model for {mapper_key}: {e}")
+            model_obj = unwrap_model(pipeline)
+
+        #  Step 3: Transform input if preprocessor exists
+        X_transformed = X
+        if preprocessor is not None and hasattr(preprocessor, "transform"):
+            try:
+                X_transformed = preprocessor.transform(X)
+            except Exception as e:
+                print(f" Preprocessor transform failed for {mapper_key}: {e}")
+
+        #  Step 4: Get feature names (post-transform)
+        if preprocessor is not None and hasattr(preprocessor, "get_feature_names_out"):
+            feature_names = preprocessor.get_feature_names_out()
+        else:
+            feature_names = X.columns
+
+        # Step 5: Unwrap model completely
+        model_obj = unwrap_model(model_obj)
+        model_name = str(type(model_obj)).lower()
+        print(f"Final model for {mapper_key}: {model_obj.__class__.__name__}")
+
+        # Step 6: Compute SHAP values
+        try:
+            if any(k in model_name for k in ["xgb", "xgboost", "lightgbm", "randomforest", "gradientboosting"]):
+                explainer = shap.TreeExplainer(model_obj)
+                shap_values = explainer.shap_values(X_transformed)
+                expected_value = explainer.expected_value
+
+                #  Handle classifiers (list of arrays)
+                if isinstance(shap_values, list):
+                    # For binary classifiers → take positive class (1)
+                    shap_values = shap_values[1] if len(shap_values) > 1 else shap_values[0]
+
+                if isinstance(expected_value, list):
+                    expected_value = expected_value[1] if len(expected_value) > 1 else expected_value[0]
+
+            else:
+                # Kernel fallback (for linear or other models, and fused outputs: vector-leaf trees
+                # aren't supported by TreeExplainer); fused artifacts ship training rows as background
+                bg = _background(clf, X_transformed)
+                explainer = shap.KernelExplainer(model_obj.predict, bg)
+                shap_values = explainer.shap_values(X_transformed[:1])
+                expected_value = float(np.mean(model_obj.predict(bg)))
+
+        except Exception as e:
+            print(f" TreeExplainer failed for {mapper_key}, fallback to KernelExplainer: {e}")
+            bg = _background(clf, X_transformed)
+            explainer = shap.KernelExplainer(model_obj.predict, bg)
+            shap_values = explainer.shap_values(X_transformed[:1])
+            expected_value = float(np.mean(model_obj.predict(bg)))
+
+        # --- Step 7: Format result JSON -------------------------
+        shap_vals_row = shap_values[0] if hasattr(shap_values, "__len__") else shap_values
+        shap_vals_row = np.array(shap_vals_row).flatten().tolist()
+        features_used = list(feature_names)
+
+        return {
+            "expected_value": float(expected_value),
+            "features": features_used,
+            "values": shap_vals_row,
+        }
+
+    except Exception as e:
+        print(f" SHAP computation failed for {mapper_key}: {e}")
+        return {"error": str(e)}
+
+def iter_shap(ms: ModelSet, model: str, features: Dict) -> Iterator[Tuple[str, Dict]]:
+    """Yield (mapper_key, shap result) one sub-model at a time."""
+    for mapper_key, clf in ms.submodels(model):
+        yield mapper_key, compute_shap_for_model(clf, mapper_key, features)
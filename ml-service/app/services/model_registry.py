@@ -0,0 +1,306 @@
+# app/services/model_registry.py
+"""
+Versioned model registry with background hot reload.
+
+A ModelSet is an immutable snapshot: the loaded models, the files behind them
+and a version id per model key (content hash of its artifact files). The
+registry always points at exactly one. A reload loads the next ModelSet in a
+worker thread while the current one keeps serving, then swaps the reference
+in a single assignment.
+
+Requests read `registry.current` once and pass that snapshot down, so one
+request never mixes versions (prediction, stored artifacts and the
+Prediction.modelVersion column agree). A replaced snapshot is freed as soon
+as the last in-flight request holding it finishes.
+
+watch() polls the artifact directory (the files in use plus manifest.json)
+every model_reload_interval seconds; dropping new artifacts and a manifest
+written by `python -m scripts.train` into app/models/saved is enough to roll
+a model on every worker without a restart.
+
+A manifest entry for a whole group ("hormone", a fused multi-output model
+from `python -m scripts.train --models hormone`) replaces the files of the
+sub-models it has outputs for; those are served as views of the one fused
+model (see app/models/fused_model.py), the others keep their own files.
+Dropping the entry goes back to the separate files. Training only stages
+fused models; scripts/fusion_report.py promotes one into the manifest.
+
+The manifest may also list shadow candidates per mapper key, e.g.
+{"shadow": {"hormone_shbg": ["xgb_model_shbg_01.joblib"]}}. They are loaded
+into the same ModelSet and scored off the request path by shadow_service.py.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import orjson
+
+from app.models.fused_model import OutputView, load_model
+from app.models.joblib_model import JoblibModel
+from app.preprocess.feature_mappers import COLUMN_ORDERS
+from app.utils.logger import logger
+
+MODELS_DIR = Path(__file__).parent.parent / "models" / "saved"
+# Written by the training pipeline (python -m scripts.train)
+MANIFEST_PATH = MODELS_DIR / "manifest.json"
+
+# --- Default model files (grouped models map sub-model -> file); the manifest overrides these ---
+MODEL_FILES = {
+    "hormone": {
+        "testosterone": "xgb_model_tst_03.joblib",
+        "estradiol": "xgb_model_est_02.joblib",
+        "shbg": "xgb_model_shbg_03.joblib",
+    },
+    "menopause": "Menopause_Pipeline_Model.joblib",
+    "menstrual": "Menstrual_Pipeline_Model.joblib",
+    "infertility": "best_model_risk_only.joblib",
+}
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_manifest(path: Path = MANIFEST_PATH) -> Dict:
+    if not path.exists():
+        return {}
+    try:
+        return orjson.loads(path.read_bytes())
+    except Exception as e:
+        print(f"⚠️ Ignoring unreadable model manifest {path.name}: {e}")
+        return {}
+
+
+def apply_manifest(files: Dict, path: Path = MANIFEST_PATH) -> Dict:
+    """MODEL_FILES with the artifacts listed in the training manifest swapped in.
+
+    Entries whose feature order no longer matches COLUMN_ORDERS are skipped,
+    so a stale artifact can't be fed columns it wasn't trained on. A group
+    entry (fused model) wins over entries for the sub-models it has outputs for.
+    """
+    entries = read_manifest(path).get("models", {})
+    if not entries:
+        return files
+
+    files = {k: dict(v) if isinstance(v, dict) else v for k, v in files.items()}
+    usable = {}
+    for key, entry in entries.items():
+        if entry.get("features") != COLUMN_ORDERS.get(key):
+            print(f"⚠️ Skipping manifest entry '{key}' — feature order differs from COLUMN_ORDERS")
+        elif not (path.parent / entry["file"]).exists():
+            print(f"⚠️ Skipping manifest entry '{key}' — {entry['file']} not found")
+        else:
+            usable[key] = entry
+
+    fused = {}  # group -> sub-models served by its fused entry
+    for key, entry in usable.items():
+        if isinstance(files.get(key), dict):
+            outputs = entry.get("outputs") or list(files[key])
+            files[key].update({sm: entry["file"] for sm in outputs})
+            fused[key] = set(outputs)
+        elif "_" not in key:
+            files[key] = entry["file"]
+    for key, entry in usable.items():
+        group, _, submodel = key.partition("_")
+        if not submodel or submodel in fused.get(group, ()):
+            continue
+        if isinstance(files.get(group), dict):
+            files[group][submodel] = entry["file"]
+        else:
+            files[key] = entry["file"]
+    return files
+
+
+def shadow_files(path: Path = MANIFEST_PATH) -> Dict[str, List[str]]:
+    """Shadow candidates per mapper key (the manifest's "shadow" section)."""
+    shadow = read_manifest(path).get("shadow", {})
+    return {key: list(names) for key, names in shadow.items() if key in COLUMN_ORDERS and names}
+
+
+def _file_names(spec) -> List[str]:
+    return sorted(spec.values()) if isinstance(spec, dict) else [spec]
+
+
+def _version(spec, models_dir: Path) -> str:
+    """Content hash of the artifact file(s) behind a model key."""
+    h = hashlib.sha256()
+    for fname in _file_names(spec):
+        h.update(file_digest(models_dir / fname).encode())
+    return h.hexdigest()[:12]
+
+
+def _load(spec, models_dir: Path):
+    if isinstance(spec, dict):
+        # a fused file serving several sub-models is loaded once; each takes its output's view
+        loaded = {fname: load_model(models_dir / fname) for fname in dict.fromkeys(spec.values())}
+        return {sm: loaded[fname][sm] if isinstance(loaded[fname], dict) else loaded[fname]
+                for sm, fname in spec.items()}
+    return load_model(models_dir / spec)
+
+
+def signature(files: Dict, shadows: Dict, models_dir: Path, manifest: Path) -> Tuple:
+    """Cheap change detector: (name, mtime, size) of the manifest and every file in use."""
+    names = [manifest.name] + [f for spec in files.values() for f in _file_names(spec)]
+    names += [f for candidates in shadows.values() for f in candidates]
+    out = []
+    for name in names:
+        try:
+            st = os.stat(models_dir / name)
+            out.append((name, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            out.append((name, None, None))
+    return tuple(out)
+
+
+def _load_shadows(shadows: Dict[str, List[str]], models_dir: Path, previous: Optional["ModelSet"]) -> Dict:
+    """{mapper_key: [(file, version, model)]}; a candidate that fails to load is skipped, not fatal."""
+    reuse = {(f, v): m for cands in (previous.shadows.values() if previous else []) for f, v, m in cands}
+    out = {}
+    for key, names in shadows.items():
+        loaded = []
+        for fname in names:
+            try:
+                version = _version(fname, models_dir)
+                model = reuse.get((fname, version)) or JoblibModel(models_dir / fname)
+            except Exception as e:
+                print(f"⚠️ Skipping shadow candidate {fname} for '{key}': {e}")
+                continue
+            loaded.append((fname, version, model))
+        if loaded:
+            out[key] = loaded
+    return out
+
+
+class ModelSet:
+    """One loaded generation of every model key (plus its shadow candidates)."""
+
+    def __init__(self, files: Dict, versions: Dict[str, str], models: Dict, sig: Tuple,
+                 shadows: Optional[Dict] = None):
+        self.files = files
+        self.versions = versions
+        self.models = models
+        self.signature = sig
+        self.shadows = shadows or {}
+        self.loaded_at = time.time()
+
+    def file_of(self, mapper_key: str) -> str:
+        """Artifact file behind one mapper key (hormone_shbg -> the shbg file of hormone, or the fused file)."""
+        if mapper_key in self.files:
+            return self.files[mapper_key]
+        group, _, submodel = mapper_key.partition("_")
+        spec = self.files[group]
+        return spec[submodel] if isinstance(spec, dict) else spec
+
+    def submodels(self, model: str) -> List[Tuple[str, object]]:
+        """(mapper_key, model) pairs; grouped models like hormone expand to one per sub-model."""
+        if isinstance(self.models[model], dict):
+            return [(f"{model}_{sm}", clf) for sm, clf in self.models[model].items()]
+        return [(model, self.models[model])]
+
+    def prediction_units(self, model: str) -> List[Tuple[List[str], object, str]]:
+        """(mapper keys, model, input mapper key) per predict call.
+
+        The sub-models served by one fused model are one call returning all
+        their values; any other sub-model is a call of its own.
+        """
+        units, seen = [], set()
+        for key, clf in self.submodels(model):
+            if not isinstance(clf, OutputView):
+                units.append(([key], clf, key))
+            elif id(clf.fused) not in seen:
+                seen.add(id(clf.fused))
+                units.append(([f"{model}_{name}" for name in clf.fused.outputs], clf.fused, clf.input_key))
+        return units
+
+    def describe(self) -> Dict:
+        return {
+            "versions": self.versions,
+            "files": self.files,
+            "shadow": {k: [{"file": f, "version": v} for f, v, _ in c] for k, c in self.shadows.items()},
+            "loaded_at": self.loaded_at,
+        }
+
+
+def build_model_set(defaults: Dict = MODEL_FILES, models_dir: Path = MODELS_DIR,
+                    manifest: Path = MANIFEST_PATH, previous: Optional[ModelSet] = None) -> ModelSet:
+    """Resolve the files, hash them and load every model key.
+
+    Keys whose version is unchanged since `previous` reuse its loaded models
+    instead of deserialising the same artifact again.
+    """
+    files = apply_manifest(defaults, manifest)
+    shadows = shadow_files(manifest)
+    sig = signature(files, shadows, models_dir, manifest)
+    versions = {name: _version(spec, models_dir) for name, spec in files.items()}
+    models = {}
+    for name, spec in files.items():
+        if previous is not None and previous.versions.get(name) == versions[name]:
+            models[name] = previous.models[name]
+        else:
+            models[name] = _load(spec, models_dir)
+    return ModelSet(files, versions, models, sig, _load_shadows(shadows, models_dir, previous))
+
+
+class ModelRegistry:
+    def __init__(self, defaults: Dict = MODEL_FILES, models_dir: Path = MODELS_DIR,
+                 manifest: Path = MANIFEST_PATH):
+        self.defaults = defaults
+        self.models_dir = models_dir
+        self.manifest = manifest
+        self.current = build_model_set(defaults, models_dir, manifest)
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._lock = asyncio.Lock()
+
+    def changed(self) -> bool:
+        files = apply_manifest(self.defaults, self.manifest)
+        sig = signature(files, shadow_files(self.manifest), self.models_dir, self.manifest)
+        return sig != self.current.signature
+
+    async def reload(self, force: bool = False) -> bool:
+        """Load the next ModelSet off the event loop and swap it in; True when a version changed."""
+        async with self._lock:
+            if not force and not self.changed():
+                return False
+            previous = self.current
+            try:
+                nxt = await asyncio.to_thread(
+                    build_model_set, self.defaults, self.models_dir, self.manifest, previous
+                )
+            except Exception as e:
+                # half-written artifact or a bad manifest: keep serving what's loaded and retry next poll
+                self.last_error = str(e)
+                logger.warning(f"Model reload failed, keeping current models: {e}")
+                return False
+
+            self.last_error = None
+            self.current = nxt  # the swap; requests already running keep `previous`
+            changed = {k: v for k, v in nxt.versions.items() if previous.versions.get(k) != v}
+            if nxt.describe()["shadow"] != previous.describe()["shadow"]:
+                changed["shadow"] = sorted(nxt.shadows)
+            if changed:
+                self.reloads += 1
+                logger.info(f"Models reloaded: {changed}")
+            return bool(changed)
+
+    async def watch(self, interval: float):
+        """Poll for new artifacts until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.warning(f"Model watcher error: {e}")
+
+    def describe(self) -> Dict:
+        return {**self.current.describe(), "reloads": self.reloads, "last_error": self.last_error}
+
+
+registry = ModelRegistry()
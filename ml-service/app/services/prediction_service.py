@@ -0,0 +1,33 @@
+from typing import Dict, Optional, Union
+
+from app.core.db import acquire, use_asyncpg
+from app.utils.logger import logger
+
+async def save_predictions(patient_id, values: Dict[str, float],
+                           model_version: Union[str, Dict[str, str], None] = None,
+                           idempotency_key: Optional[str] = None) -> int:
+    """Persist {model_key: value} for a patient in a single batched write, tagged with the model version.
+
+    `model_version` is one version for every row, or {model_key: version}
+    when the values come from several models (/predict/all).
+    With an `idempotency_key`, rows already written under that key (a retried
+    request) are skipped through the (idempotencyKey, model) unique constraint.
+    """
+    if patient_id in (None, "None") or not values:
+        return 0
+
+    versions = model_version if isinstance(model_version, dict) else {}
+    rows = [{"patientId": patient_id, "model": key, "value": value,
+             "modelVersion": versions.get(key) if versions else model_version,
+             "idempotencyKey": idempotency_key}
+            for key, value in values.items()]
+
+    if use_asyncpg():
+        from app.core import pg_pool
+        try:
+            return await pg_pool.write_predictions(rows)
+        except Exception as e:
+            logger.warning(f"asyncpg bulk write failed, falling back to Prisma: {e}")
+
+    async with acquire() as db:
+        return await db.prediction.create_many(data=rows, skip_duplicates=idempotency_key is not None)
@@ -0,0 +1,166 @@
+# app/services/scheduler.py
+"""
+Priority-lane scheduler for model work.
+
+Every CPU-bound model call (predictions, sensitivity sweeps, SHAP, shadow
+scoring, artifact precompute) goes through scheduler.run(lane, fn, ...)
+instead of Starlette's shared threadpool. Jobs wait in one FIFO per lane and
+are dispatched onto a dedicated pool of inference_workers threads:
+
+    interactive   /predict/{model}, /predict/all
+    explanation   on-demand /predict/sensitivity, /predict/shap (streamed ones per line)
+    bulk          background work: artifact precompute, shadow scoring
+
+When a worker frees up, the next job comes from the eligible lane with the
+lowest virtual time (weighted fair queuing: each dispatch advances a lane's
+clock by 1/weight, so under contention lanes share workers in proportion to
+their weights, and a lane that was idle doesn't bank credit). A lane at its
+concurrency limit is skipped, which keeps some workers free of bulk work, so
+a clinician's single-patient request waits at most for one running job while
+bulk still uses whatever capacity is spare.
+
+Queue time (enqueue -> start) and run time per lane are in GET /metrics/scheduler.
+"""
+import asyncio
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+INTERACTIVE = "interactive"
+EXPLANATION = "explanation"
+BULK = "bulk"
+
+_DONE = object()
+
+
+class Lane:
+    def __init__(self, name: str, weight: float, limit: int):
+        self.name = name
+        self.weight = max(weight, 1e-6)
+        self.limit = limit
+        self.queue: Deque = deque()
+        self.running = 0
+        self.vtime = 0.0
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.run_total = 0.0
+        self.queue_times: Deque[float] = deque(maxlen=1024)  # recent waits, for percentiles
+
+    def eligible(self) -> bool:
+        return bool(self.queue) and self.running < self.limit
+
+    def snapshot(self) -> Dict:
+        waits = np.array(self.queue_times) * 1000 if self.queue_times else None
+        return {
+            "weight": self.weight,
+            "limit": self.limit,
+            "queued": len(self.queue),
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "errors": self.errors,
+            "queue_ms_p50": float(np.percentile(waits, 50)) if waits is not None else 0.0,
+            "queue_ms_p99": float(np.percentile(waits, 99)) if waits is not None else 0.0,
+            "queue_ms_max": float(waits.max()) if waits is not None else 0.0,
+            "avg_run_ms": 1000 * self.run_total / (self.completed + self.errors)
+                          if self.completed + self.errors else 0.0,
+        }
+
+
+class InferenceScheduler:
+    def __init__(self, workers: int, lanes: Dict[str, tuple]):
+        """`lanes` maps name -> (weight, concurrency limit); a limit of 0 means all workers."""
+        self.workers = workers
+        self.lanes = {name: Lane(name, weight, min(limit or workers, workers))
+                      for name, (weight, limit) in lanes.items()}
+        self.running = 0
+        self._vclock = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        return self._executor
+
+    async def run(self, lane: str, fn: Callable, *args, **kwargs):
+        """Queue fn(*args, **kwargs) on `lane` and wait for its result."""
+        q = self.lanes[lane]
+        if not q.queue and q.running == 0:
+            q.vtime = max(q.vtime, self._vclock)  # no credit for time spent idle
+        future = asyncio.get_running_loop().create_future()
+        q.queue.append((future, functools.partial(fn, *args, **kwargs), time.perf_counter()))
+        q.submitted += 1
+        self._dispatch()
+        return await future
+
+    async def iterate(self, lane: str, iterator: Iterator) -> AsyncIterator:
+        """Drive a sync generator one item per job, so a long stream queues like everything else."""
+        while True:
+            item = await self.run(lane, next, iterator, _DONE)
+            if item is _DONE:
+                return
+            yield item
+
+    def _next_lane(self) -> Optional[Lane]:
+        eligible = [q for q in self.lanes.values() if q.eligible()]
+        return min(eligible, key=lambda q: q.vtime) if eligible else None
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self.running < self.workers:
+            q = self._next_lane()
+            if q is None:
+                return
+            future, call, enqueued = q.queue.popleft()
+            if future.cancelled():  # caller went away while queued
+                continue
+            q.queue_times.append(time.perf_counter() - enqueued)
+            self._vclock = q.vtime
+            q.vtime += 1.0 / q.weight
+            q.running += 1
+            self.running += 1
+            started = time.perf_counter()
+            job = loop.run_in_executor(self._pool(), call)
+            job.add_done_callback(functools.partial(self._finished, q, future, started))
+
+    def _finished(self, q: Lane, future: asyncio.Future, started: float, job: asyncio.Future):
+        q.running -= 1
+        self.running -= 1
+        q.run_total += time.perf_counter() - started
+        if job.cancelled():  # executor shut down
+            future.cancel()
+        elif job.exception() is not None:
+            q.errors += 1
+            if not future.done():
+                future.set_exception(job.exception())
+        else:
+            q.completed += 1
+            if not future.done():
+                future.set_result(job.result())
+        self._dispatch()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "running": self.running,
+            "lanes": {name: q.snapshot() for name, q in self.lanes.items()},
+        }
+
+
+scheduler = InferenceScheduler(settings.inference_workers, {
+    INTERACTIVE: (settings.interactive_weight, settings.interactive_limit),
+    EXPLANATION: (settings.explanation_weight, settings.explanation_limit),
+    BULK: (settings.bulk_weight, settings.bulk_limit),
+})
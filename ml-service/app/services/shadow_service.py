@@ -0,0 +1,89 @@
+# app/services/shadow_service.py
+"""
+Shadow scoring of candidate models against the primary on live traffic.
+
+The predict route answers with the primary model as before and schedules
+score_shadows() as a background task with the primary's values and
+latencies. The candidates listed for each mapper key in the manifest's
+"shadow" section (loaded into the request's ModelSet) then score the same
+model-ready rows in the threadpool, and one comparison row per candidate is
+appended to the comparison store (shadow_store.py). Nothing a candidate does
+reaches the response or the Prediction table.
+
+    python -m scripts.shadow_report        # prediction deltas and latencies per candidate
+"""
+import random
+import time
+import uuid
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.services.inference import model_input
+from app.services.model_registry import ModelSet
+from app.services.scheduler import BULK, scheduler
+from app.services.shadow_store import write
+from app.utils.logger import logger
+
+
+def _aligned(clf, X: pd.DataFrame) -> pd.DataFrame:
+    """Candidates trained on another column set get theirs (missing ones as NaN)."""
+    names = getattr(getattr(clf, "model", clf), "feature_names_in_", None)
+    return X if names is None else X.reindex(columns=list(names))
+
+
+def timed_predict(clf, X: pd.DataFrame) -> Tuple[float, float]:
+    """(first prediction, milliseconds)."""
+    start = time.perf_counter()
+    value = float(clf.predict(X)[0])
+    return value, 1000 * (time.perf_counter() - start)
+
+
+def timed_predict_outputs(clf, X: pd.DataFrame) -> Tuple[List[float], float]:
+    """(every output of the first prediction, milliseconds); one value unless clf is a fused model."""
+    start = time.perf_counter()
+    values = [float(v) for v in np.atleast_1d(np.asarray(clf.predict(X))[0])]
+    return values, 1000 * (time.perf_counter() - start)
+
+
+def _score(ms: ModelSet, model: str, features: Dict, primary: Dict[str, Tuple[float, float]]) -> List[Tuple]:
+    request_id, ts = uuid.uuid4().hex, time.time()
+    rows = []
+    for mapper_key, clf in ms.submodels(model):
+        candidates = ms.shadows.get(mapper_key)
+        if not candidates or mapper_key not in primary:
+            continue
+        # a fused primary's row is the union of the sub-models' columns; _aligned picks each candidate's
+        X = model_input(features, mapper_key, clf)
+        value, elapsed = primary[mapper_key]
+        head = (ts, request_id, mapper_key, ms.file_of(mapper_key), ms.versions[model], value, elapsed)
+        for fname, version, clf in candidates:
+            try:
+                cand_value, cand_ms = timed_predict(clf, _aligned(clf, X))
+                rows.append(head + (fname, version, cand_value, cand_ms, None))
+            except Exception as e:
+                rows.append(head + (fname, version, None, None, str(e)[:500]))
+    return rows
+
+
+def has_shadows(ms: ModelSet, model: str) -> bool:
+    return any(key in ms.shadows for key, _ in ms.submodels(model))
+
+
+async def score_shadows(ms: ModelSet, model: str, features: Dict, primary: Dict[str, Tuple[float, float]]):
+    """Score the candidates for `model` and log them next to the primary; run as a background task.
+
+    `primary` maps mapper_key -> (value, milliseconds) as measured on the request path.
+    """
+    if not settings.shadow_enabled or not has_shadows(ms, model):
+        return
+    if random.random() >= settings.shadow_sample_rate:
+        return
+    try:
+        rows = await scheduler.run(BULK, _score, ms, model, features, primary)
+        await run_in_threadpool(write, rows)
+    except Exception as e:
+        logger.warning(f"Shadow scoring failed for {model}: {e}")
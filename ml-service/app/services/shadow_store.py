@@ -0,0 +1,60 @@
+# app/services/shadow_store.py
+"""
+Comparison store for shadow scoring: one SQLite row per (request, candidate).
+
+SQLite in WAL mode so every worker process can append to the same file
+(settings.shadow_store_path); kept apart from shadow_service.py so the
+report script can read it without loading any model.
+"""
+import sqlite3
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+from app.core.config import settings
+
+COLUMNS = [
+    "ts", "request_id", "mapper_key",
+    "primary_file", "primary_version", "primary_value", "primary_ms",
+    "candidate_file", "candidate_version", "candidate_value", "candidate_ms", "error",
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS comparisons (
+    {", ".join(COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS comparisons_key_ts ON comparisons (mapper_key, ts);
+"""
+
+
+def connect(path: Optional[str] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or settings.shadow_store_path, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def write(rows: List[Tuple]):
+    if not rows:
+        return
+    conn = connect()
+    try:
+        with conn:
+            conn.executemany(
+                f"INSERT INTO comparisons ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", rows
+            )
+    finally:
+        conn.close()
+
+
+def read(path: Optional[str] = None, since: Optional[float] = None,
+         mapper_key: Optional[str] = None) -> pd.DataFrame:
+    conn = connect(path)
+    try:
+        query, params = "SELECT * FROM comparisons WHERE ts >= ?", [since or 0]
+        if mapper_key:
+            query += " AND mapper_key = ?"
+            params.append(mapper_key)
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
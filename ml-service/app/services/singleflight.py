@@ -0,0 +1,58 @@
+# app/services/singleflight.py
+"""
+Single-flight coalescing of identical in-flight requests.
+
+Concurrent callers with the same key share one computation: the first one
+starts it as its own task and later ones await that task instead of
+recomputing. Awaiting is shielded, so a caller that disconnects doesn't
+cancel the work for the others. A key is dropped as soon as its task
+finishes, so only requests that overlap in time are merged; keeping results
+around is artifact_service's job.
+
+Keys are (route, model, model version, feature hash, ...); the feature hash
+is taken over the model-ready rows (inference.feature_hash), so requests
+that differ only in fields the models never see still coalesce.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self._stats = defaultdict(lambda: {"leaders": 0, "coalesced": 0, "errors": 0})
+
+    async def do(self, key: Tuple, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """Run fn() once among concurrent callers of `key`; returns (result, shared).
+
+        shared is True for callers that joined a computation another request
+        started (they should skip side effects like scheduling background work).
+        """
+        route = key[0]
+        task = self._flights.get(key)
+        shared = task is not None
+        if shared:
+            self._stats[route]["coalesced"] += 1
+        else:
+            self._stats[route]["leaders"] += 1
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        return await asyncio.shield(task), shared
+
+    def _finished(self, key: Tuple, task: asyncio.Future):
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # also marks the exception retrieved when every caller went away
+        if not task.cancelled() and task.exception() is not None:
+            self._stats[key[0]]["errors"] += 1
+
+    def stats(self) -> Dict:
+        in_flight = defaultdict(int)
+        for key in self._flights:
+            in_flight[key[0]] += 1
+        return {route: {**s, "in_flight": in_flight[route]} for route, s in self._stats.items()}
+
+
+flights = SingleFlight()
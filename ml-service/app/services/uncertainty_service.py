@@ -0,0 +1,152 @@
+# app/services/uncertainty_service.py
+"""
+Monte Carlo uncertainty of a prediction from blood metal measurement error.
+
+The patient's measured metals are redrawn `samples` times:
+
+- a value above the lower limit of detection is lognormal around the
+  reported value with the metal's analytic CV (mean-preserving, never
+  negative);
+- a value at or below the LLOD (including NHANES' LLOD / sqrt(2) fill) only
+  says the true value is somewhere under the limit, so it is uniform on
+  (0, LLOD);
+- a metal that wasn't measured stays missing, as in the point prediction.
+
+All draws go into one frame per prediction unit (the patient's mapped row
+repeated, metals written with inference.set_feature so LBX and SI columns
+move together) and are scored in one batched predict; the unperturbed row is
+appended last so the point prediction comes out of the same call.
+
+Classifiers are summarised by the probability of the served label and the
+share of draws whose label differs from it (flip probability). Regressors
+have no categories of their own; a flip probability is reported when the
+request gives cut points for that output (e.g. a reference range).
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.preprocess.feature_mappers import METAL_SI, map_all_features, safe_float, to_model_frame
+from app.preprocess.infertility_preprocessor import METAL_FIELDS, METAL_LLOD
+from app.services.inference import set_feature
+from app.services.model_registry import ModelSet
+
+# Analytic CVs of the blood metal assays (ICP-MS), LBX fields; requests may override
+DEFAULT_CV = {"LBXBPB": 0.05, "LBXBCD": 0.10, "LBXTHG": 0.08, "LBXBSE": 0.04, "LBXBMN": 0.06}
+DEFAULT_SAMPLES = 1000
+MAX_SAMPLES = 20000
+DEFAULT_LEVEL = 0.95
+SEED = 42
+
+# LLOD per LBX field, in the same units
+LLOD = {field: METAL_LLOD[metal.rsplit("_", 1)[0]] for metal, field in METAL_FIELDS.items()}
+
+
+def measured_metals(rows: Dict[str, Dict]) -> Dict[str, Optional[float]]:
+    """Raw LBX value of each metal from the mapped rows (None when not measured)."""
+    return {field: safe_float(next((row[field] for row in rows.values() if field in row), None))
+            for field in METAL_SI}
+
+
+def draw_metals(metals: Dict[str, Optional[float]], cv: Dict[str, float], samples: int,
+                rng: np.random.Generator) -> Dict[str, np.ndarray]:
+    """{LBX field: `samples` draws} for the measured metals (see module docstring)."""
+    draws = {}
+    for field, value in metals.items():
+        if value is None or not np.isfinite(value):
+            continue
+        if value <= LLOD[field]:
+            draws[field] = rng.uniform(0.0, LLOD[field], samples)
+        else:
+            sigma = np.sqrt(np.log1p(cv[field] ** 2))
+            draws[field] = value * rng.lognormal(-sigma ** 2 / 2, sigma, samples)
+    return draws
+
+
+def _summary(values: np.ndarray, level: float) -> Dict:
+    lo, hi = np.quantile(values, [(1 - level) / 2, (1 + level) / 2])
+    return {"mean": float(values.mean()), "std": float(values.std()), "interval": [float(lo), float(hi)]}
+
+
+def _unit_uncertainty(keys: List[str], clf, input_key: str, row: Dict, metals: Dict[str, Optional[float]],
+                      draws: Dict[str, np.ndarray], level: float, thresholds: Dict[str, List[float]]) -> Dict[str, Dict]:
+    samples = len(next(iter(draws.values())))
+    frame = pd.DataFrame([row]).iloc[np.zeros(samples + 1, dtype=int)].reset_index(drop=True)
+    for field, values in draws.items():
+        if field in frame.columns or METAL_SI[field][0] in frame.columns:  # metals the model doesn't read stay out
+            set_feature(frame, field, np.append(values, metals[field]))
+    X = to_model_frame(frame, input_key)
+
+    model = getattr(clf, "model", clf)
+    proba = getattr(model, "predict_proba", None)
+    classes = getattr(model, "classes_", None)
+    results = {}
+    if proba is not None and classes is not None:
+        P = np.asarray(proba(X), dtype=float)
+        labels = P.argmax(axis=1)
+        served = labels[-1]
+        drawn = labels[:-1]
+        summary = _summary(P[:-1, served], level)
+        results[keys[0]] = {
+            "output": "probability",
+            "point": float(classes[served]),
+            "point_probability": float(P[-1, served]),
+            **summary,
+            "flip_probability": float((drawn != served).mean()),
+            "labels": {str(classes[i]): float((drawn == i).mean()) for i in np.unique(drawn)},
+        }
+        return results
+
+    preds = np.asarray(clf.predict(X), dtype=float).reshape(len(X), -1)
+    for i, key in enumerate(keys):
+        values, point = preds[:-1, i], preds[-1, i]
+        result = {"output": "prediction", "point": float(point), **_summary(values, level), "flip_probability": None}
+        cuts = thresholds.get(key)
+        if cuts:
+            cuts = np.sort(np.asarray(cuts, dtype=float))
+            result["flip_probability"] = float((np.digitize(values, cuts) != np.digitize(point, cuts)).mean())
+        results[key] = result
+    return results
+
+
+def check_options(ms: ModelSet, model: str, cv: Optional[Dict[str, float]],
+                  thresholds: Optional[Dict[str, List[float]]]) -> Dict[str, float]:
+    """The CVs to use (defaults overridden by `cv`); ValueError for fields or outputs the model doesn't have."""
+    unknown = sorted(set(cv or {}) - set(METAL_SI))
+    if unknown:
+        raise ValueError(f"Unknown metal fields {unknown}; expected some of {list(METAL_SI)}")
+    cv = {**DEFAULT_CV, **(cv or {})}
+    if any(value < 0 for value in cv.values()):
+        raise ValueError("CVs must be >= 0")
+    outputs = [key for key, _ in ms.submodels(model)]
+    unknown = sorted(set(thresholds or {}) - set(outputs))
+    if unknown:
+        raise ValueError(f"Thresholds for unknown outputs {unknown}; {model} has {outputs}")
+    return cv
+
+
+def monte_carlo(ms: ModelSet, model: str, features: Dict, samples: int = DEFAULT_SAMPLES,
+                cv: Optional[Dict[str, float]] = None, level: float = DEFAULT_LEVEL,
+                thresholds: Optional[Dict[str, List[float]]] = None, seed: int = SEED) -> Dict:
+    """Uncertainty of every output of `model` for one patient under the metals' measurement error."""
+    cv = check_options(ms, model, cv, thresholds)
+
+    rows = map_all_features(features)
+    metals = measured_metals(rows)
+    draws = draw_metals(metals, cv, samples, np.random.default_rng(seed))
+    perturbed = {field: ("below_llod" if metals[field] <= LLOD[field] else "lognormal") for field in draws}
+    response = {
+        "samples": samples, "level": level, "seed": seed,
+        "perturbed": perturbed, "cv": {field: cv[field] for field, kind in perturbed.items() if kind == "lognormal"},
+        "not_measured": [field for field in METAL_SI if field not in draws],
+    }
+    if not draws:
+        response["outputs"] = {}
+        return response
+
+    outputs = {}
+    for keys, clf, input_key in ms.prediction_units(model):
+        outputs.update(_unit_uncertainty(keys, clf, input_key, rows[input_key], metals, draws, level, thresholds or {}))
+    response["outputs"] = outputs
+    return response
@@ -0,0 +1,144 @@
+# app/services/whatif_service.py
+"""
+What-if sessions behind the /predict/whatif/{model} WebSocket.
+
+A session maps the patient once and keeps, per prediction unit (see
+ModelSet.prediction_units), the mapped row and the model-ready frame. A
+slider update converts the changed metals to their LBX / SI columns
+(feature_mappers.metal_columns) and writes only those cells, so a message
+costs one predict call per affected unit instead of the full map ->
+preprocess -> predict path:
+
+- units whose preprocessing passes the metal columns through unchanged
+  (hormone, menopause, menstrual) get the new values written in place;
+- infertility sees the metals only through their risk bands: a move within
+  the same bands changes nothing the model reads, so the last prediction
+  stands; crossing into another band combination re-runs to_model_frame on
+  the patched mapped row, and the frame and prediction are kept per
+  combination for when the slider comes back.
+
+Units none of whose columns changed keep their last prediction.
+Nothing is written to the database: a what-if is exploration, not a result.
+"""
+import math
+import time
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from app.preprocess.feature_mappers import COLUMN_ORDERS, METAL_SI, map_all_features, metal_columns, to_model_frame
+from app.preprocess.infertility_preprocessor import risk_bands
+from app.services.model_registry import ModelSet
+from app.services.shadow_service import timed_predict_outputs
+
+# mapper key -> what its model frame depends on among the mapped columns, for
+# preprocessing that doesn't pass the metals through (see module docstring)
+FRAME_INPUTS = {"infertility": risk_bands}
+
+stats = {"opened": 0, "active": 0, "updates": 0}
+
+
+class _Unit:
+    def __init__(self, keys: List[str], clf, input_key: str, mapped: Dict):
+        self.keys = keys
+        self.clf = clf
+        self.input_key = input_key
+        self.base = dict(mapped)
+        self.frame_inputs = FRAME_INPUTS.get(input_key)
+        self.frames = {}  # frame_inputs(mapped) -> (frame, values); only metals change within a session
+        self.reset()
+
+    def reset(self):
+        self.mapped = dict(self.base)
+        self.frame = to_model_frame(pd.DataFrame([self.mapped]), self.input_key)
+        # the preprocessing kept every mapped column as it was, so cells can be patched in place
+        self.in_place = list(self.frame.columns) == COLUMN_ORDERS[self.input_key]
+        self.positions = {col: i for i, col in enumerate(self.frame.columns)}
+        self.values = None
+        self.signature = self.frame_inputs(self.mapped) if self.frame_inputs else None
+
+    def patch(self, columns: Dict) -> bool:
+        changed = {col: value for col, value in columns.items()
+                   if col in self.mapped and self.mapped[col] != value}
+        if not changed:
+            return False
+        self.mapped.update(changed)
+        in_place = self.in_place and all(
+            value is not None and self.frame.dtypes.iloc[self.positions[col]].kind == "f"
+            for col, value in changed.items()
+        )
+        if in_place:
+            for col, value in changed.items():
+                self.frame.iat[0, self.positions[col]] = value
+            self.values = None
+            return True
+
+        if self.frame_inputs is not None:
+            signature = self.frame_inputs(self.mapped)
+            if signature == self.signature:
+                return False
+            self.signature = signature
+            if signature in self.frames:
+                self.frame, self.values = self.frames[signature]
+                return True
+        self.frame = to_model_frame(pd.DataFrame([self.mapped]), self.input_key)
+        self.values = None
+        return True
+
+    def predict(self) -> List[float]:
+        if self.values is None:
+            self.values, _ = timed_predict_outputs(self.clf, self.frame)
+            if self.frame_inputs is not None:
+                self.frames[self.signature] = (self.frame, self.values)
+        return self.values
+
+
+class WhatIfSession:
+    """One patient and model; update() takes changed metals and returns the new predictions."""
+
+    def __init__(self, ms: ModelSet, model: str, features: Dict):
+        self.model = model
+        self.version = ms.versions[model]
+        rows = map_all_features(features)
+        self.base_metals = {field: next((row[field] for row in rows.values() if field in row), None)
+                            for field in METAL_SI}
+        self.metals = dict(self.base_metals)  # current raw LBX values, as the client's sliders show them
+        self.units = [_Unit(keys, clf, input_key, rows[input_key])
+                      for keys, clf, input_key in ms.prediction_units(model)]
+
+    def predict(self) -> Tuple[Dict[str, float], float]:
+        """({mapper key: prediction}, milliseconds), re-predicting only units that changed."""
+        start = time.perf_counter()
+        results = {}
+        for unit in self.units:
+            results.update(zip(unit.keys, unit.predict()))
+        return results, 1000 * (time.perf_counter() - start)
+
+    def update(self, metals: Dict) -> Tuple[Dict[str, float], float]:
+        """Apply {LBX field: raw value, or None to clear it} and predict.
+
+        Unknown fields and values that aren't finite numbers are rejected, so a
+        bad slider value can't pass for a metal that wasn't measured.
+        """
+        unknown = sorted(set(metals) - set(METAL_SI))
+        if unknown:
+            raise ValueError(f"Unknown metal fields {unknown}; expected some of {list(METAL_SI)}")
+        invalid = sorted(field for field, value in metals.items() if value is not None and not (
+            isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)))
+        if invalid:
+            raise ValueError(f"Metal values must be finite numbers or null: {invalid}")
+        start = time.perf_counter()
+        columns = metal_columns(metals)
+        self.metals.update({field: columns[field] for field in metals})
+        for unit in self.units:
+            unit.patch(columns)
+        results, _ = self.predict()
+        stats["updates"] += 1
+        return results, 1000 * (time.perf_counter() - start)
+
+    def reset(self) -> Tuple[Dict[str, float], float]:
+        """Back to the metals the session was opened with."""
+        self.metals = dict(self.base_metals)
+        for unit in self.units:
+            unit.reset()
+        return self.predict()
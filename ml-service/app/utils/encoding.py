@@ -0,0 +1,98 @@
+# app/utils/encoding.py
+"""
+Compact response encoding for array-heavy payloads (sensitivity curves, batches).
+
+Arrays stay NumPy all the way to orjson, which serialises them natively
+instead of walking Python lists through jsonable_encoder. Clients can ask for
+smaller payloads:
+
+    ?float32=true            cast arrays to float32 (shortest float32 repr on the wire)
+    ?precision=4             round arrays to N decimals
+    Accept: application/vnd.reprosight.f32+json
+                             arrays become {"dtype", "shape", "data": base64(little-endian buffer)}
+    ?stream=true  or  Accept: application/x-ndjson
+                             routes that support it send one NDJSON line per result
+"""
+import base64
+from typing import AsyncIterator, Iterator, Optional, Union
+
+import numpy as np
+import orjson
+from fastapi import Header, Query
+from fastapi.responses import Response, StreamingResponse
+
+JSON_MEDIA_TYPE = "application/json"
+BINARY_MEDIA_TYPE = "application/vnd.reprosight.f32+json"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+class EncodingOptions:
+    """Per-request encoding controls, injected with Depends()."""
+
+    def __init__(
+        self,
+        precision: Optional[int] = Query(None, ge=0, le=15, description="Round arrays to N decimals"),
+        float32: bool = Query(False, description="Send arrays as float32"),
+        stream: bool = Query(False, description="Stream results as NDJSON"),
+        accept: Optional[str] = Header(None),
+    ):
+        self.precision = precision
+        self.binary = bool(accept) and BINARY_MEDIA_TYPE in accept
+        self.stream = stream or (bool(accept) and NDJSON_MEDIA_TYPE in accept)
+        # the binary format is float32 by definition
+        self.dtype = np.float32 if (float32 or self.binary) else np.float64
+
+    @property
+    def media_type(self) -> str:
+        return BINARY_MEDIA_TYPE if self.binary else JSON_MEDIA_TYPE
+
+
+def encode_array(arr: np.ndarray, opts: EncodingOptions):
+    arr = np.asarray(arr)
+    if arr.dtype.kind == "f":
+        arr = arr.astype(opts.dtype, copy=False)
+        if opts.precision is not None:
+            arr = np.round(arr, opts.precision)
+    if opts.binary and arr.dtype.kind == "f":
+        buf = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+        return {
+            "dtype": buf.dtype.name,
+            "shape": list(buf.shape),
+            "data": base64.b64encode(buf.tobytes()).decode("ascii"),
+        }
+    return np.ascontiguousarray(arr)
+
+
+def prepare(obj, opts: EncodingOptions):
+    """Walk dicts/lists and encode every ndarray found according to opts."""
+    if isinstance(obj, np.ndarray):
+        return encode_array(obj, opts)
+    if isinstance(obj, dict):
+        return {k: prepare(v, opts) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [prepare(v, opts) for v in obj]
+    return obj
+
+
+def dumps(payload, opts: EncodingOptions) -> bytes:
+    return orjson.dumps(prepare(payload, opts), option=ORJSON_OPTIONS)
+
+
+def encode_response(payload, opts: EncodingOptions) -> Response:
+    return Response(content=dumps(payload, opts), media_type=opts.media_type)
+
+
+def stream_response(lines: Union[Iterator, AsyncIterator], opts: EncodingOptions) -> StreamingResponse:
+    """NDJSON stream; a sync generator is driven in Starlette's threadpool, an async one on the loop."""
+    if hasattr(lines, "__aiter__"):
+        async def abody():
+            async for line in lines:
+                yield dumps(line, opts) + b"\n"
+        return StreamingResponse(abody(), media_type=NDJSON_MEDIA_TYPE)
+
+    def body():
+        for line in lines:
+            yield dumps(line, opts) + b"\n"
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE)
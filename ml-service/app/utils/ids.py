@@ -0,0 +1,7 @@
+# app/utils/ids.py
+import uuid
+
+
+def new_id() -> str:
+    """cuid-shaped row id (Prisma generates these client-side, not in Postgres)."""
+    return "c" + uuid.uuid4().hex[:24]
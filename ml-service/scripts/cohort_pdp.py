@@ -0,0 +1,110 @@
+# scripts/cohort_pdp.py
+"""
+Build the reference cohorts and precompute cohort PDP / ICE curves
+(see app/services/cohort_service.py) for the models currently serving.
+
+The cohort of each mapper key is its NHANES training extract (scripts.train
+.training_frame: the rows in the codes the feature mappers produce, targets
+dropped), subsampled to --cohort-size. It is stored once and reused; pass
+--rebuild-cohorts after new NHANES data. Curves are stored per model
+version, so GET /predict/cohort/{model} serves them without computing.
+
+    python -m scripts.cohort_pdp                                   # every model, metal features
+    python -m scripts.cohort_pdp --models menopause --jobs 8
+    python -m scripts.cohort_pdp --features LBXBPB RIDAGEYR --grid-points 30 --ice-lines 100
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.preprocess.feature_mappers import COLUMN_ORDERS
+from app.services import cohort_service, cohort_store
+from app.services.model_registry import registry
+from scripts.train import SEED, training_frame
+
+
+def build_cohort(key: str, cycle: str, size: int, store: str) -> str:
+    frame = training_frame(key, cycle)[COLUMN_ORDERS[key]]
+    if size and len(frame) > size:
+        frame = frame.sample(n=size, random_state=SEED)
+    digest = cohort_store.save_cohort(key, frame.reset_index(drop=True), f"NHANES {cycle} training extract", store)
+    print(f"cohort {key}: {len(frame)} rows ({digest})")
+    return digest
+
+
+def _run(args):
+    try:
+        return cohort_service.feature_dependence(*args)
+    except Exception as e:
+        return e
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute cohort partial dependence / ICE curves")
+    parser.add_argument("--models", nargs="+", default=None, help="model keys (default: every serving model)")
+    parser.add_argument("--features", nargs="+", default=cohort_service.DEFAULT_FEATURES)
+    parser.add_argument("--grid-points", type=int, default=cohort_service.DEFAULT_GRID_POINTS)
+    parser.add_argument("--ice-lines", type=int, default=cohort_service.DEFAULT_ICE_LINES)
+    parser.add_argument("--cohort-size", type=int, default=2000, help="rows per cohort; 0 keeps all")
+    parser.add_argument("--cycle", default="I")
+    parser.add_argument("--jobs", type=int, default=4, help="features computed in parallel")
+    parser.add_argument("--rebuild-cohorts", action="store_true")
+    parser.add_argument("--force", action="store_true", help="recompute even when stored for this version")
+    parser.add_argument("--store", default=settings.cohort_store_path)
+    parser.add_argument("--json", default=None, help="also write the summary here")
+    args = parser.parse_args(argv)
+
+    ms = registry.current
+    models = args.models or list(ms.models)
+    params = cohort_service.cohort_params(args.features, args.grid_points, args.ice_lines)
+
+    summary = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        for model in models:
+            keys = cohort_service.input_keys(ms, model)
+            for key in keys:
+                if args.rebuild_cohorts or cohort_store.cohort_digest(key, args.store) is None:
+                    build_cohort(key, args.cycle, args.cohort_size, args.store)
+            digest = cohort_service.cohort_digest({k: cohort_store.cohort_digest(k, args.store) for k in keys})
+            version = ms.versions[model]
+
+            result = None if args.force else cohort_store.load_result(model, version, params, digest, args.store)
+            if result is None:
+                start = time.perf_counter()
+                cohorts = {k: cohort_store.load_cohort(k, args.store)[1] for k in keys}
+                job_args = list(cohort_service.jobs(ms, model, cohorts, args.features,
+                                                    args.grid_points, args.ice_lines))
+                result = cohort_service.assemble(job_args, list(pool.map(_run, job_args)))
+                if not cohort_service.has_errors(result):
+                    cohort_store.save_result(model, version, params, digest, result, args.store)
+                print(f"{model} ({version}): {len(job_args)} curves in {time.perf_counter() - start:.1f}s")
+            else:
+                print(f"{model} ({version}): already stored")
+
+            for key, curves in result.items():
+                for feature, curve in curves.items():
+                    if "error" in curve:
+                        summary.append({"model": key, "feature": feature, "error": curve["error"]})
+                        continue
+                    pdp = np.asarray(curve["pdp"])
+                    summary.append({
+                        "model": key, "feature": feature, "output": curve["output"],
+                        "grid_min": float(np.min(curve["grid"])), "grid_max": float(np.max(curve["grid"])),
+                        "pdp_min": float(pdp.min()), "pdp_max": float(pdp.max()),
+                        "pdp_range": float(pdp.max() - pdp.min()),
+                    })
+
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.4g}".format):
+        print(pd.DataFrame(summary).to_string(index=False))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# scripts/fusion_report.py
+"""
+Fidelity of the fused multi-output hormone model against the per-hormone models.
+
+For each hormone, both models score the NHANES rows that neither saw in
+training (the intersection of the fused model's hold-out split and that
+hormone model's, both as drawn by scripts/train.py), and the report shows:
+
+- accuracy of each against the measured value (MAE / RMSE / R2)
+- how closely the fused output tracks the per-hormone prediction
+  (mean / p95 / max absolute difference, correlation)
+- single-row latency: one fused call vs the per-hormone calls it replaces
+
+The fused model is the one scripts.train staged (<models-dir>/staged), else
+the one being served. --promote moves a staged model into the served
+manifest, but only if no output has a higher MAE than its per-hormone model
+(beyond --tolerance, relative); otherwise it lists the outputs that lose.
+
+    python -m scripts.fusion_report
+    python -m scripts.fusion_report --json fusion.json --repeat 500
+    python -m scripts.fusion_report --promote
+
+The per-hormone files are the manifest's hormone_* entries, else the
+defaults the service ships with. Hold-out rows are exact for models trained
+by scripts.train; notebook-trained artifacts used their own split.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from app.models.fused_model import FusedModel
+from app.models.joblib_model import JoblibModel
+from app.preprocess.feature_mappers import COLUMN_ORDERS, to_model_frame
+from scripts.train import (
+    MANIFEST_NAME, MODELS_DIR, SEED, SPECS, STAGING_DIR, TEST_SIZE, file_digest, regression_metrics,
+    training_frame, write_manifest,
+)
+
+# model_registry.MODEL_FILES["hormone"] (not imported: that loads every model)
+DEFAULT_FILES = {
+    "testosterone": "xgb_model_tst_03.joblib",
+    "estradiol": "xgb_model_est_02.joblib",
+    "shbg": "xgb_model_shbg_03.joblib",
+}
+
+
+def _holdout(key: str, cycle: str) -> pd.DataFrame:
+    frame = training_frame(key, cycle)
+    _, test = train_test_split(frame, test_size=TEST_SIZE, random_state=SEED)
+    return test
+
+
+def _latency_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times))
+
+
+def _entries(directory: Path) -> Dict:
+    path = directory / MANIFEST_NAME
+    return json.loads(path.read_text()).get("models", {}) if path.exists() else {}
+
+
+def fused_source(models_dir: Path) -> Path:
+    """Directory of the fused model to report on: the staged one, else the served one."""
+    for directory in (models_dir / STAGING_DIR, models_dir):
+        if "hormone" in _entries(directory):
+            return directory
+    raise SystemExit("No fused hormone model staged or served (python -m scripts.train --models hormone)")
+
+
+def compare(models_dir: Path, cycle: str = "I", repeat: int = 200) -> dict:
+    fused_dir = fused_source(models_dir)
+    fused_file = _entries(fused_dir)["hormone"]["file"]
+    fused = FusedModel(JoblibModel(fused_dir / fused_file))
+    entries = _entries(models_dir)
+    files = {name: entries.get(f"hormone_{name}", {}).get("file", DEFAULT_FILES[name]) for name in fused.outputs}
+    separate = {name: JoblibModel(models_dir / f) for name, f in files.items()}
+
+    fused_test = _holdout("hormone", cycle)
+    report = {"fused_file": str(fused_dir / fused_file), "staged": fused_dir != models_dir, "hormones": {}}
+    for i, name in enumerate(fused.outputs):
+        key = f"hormone_{name}"
+        test = _holdout(key, cycle)
+        rows = fused_test.index.intersection(test.index)
+        y = test.loc[rows, "y"].to_numpy()
+        pred_sep = np.asarray(separate[name].predict(to_model_frame(test.loc[rows, COLUMN_ORDERS[key]], key)),
+                              dtype=float)
+        pred_fused = fused.predict(to_model_frame(fused_test.loc[rows, COLUMN_ORDERS["hormone"]], "hormone"))[:, i]
+        diff = np.abs(pred_fused - pred_sep)
+        report["hormones"][name] = {
+            "target": SPECS[key]["target"],
+            "separate_file": files[name],
+            "rows": len(rows),
+            "separate": regression_metrics(y, pred_sep),
+            "fused": regression_metrics(y, pred_fused),
+            "mean_abs_diff": float(diff.mean()),
+            "p95_abs_diff": float(np.quantile(diff, 0.95)),
+            "max_abs_diff": float(diff.max()),
+            "corr": float(np.corrcoef(pred_fused, pred_sep)[0, 1]),
+        }
+
+    # one patient, as the predict route sees it
+    one = to_model_frame(fused_test[COLUMN_ORDERS["hormone"]].iloc[:1], "hormone")
+    inputs = {name: to_model_frame(fused_test.iloc[:1].reindex(columns=COLUMN_ORDERS[f"hormone_{name}"]),
+                                   f"hormone_{name}")
+              for name in fused.outputs}
+    report["latency_ms"] = {
+        "fused": _latency_ms(lambda: fused.predict(one), repeat),
+        "separate": _latency_ms(lambda: [m.predict(inputs[n]) for n, m in separate.items()], repeat),
+    }
+    return report
+
+
+def losses(report: dict, tolerance: float = 0.0) -> Dict[str, str]:
+    """{hormone: why} for the outputs whose fused MAE is worse than the per-hormone one beyond `tolerance`."""
+    out = {}
+    for name, r in report["hormones"].items():
+        fused, separate = r["fused"]["mae"], r["separate"]["mae"]
+        if not fused <= separate * (1 + tolerance):
+            out[name] = f"MAE {fused:.4g} vs {separate:.4g} (R2 {r['fused']['r2']:.3g} vs {r['separate']['r2']:.3g})"
+    return out
+
+
+def promote(models_dir: Path, cycle: str = "I", tolerance: float = 0.0, report: dict = None) -> bool:
+    """Serve the staged fused model if it loses no accuracy on any output; True when promoted."""
+    staged_dir = models_dir / STAGING_DIR
+    entry = _entries(staged_dir).get("hormone")
+    if entry is None:
+        print("⚠️ No staged fused hormone model to promote")
+        return False
+    report = report or compare(models_dir, cycle)
+    lost = losses(report, tolerance)
+    if lost:
+        for name, why in lost.items():
+            print(f"⚠️ Not promoting the fused hormone model: {name} {why}")
+        return False
+
+    # the artifact first, then the manifest entry the registry watcher reacts to
+    target = models_dir / entry["file"]
+    tmp = target.with_suffix(".tmp")
+    shutil.copy2(staged_dir / entry["file"], tmp)
+    os.replace(tmp, target)
+    served = {**entry, "sha256": file_digest(target),
+              "fusion": {name: {"mae_fused": r["fused"]["mae"], "mae_separate": r["separate"]["mae"]}
+                         for name, r in report["hormones"].items()}}
+    write_manifest({"hormone": served}, models_dir / MANIFEST_NAME)
+    print(f"Promoted {entry['file']}: served for {', '.join(entry.get('outputs', []))}")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the fused hormone model with the per-hormone models")
+    parser.add_argument("--models-dir", type=Path, default=MODELS_DIR)
+    parser.add_argument("--cycle", default="I")
+    parser.add_argument("--repeat", type=int, default=200, help="timed single-row calls per model")
+    parser.add_argument("--json", type=Path, default=None, help="also write the report here")
+    parser.add_argument("--promote", action="store_true", help="serve the staged fused model if no output loses")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="relative MAE increase still accepted")
+    args = parser.parse_args(argv)
+
+    report = compare(args.models_dir, args.cycle, args.repeat)
+    rows = []
+    for name, r in report["hormones"].items():
+        rows.append({
+            "hormone": name,
+            "rows": r["rows"],
+            "mae_separate": r["separate"]["mae"],
+            "mae_fused": r["fused"]["mae"],
+            "r2_separate": r["separate"]["r2"],
+            "r2_fused": r["fused"]["r2"],
+            "mean_abs_diff": r["mean_abs_diff"],
+            "p95_abs_diff": r["p95_abs_diff"],
+            "corr": r["corr"],
+        })
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.4g}".format):
+        print(pd.DataFrame(rows).to_string(index=False))
+    latency = report["latency_ms"]
+    print(f"\nsingle-row latency: fused {latency['fused']:.2f} ms vs separate {latency['separate']:.2f} ms "
+          f"({latency['separate'] / latency['fused']:.1f}x)")
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    if args.promote:
+        promote(args.models_dir, args.cycle, args.tolerance, report)
+
+
+if __name__ == "__main__":
+    main()
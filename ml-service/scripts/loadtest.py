@@ -0,0 +1,225 @@
+# scripts/loadtest.py
+"""
+Load generator for the ML service.
+
+Replays a weighted mix of predict / sensitivity / SHAP traffic with valid
+JWTs and reports throughput and latency percentiles per route.
+
+    # against a running server
+    python -m scripts.loadtest --url http://127.0.0.1:8002 --duration 30 --concurrency 64
+
+    # in-process against app.main:app (no network, no Postgres)
+    DB_BACKEND=memory python -m scripts.loadtest --in-process --write
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Dict, List, Tuple
+
+import httpx
+import jwt
+
+from app.security import JWT_SECRET
+
+ROUTES = {
+    "predict": "/predict/{model}",
+    "sensitivity": "/predict/sensitivity/{model}",
+    "shap": "/predict/shap/{model}",
+}
+
+MARITAL_STATUSES = [
+    "MARRIED", "WIDOWED", "DIVORCED", "SEPARATED",
+    "NEVER_MARRIED", "LIVING_WITH_PARTNER", "UNKNOWN",
+]
+
+
+def make_token(roles=("doctor",), ttl_seconds: int = 3600) -> str:
+    now = int(time.time())
+    payload = {
+        "userId": "loadtest",
+        "email": "loadtest@reprosight.local",
+        "roles": list(roles),
+        "iat": now,
+        "exp": now + ttl_seconds,
+    }
+    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+
+
+def random_patient(rng: random.Random, with_id: bool) -> Dict:
+    """Patient payload shaped like the Node proxy's `features` body."""
+    gender = rng.choice(["male", "female"])
+    age_years = rng.randint(18, 70)
+    return {
+        "id": f"loadtest-{rng.randrange(10**9)}" if with_id else None,
+        "gender": gender,
+        "ageYears": age_years,
+        "ageMonths": age_years * 12 + rng.randint(0, 11),
+        "bmi": round(rng.uniform(18, 40), 1),
+        "pregnancyCount": 0 if gender == "male" else rng.randint(0, 4),
+        "pregnancyStatus": False,
+        "vaginalDeliveries": 0 if gender == "male" else rng.randint(0, 3),
+        "maritalStatus": rng.choice(MARITAL_STATUSES),
+        "hadHysterectomy": rng.random() < 0.1,
+        "everUsedFemaleHormones": rng.random() < 0.2,
+        "ovariesRemoved": rng.random() < 0.05,
+        "triedYearPregnant": rng.random() < 0.15,
+        "everUsedBirthControlPills": rng.random() < 0.5,
+        "bloodMetals": [{
+            "LBXBPB": round(rng.lognormvariate(0.0, 0.6), 3),   # µg/dL
+            "LBXBCD": round(rng.lognormvariate(-1.2, 0.7), 3),  # µg/L
+            "LBXTHG": round(rng.lognormvariate(0.0, 0.9), 3),   # µg/L
+            "LBXBSE": round(rng.gauss(190, 25), 2),             # µg/L
+            "LBXBMN": round(rng.lognormvariate(2.2, 0.3), 3),   # µg/L
+        }],
+    }
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in ROUTES:
+            raise SystemExit(f"Unknown route kind in --mix: {kind}")
+        mix.append((kind, float(weight or 1)))
+    return mix
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    k = (len(sorted_values) - 1) * q
+    lo, hi = math.floor(k), math.ceil(k)
+    if lo == hi:
+        return sorted_values[lo]
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.status: Dict[int, int] = {}
+
+    def record(self, seconds: float, status: int):
+        self.latencies.append(seconds)
+        self.status[status] = self.status.get(status, 0) + 1
+        if status == 0 or status >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict:
+        values = sorted(self.latencies)
+        return {
+            "requests": len(values),
+            "errors": self.errors,
+            "rps": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p90_ms": percentile(values, 0.90) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": (values[-1] * 1000) if values else float("nan"),
+            "status": self.status,
+        }
+
+
+async def worker(client: httpx.AsyncClient, args, mix, models, headers, stats, deadline, seed):
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix)
+    while time.perf_counter() < deadline:
+        kind = rng.choices(kinds, weights=weights)[0]
+        model = rng.choice(models)
+        body = {"features": random_patient(rng, args.write)}
+        if kind == "sensitivity":
+            body["num_points"] = args.num_points
+
+        label = f"{kind}/{model}"
+        t0 = time.perf_counter()
+        try:
+            response = await client.post(ROUTES[kind].format(model=model), json=body, headers=headers)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        stats.setdefault(label, RouteStats()).record(time.perf_counter() - t0, status)
+
+
+async def run(args) -> Dict:
+    mix = parse_mix(args.mix)
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    headers = {"Authorization": f"Bearer {make_token()}"}
+    stats: Dict[str, RouteStats] = {}
+
+    async def drive(client):
+        if args.warmup:
+            warm_deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*[
+                worker(client, args, mix, models, headers, {}, warm_deadline, args.seed + i)
+                for i in range(args.concurrency)
+            ])
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*[
+            worker(client, args, mix, models, headers, stats, deadline, args.seed + 1000 + i)
+            for i in range(args.concurrency)
+        ])
+        return time.perf_counter() - start
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if args.in_process:
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+                elapsed = await drive(client)
+    else:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            elapsed = await drive(client)
+
+    routes = {label: s.summary(elapsed) for label, s in sorted(stats.items())}
+    total = sum(r["requests"] for r in routes.values())
+    return {
+        "elapsed_s": elapsed,
+        "concurrency": args.concurrency,
+        "total_requests": total,
+        "total_rps": total / elapsed if elapsed else 0.0,
+        "routes": routes,
+    }
+
+
+def print_report(report: Dict):
+    print(f"\n{report['total_requests']} requests in {report['elapsed_s']:.1f}s "
+          f"({report['total_rps']:.1f} req/s, concurrency {report['concurrency']})\n")
+    header = f"{'route':<28}{'reqs':>8}{'err':>6}{'req/s':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for label, r in report["routes"].items():
+        print(f"{label:<28}{r['requests']:>8}{r['errors']:>6}{r['rps']:>9.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p90_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the ML prediction service")
+    parser.add_argument("--url", default="http://127.0.0.1:8002", help="Base URL of a running service")
+    parser.add_argument("--in-process", action="store_true", help="Drive app.main:app through ASGI instead of HTTP")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured run length in seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured warm-up in seconds")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent in-flight requests")
+    parser.add_argument("--mix", default="predict=6,sensitivity=2,shap=1", help="Weighted route mix")
+    parser.add_argument("--models", default="hormone,menopause,menstrual,infertility")
+    parser.add_argument("--num-points", type=int, default=1000, help="Sensitivity grid size")
+    parser.add_argument("--write", action="store_true", help="Send patient ids so predictions are persisted")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# scripts/shadow_report.py
+"""
+Summary of the shadow comparison store (see app/services/shadow_service.py).
+Reads the SQLite store only; no model is loaded.
+
+One line per (mapper key, candidate): how many requests it scored, how far
+its predictions are from the primary's (candidate - primary), how often it
+gives the same answer, and primary vs candidate latency percentiles.
+
+    python -m scripts.shadow_report
+    python -m scripts.shadow_report --since 24 --model hormone_shbg
+    python -m scripts.shadow_report --store /var/lib/ml/shadow.sqlite3
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.shadow_store import read
+
+
+def summarize(df: pd.DataFrame) -> pd.DataFrame:
+    rows = []
+    for (key, cand, version), g in df.groupby(["mapper_key", "candidate_file", "candidate_version"], sort=True):
+        ok = g[g["error"].isna()]
+        delta = ok["candidate_value"] - ok["primary_value"]
+        rows.append({
+            "model": key,
+            "candidate": cand,
+            "version": version,
+            "primary": ", ".join(sorted(g["primary_file"].unique())),
+            "n": len(g),
+            "errors": int(g["error"].notna().sum()),
+            "mean_delta": delta.mean(),
+            "mean_abs_delta": delta.abs().mean(),
+            "p95_abs_delta": delta.abs().quantile(0.95) if len(delta) else np.nan,
+            "max_abs_delta": delta.abs().max(),
+            "agreement": (delta.abs() < 1e-9).mean() if len(delta) else np.nan,
+            "corr": ok["candidate_value"].corr(ok["primary_value"]) if len(ok) > 2 else np.nan,
+            "primary_p50_ms": g["primary_ms"].median(),
+            "primary_p95_ms": g["primary_ms"].quantile(0.95),
+            "candidate_p50_ms": ok["candidate_ms"].median(),
+            "candidate_p95_ms": ok["candidate_ms"].quantile(0.95) if len(ok) else np.nan,
+        })
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise shadow model comparisons")
+    parser.add_argument("--store", default=settings.shadow_store_path, help="comparison store (SQLite)")
+    parser.add_argument("--since", type=float, default=None, help="only the last N hours")
+    parser.add_argument("--model", default=None, help="one mapper key, e.g. hormone_shbg")
+    args = parser.parse_args(argv)
+
+    since = time.time() - args.since * 3600 if args.since else None
+    df = read(args.store, since, args.model)
+    if df.empty:
+        print("No shadow comparisons recorded yet.")
+        return
+
+    errors = df[df["error"].notna()]
+    print(f"{len(df):,} comparisons over {df['request_id'].nunique():,} requests")
+    with np.errstate(invalid="ignore", divide="ignore"):  # corr of a constant series
+        summary = summarize(df)
+    with pd.option_context("display.width", 200, "display.max_columns", None, "display.float_format", "{:.4g}".format):
+        print(summary.to_string(index=False))
+    if len(errors):
+        print("\nMost frequent candidate errors:")
+        print(errors.groupby(["candidate_file", "error"]).size().sort_values(ascending=False).head(10).to_string())
+
+
+if __name__ == "__main__":
+    main()
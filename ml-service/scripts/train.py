@@ -0,0 +1,439 @@
+# scripts/train.py
+"""
+Reproducible training for the models in app/models/saved.
+
+Every model key is rebuilt from the NHANES tables in Models/infertility
+prediction (the cleaned Parquet tables written by ingest.py, or the cleaned
+CSVs when no Parquet copy exists):
+
+1. a training frame holding the columns of COLUMN_ORDERS[key] in the NHANES
+   codes the feature mappers produce from API input, plus the target
+2. feature_mappers.to_model_frame(), the step the service applies to every
+   request, so training and serving share one feature code path
+3. the key's pipeline (imputation / scaling / encoding + estimator), tuned
+   with GridSearchCV on an 80/20 split. Folds x grid points run in parallel
+   on joblib's loky workers (--jobs); estimators are single-threaded so the
+   workers don't oversubscribe the cores
+4. <key>.joblib plus its entry in manifest.json next to it: input feature
+   order, best params, CV score, hold-out metrics, artifact / data hashes
+   and library versions. inference.py loads the artifacts listed there.
+
+"hormone" is the fused alternative to hormone_testosterone and hormone_shbg:
+one XGBoost booster with multi-output trees (multi_strategy="multi_output_tree")
+over their (shared) columns, fit on the two standardised targets. Estradiol
+isn't fused: sharing trees with it cost it most of its accuracy (MAE 55.9 vs
+32.7 on the hold-out rows). A fused model is only staged, in <out>/staged with
+its own manifest, so the service doesn't pick it up. --promote-fused (or
+python -m scripts.fusion_report --promote) moves it into the served manifest
+when scripts/fusion_report.py shows no output losing accuracy against its
+per-hormone model; the service then serves it behind the hormone key (see
+app/models/fused_model.py).
+
+    python -m scripts.train                                  # every model key
+    python -m scripts.train --models menopause menstrual --jobs 8
+    python -m scripts.train --quick --out /tmp/models        # one grid point, 3 folds
+    python -m scripts.train --models hormone                 # fused hormone model, staged only
+    python -m scripts.train --models hormone --promote-fused # ... and served if fusion_report passes
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+import xgboost
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.impute import SimpleImputer
+from sklearn.metrics import (
+    accuracy_score, f1_score, mean_absolute_error, mean_squared_error, precision_score,
+    r2_score, recall_score, roc_auc_score,
+)
+from sklearn.model_selection import GridSearchCV, KFold, StratifiedKFold, train_test_split
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder, StandardScaler
+from xgboost import XGBClassifier, XGBRegressor
+
+from app.preprocess.feature_mappers import CATEGORICAL_CODES, COLUMN_ORDERS, to_model_frame
+
+NHANES_DIR = Path(__file__).resolve().parents[2] / "Models" / "infertility prediction"
+sys.path.insert(0, str(NHANES_DIR))
+from ingest import indexed, infertility_training_frame, join_all  # noqa: E402
+from nhanes_io import csv_path, parquet_path  # noqa: E402
+
+# Same place model_registry.py reads MODELS_DIR / MANIFEST_PATH (not imported: that loads every model)
+MODELS_DIR = Path(__file__).resolve().parents[1] / "app" / "models" / "saved"
+MANIFEST_NAME = "manifest.json"
+# Fused models are written here (relative to --out) until promoted
+STAGING_DIR = "staged"
+FUSED = {"hormone"}
+
+SEED = 42
+TEST_SIZE = 0.2
+
+# Refused / don't know codes of the coded answers (counts only use the two-digit ones)
+NOT_ANSWERED = [7, 9, 77, 99]
+COUNT_NOT_ANSWERED = [77, 99]
+CODED_COLS = ["RHQ031", "RHQ131", "RHD280", "RHQ305", "RHQ420", "RHQ540", "DMDMARTL", "RHD043"]
+
+HORMONE_METALS = ["LBDBSESI", "LBDTHGSI", "LBDBCDSI", "LBDBPBSI", "LBDBMNSI"]
+METALS = ["LBXBPB", "LBXBCD", "LBXTHG", "LBXBSE", "LBXBMN"]
+
+XGB_GRID = {
+    "model__n_estimators": [100, 300, 500],
+    "model__max_depth": [3, 5],
+    "model__learning_rate": [0.01, 0.05, 0.1],
+}
+FOREST_GRID = {
+    "model__n_estimators": [200, 500],
+    "model__max_depth": [None, 8],
+    "model__min_samples_leaf": [1, 5],
+}
+
+
+# ---------------- Pipelines ----------------
+def _hormone_pipeline(categorical, passthrough):
+    """Same layout as the notebook pipelines: scaled metals + BMI, mode-imputed codes, raw age."""
+    pre = ColumnTransformer([
+        ("cont", Pipeline([("imputer", SimpleImputer(strategy="mean")), ("scaler", StandardScaler())]),
+         HORMONE_METALS + ["BMXBMI"]),
+        ("cat", SimpleImputer(strategy="most_frequent"), categorical),
+        ("pass", "passthrough", passthrough),
+    ])
+    model = XGBRegressor(n_jobs=1, random_state=SEED, tree_method="hist")
+    return Pipeline([("preprocessor", pre), ("model", model)])
+
+
+def _forest_pipeline(key, numeric, estimator):
+    """Scaled numeric columns, category-coded answers (see feature_mappers.CATEGORICAL_CODES)."""
+    pre = ColumnTransformer([
+        ("num", Pipeline([("imputer", SimpleImputer(strategy="mean")), ("scaler", StandardScaler())]), numeric),
+        ("cat", Pipeline([
+            ("imputer", SimpleImputer(strategy="most_frequent")),
+            ("encoder", OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1)),
+        ]), CATEGORICAL_CODES[key]),
+    ])
+    return Pipeline([("preprocessor", pre), ("model", estimator)])
+
+
+def _fused_hormone_pipeline():
+    """The SHBG layout (same columns as testosterone) with one multi-output booster."""
+    pipeline = _hormone_pipeline(["RIAGENDR", "RIDEXPRG"], ["RIDAGEMN", "RHQ131"])
+    pipeline.set_params(model__multi_strategy="multi_output_tree")
+    return pipeline
+
+
+def _infertility_pipeline():
+    model = XGBClassifier(n_jobs=1, random_state=SEED, tree_method="hist", eval_metric="logloss")
+    return Pipeline([("model", model)])
+
+
+# target: NHANES column; label: how the column becomes y
+SPECS = {
+    "hormone_testosterone": {
+        "task": "regression", "target": "LBXTST", "grid": XGB_GRID,
+        "build": lambda: _hormone_pipeline(["RHQ131", "RIAGENDR", "RIDEXPRG"], ["RIDAGEMN"]),
+    },
+    "hormone_estradiol": {
+        "task": "regression", "target": "LBXEST", "grid": XGB_GRID,
+        "build": lambda: _hormone_pipeline(["RIAGENDR", "RIDEXPRG", "RHQ031", "is_menopausal"],
+                                           ["RIDAGEMN", "RHQ131"]),
+    },
+    "hormone_shbg": {
+        "task": "regression", "target": "LBXSHBG", "grid": XGB_GRID,
+        "build": lambda: _hormone_pipeline(["RIAGENDR", "RIDEXPRG"], ["RIDAGEMN", "RHQ131"]),
+    },
+    "hormone": {
+        "task": "multi_regression", "target": ["LBXTST", "LBXSHBG"],
+        "outputs": ["testosterone", "shbg"], "grid": XGB_GRID,
+        "build": _fused_hormone_pipeline,
+    },
+    "menopause": {
+        "task": "regression", "target": "RHQ060", "grid": FOREST_GRID,
+        "build": lambda: _forest_pipeline("menopause", ["RIDAGEYR", "RHQ160"] + METALS,
+                                          RandomForestRegressor(n_jobs=1, random_state=SEED)),
+    },
+    "menstrual": {
+        "task": "classification", "target": "RHQ031", "grid": FOREST_GRID,
+        "build": lambda: _forest_pipeline("menstrual", ["RIDAGEYR"] + METALS,
+                                          RandomForestClassifier(n_jobs=1, random_state=SEED)),
+    },
+    "infertility": {
+        "task": "classification", "target": "RHQ074", "grid": XGB_GRID,
+        "build": _infertility_pipeline,
+    },
+}
+
+# One grid point per key for --quick (the parameters of the notebook models)
+QUICK_PARAMS = {
+    "hormone_testosterone": {"model__n_estimators": [500], "model__max_depth": [5], "model__learning_rate": [0.01]},
+    "hormone_estradiol": {"model__n_estimators": [100], "model__max_depth": [5], "model__learning_rate": [0.05]},
+    "hormone_shbg": {"model__n_estimators": [100], "model__max_depth": [5], "model__learning_rate": [0.05]},
+    "hormone": {"model__n_estimators": [300], "model__max_depth": [5], "model__learning_rate": [0.05]},
+    "menopause": {"model__n_estimators": [200], "model__max_depth": [None], "model__min_samples_leaf": [1]},
+    "menstrual": {"model__n_estimators": [200], "model__max_depth": [None], "model__min_samples_leaf": [1]},
+    "infertility": {"model__n_estimators": [200], "model__max_depth": [5], "model__learning_rate": [0.1]},
+}
+
+
+# ---------------- Training frames ----------------
+def _table(series: str, cycle: str, drop=()) -> pd.DataFrame:
+    """Cleaned NHANES table indexed by SEQN with refused / don't know answers as NaN."""
+    df = indexed(f"{series}_{cycle}", drop=drop)
+    for col in CODED_COLS:
+        if col in df.columns:
+            df[col] = df[col].mask(df[col].isin(NOT_ANSWERED))
+    if "RHQ160" in df.columns:
+        df["RHQ160"] = df["RHQ160"].mask(df["RHQ160"].isin(COUNT_NOT_ANSWERED))
+    return df
+
+
+def _bmi(cycle: str) -> pd.DataFrame:
+    table = f"BMX_{cycle}"
+    for path in (parquet_path(table, cleaned=True), csv_path(table, cleaned=True)):
+        if path.exists():
+            df = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+            df["SEQN"] = df["SEQN"].astype("int32")
+            return df.set_index("SEQN")[["BMXBMI"]].astype("float64")
+    print(f"⚠️ {table} not ingested — BMXBMI left empty (the imputer drops it)")
+    return pd.DataFrame(columns=["BMXBMI"], dtype="float64")
+
+
+def _hormone_frame(targets: list, cycle: str) -> pd.DataFrame:
+    hormones = _table("TST", cycle)[targets].dropna()
+    df = join_all(_table("PBCD", cycle).join(hormones, how="inner"),
+                  _table("DEMO", cycle), _table("RHQ", cycle), _bmi(cycle))
+    # months at exam are only recorded up to age 19
+    df["RIDAGEMN"] = df["RIDEXAGM"].fillna(df["RIDAGEYR"] * 12)
+    df["is_menopausal"] = (df["RHD043"] == 7).astype(float)  # no period: menopause
+    return df
+
+
+def target_columns(key: str) -> list:
+    """"y", or "y_<target>" per target of a multi-output key."""
+    target = SPECS[key]["target"]
+    return ["y"] if isinstance(target, str) else [f"y_{t}" for t in target]
+
+
+def training_frame(key: str, cycle: str = "I") -> pd.DataFrame:
+    """COLUMN_ORDERS[key] in NHANES codes (as mapped from API input) plus the target column(s), indexed by SEQN."""
+    target = SPECS[key]["target"]
+    if key.startswith("hormone"):
+        df = _hormone_frame([target] if isinstance(target, str) else target, cycle)
+        y = df[target]
+    elif key == "infertility":
+        infertility = join_all(_table("PBCD", cycle).join(indexed(f"RHQ_{cycle}"), how="inner"),
+                               indexed(f"DEMO_{cycle}"))
+        df = infertility_training_frame(infertility)
+        y = (df[target] == 1).astype(int)
+    else:
+        df = join_all(_table("PBCD", cycle).join(_table("RHQ", cycle), how="inner"), _table("DEMO", cycle))
+        df = df[df["RIAGENDR"] == 2]
+        if key == "menopause":
+            df = df[df[target] < 100]  # age at last period; 777 / 999 refused / don't know
+            df.loc[df["RHQ131"] == 2, "RHQ160"] = 0  # never pregnant
+            y = df[target]
+        else:
+            df = df[df[target].isin([1, 2])]
+            y = (df[target] == 1).astype(int)  # regular periods
+
+    out = df.reindex(columns=COLUMN_ORDERS[key])
+    if isinstance(target, str) and target in out.columns:
+        out[target] = np.nan  # estradiol lists its own target; never train on it
+    out[target_columns(key)] = y.to_numpy().reshape(len(out), -1)
+    return out
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    h = hashlib.sha256(",".join(df.columns).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+# ---------------- Fit / evaluate ----------------
+def regression_metrics(y, pred) -> dict:
+    return {
+        "mae": float(mean_absolute_error(y, pred)),
+        "rmse": float(np.sqrt(mean_squared_error(y, pred))),
+        "r2": float(r2_score(y, pred)),
+    }
+
+
+def _metrics(task: str, model, X, y) -> dict:
+    pred = model.predict(X)
+    if task == "regression":
+        return regression_metrics(y, pred)
+    proba = model.predict_proba(X)[:, 1]
+    return {
+        "accuracy": float(accuracy_score(y, pred)),
+        "precision": float(precision_score(y, pred, zero_division=0)),
+        "recall": float(recall_score(y, pred, zero_division=0)),
+        "f1": float(f1_score(y, pred, zero_division=0)),
+        "roc_auc": float(roc_auc_score(y, proba)),
+    }
+
+
+def train(key: str, cycle: str = "I", folds: int = 5, jobs: int = -1, quick: bool = False):
+    """Fit one model key; returns the refit pipeline and its manifest entry (without file hashes)."""
+    spec = SPECS[key]
+    task = spec["task"]
+    frame = training_frame(key, cycle)
+    X = to_model_frame(frame[COLUMN_ORDERS[key]], key)
+    y = frame[target_columns(key)].to_numpy()
+    if task != "multi_regression":
+        y = y.ravel()
+
+    stratify = y if task == "classification" else None
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=TEST_SIZE, random_state=SEED, stratify=stratify)
+
+    y_fit = y_train
+    if task == "multi_regression":
+        # standardised targets: otherwise the largest-valued hormone decides every shared split
+        target_mean, target_scale = y_train.mean(axis=0), y_train.std(axis=0)
+        y_fit = (y_train - target_mean) / target_scale
+
+    pipeline = spec["build"]()
+    if key == "infertility":
+        # few positives: weight them by the class ratio
+        pipeline.set_params(model__scale_pos_weight=float((y_train == 0).sum() / max((y_train == 1).sum(), 1)))
+
+    cv_cls = StratifiedKFold if task == "classification" else KFold
+    search = GridSearchCV(
+        pipeline,
+        QUICK_PARAMS[key] if quick else spec["grid"],
+        scoring="roc_auc" if task == "classification" else "neg_mean_absolute_error",
+        cv=cv_cls(n_splits=3 if quick else folds, shuffle=True, random_state=SEED),
+        n_jobs=jobs,
+        refit=True,
+    )
+    start = time.perf_counter()
+    search.fit(X_train, y_fit)
+    elapsed = time.perf_counter() - start
+
+    model = search.best_estimator_
+    if task == "multi_regression":
+        pred = model.predict(X_test) * target_scale + target_mean
+        metrics = {name: regression_metrics(y_test[:, i], pred[:, i]) for i, name in enumerate(spec["outputs"])}
+        # dict artifact read by app/models/fused_model.py
+        model = {
+            "model": model,
+            "outputs": spec["outputs"],
+            "input_key": key,
+            "target_mean": target_mean.tolist(),
+            "target_scale": target_scale.tolist(),
+            "background": X_train.sample(n=min(50, len(X_train)), random_state=SEED),
+        }
+    else:
+        metrics = _metrics(task, model, X_test, y_test)
+
+    best = search.best_index_
+    entry = {
+        "task": task,
+        "target": spec["target"],
+        **({"outputs": spec["outputs"]} if task == "multi_regression" else {}),
+        "features": COLUMN_ORDERS[key],
+        "model_features": list(X.columns),
+        "params": {k.removeprefix("model__"): v for k, v in search.best_params_.items()},
+        "cv": {
+            "scoring": search.scoring,
+            "folds": search.cv.get_n_splits(),
+            "mean": float(search.cv_results_["mean_test_score"][best]),
+            "std": float(search.cv_results_["std_test_score"][best]),
+            "candidates": len(search.cv_results_["params"]),
+        },
+        "metrics": metrics,
+        "rows": {"train": len(X_train), "test": len(X_test)},
+        "data": {"cycle": cycle, "sha256": frame_digest(frame)},
+        "seed": SEED,
+        "fit_seconds": round(elapsed, 2),
+    }
+    return model, entry
+
+
+# ---------------- Export ----------------
+def versions() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "scikit-learn": sklearn.__version__,
+        "xgboost": xgboost.__version__,
+        "joblib": joblib.__version__,
+    }
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def export(key: str, model, entry: dict, out_dir: Path) -> dict:
+    """Write <key>.joblib atomically and return the entry with its file name and hash."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    target = out_dir / f"{key}.joblib"
+    tmp = target.with_suffix(".tmp")
+    joblib.dump(model, tmp)
+    os.replace(tmp, target)
+    return {
+        "file": target.name,
+        "sha256": file_digest(target),
+        **entry,
+        "versions": versions(),
+        "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def write_manifest(entries: dict, path: Path):
+    """Merge entries into the manifest (keys trained earlier are kept)."""
+    manifest = json.loads(path.read_text()) if path.exists() else {"models": {}}
+    manifest["models"].update(entries)
+    manifest["updated_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, default=str))
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the ML service models from NHANES data")
+    parser.add_argument("--models", nargs="+", choices=list(SPECS), default=list(SPECS))
+    parser.add_argument("--cycle", default="I", help="NHANES cycle suffix of the tables (default: I, 2015-2016)")
+    parser.add_argument("--out", type=Path, default=MODELS_DIR, help="artifact directory (default: app/models/saved)")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1, help="loky workers for the grid search (-1: all cores)")
+    parser.add_argument("--quick", action="store_true", help="one grid point per model and 3 folds")
+    parser.add_argument("--promote-fused", action="store_true",
+                        help="serve a fused model trained in this run if fusion_report shows no accuracy loss")
+    parser.add_argument("--fused-tolerance", type=float, default=0.0,
+                        help="relative MAE increase per output still accepted by --promote-fused")
+    args = parser.parse_args(argv)
+
+    for key in args.models:
+        model, entry = train(key, args.cycle, args.folds, args.jobs, args.quick)
+        # fused models are staged next to, not in, the served artifacts
+        out = args.out / STAGING_DIR if key in FUSED else args.out
+        entry = export(key, model, entry, out)
+        # written per key so an interrupted run keeps the models finished so far
+        write_manifest({key: entry}, out / MANIFEST_NAME)
+        print(f"{key}: cv {entry['cv']['scoring']}={entry['cv']['mean']:.4f} "
+              f"test {entry['metrics']} ({entry['fit_seconds']}s) -> {out / entry['file']}")
+
+    if args.promote_fused:
+        from scripts import fusion_report  # imports this module
+        if "hormone" in args.models:
+            fusion_report.promote(args.out, args.cycle, args.fused_tolerance)
+
+
+if __name__ == "__main__":
+    main()